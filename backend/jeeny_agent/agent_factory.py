@@ -0,0 +1,66 @@
+import os
+from langchain.agents import initialize_agent, AgentType
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import MessagesPlaceholder
+from langchain_core.tools import StructuredTool
+from jeeny_agent.models import DirectionsArgs, ChangeCarTypeArgs, ModifyLocationArgs
+
+# وضع الـ Agent: "react" (نص Thought/Action) أو "tools" (استدعاء الأدوات بوسائط جاهزة)
+AGENT_MODE = os.getenv("JEENY_AGENT_MODE", "react").strip().lower()
+
+TOOLS_SYSTEM_PROMPT = (
+    "أنت مساعد نقل ذكي في الأردن مثل تطبيق Uber، والمستخدم يتحدث باللهجة الأردنية. "
+    "استخدم الأدوات لحساب الرحلات وتعديلها، ومرر أسماء الأماكن كما قالها المستخدم دون ترجمة. "
+    "عند وجود رحلة حالية وطلب المستخدم تغيير السيارة أو المكان استخدم أداة التعديل المناسبة بدل رحلة جديدة. "
+    "أعد رد الأداة للمستخدم كما هو."
+)
+
+def build_structured_tools(directions_tool, change_car_type_tool, modify_location_tool) -> list:
+    """نسخ من الأدوات بمخطط وسائط: النموذج يمرر البداية والوجهة ونوع السيارة مباشرة
+    فلا تحتاج الأداة لتحليل النص باستدعاء نموذج إضافي"""
+    return [
+        StructuredTool.from_function(
+            func=directions_tool.plan_trip,
+            name=directions_tool.name,
+            description="حساب رحلة جديدة في الأردن: المسافة والوقت والتكلفة وموقع السائق والخريطة.",
+            args_schema=DirectionsArgs
+        ),
+        StructuredTool.from_function(
+            func=change_car_type_tool.change_car_type,
+            name=change_car_type_tool.name,
+            description="تغيير نوع السيارة للرحلة الحالية وإعادة حساب التكلفة.",
+            args_schema=ChangeCarTypeArgs
+        ),
+        StructuredTool.from_function(
+            func=modify_location_tool.apply_modification,
+            name=modify_location_tool.name,
+            description="تعديل البداية أو الوجهة أو كليهما للرحلة الحالية مع الاحتفاظ بنوع السيارة.",
+            args_schema=ModifyLocationArgs
+        ),
+    ]
+
+def create_agent(llm, tools: list, memory, mode: str = AGENT_MODE, verbose: bool = True):
+    """إنشاء الـ Agent حسب الوضع - الأدوات تُمرر بالترتيب: الاتجاهات، نوع السيارة، التعديل"""
+    if mode == "tools":
+        print("[DEBUG] وضع الـ Agent: استدعاء الأدوات بوسائط جاهزة")
+        return initialize_agent(
+            tools=build_structured_tools(*tools),
+            llm=llm,
+            agent=AgentType.OPENAI_FUNCTIONS,
+            memory=memory,
+            verbose=verbose,
+            agent_kwargs={
+                "system_message": SystemMessage(content=TOOLS_SYSTEM_PROMPT),
+                "extra_prompt_messages": [MessagesPlaceholder(variable_name=memory.memory_key)]
+            }
+        )
+
+    if mode != "react":
+        print(f"[WARNING] وضع غير معروف '{mode}'، استخدام react")
+    return initialize_agent(
+        tools=tools,
+        llm=llm,
+        agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
+        memory=memory,
+        verbose=verbose
+    )
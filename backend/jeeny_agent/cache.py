@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Optional
+
+# مسار قاعدة بيانات الكاش - يمكن تغييره من متغير البيئة
+DEFAULT_CACHE_PATH = os.getenv(
+    "JEENY_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cache', 'jeeny_cache.sqlite3')
+)
+
+class PersistentCache:
+    """كاش دائم على القرص (SQLite) مع TTL وإزالة الأقدم استخداماً (LRU) وعدادات hit/miss"""
+
+    def __init__(self, namespace: str, max_entries: int = 5000, ttl_seconds: int = 7 * 24 * 3600,
+                 db_path: str = DEFAULT_CACHE_PATH):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = os.path.abspath(db_path)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # فتح الاتصال عند أول استخدام فقط
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache(namespace, last_access)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_meta (
+                    namespace TEXT PRIMARY KEY,
+                    version TEXT NOT NULL
+                )
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str, ttl_seconds: Optional[int] = None) -> Optional[Any]:
+        """إرجاع القيمة المخزنة أو None إذا لم توجد أو انتهت صلاحيتها"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT value, created_at FROM cache WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                ).fetchone()
+                if row is None or (ttl and now - row[1] > ttl):
+                    if row is not None:
+                        conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+                        conn.commit()
+                    self.misses += 1
+                    return None
+                conn.execute(
+                    "UPDATE cache SET last_access = ? WHERE namespace = ? AND key = ?",
+                    (now, self.namespace, key)
+                )
+                conn.commit()
+                self.hits += 1
+                return json.loads(row[0])
+        except Exception as e:
+            print(f"[تحذير] تعذر القراءة من الكاش ({self.namespace}): {e}")
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        """تخزين قيمة (قابلة للتحويل إلى JSON) مع إزالة الأقدم استخداماً عند تجاوز الحد"""
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, json.dumps(value, ensure_ascii=False), now, now)
+                )
+                count = conn.execute(
+                    "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+                ).fetchone()[0]
+                if count > self.max_entries:
+                    conn.execute("""
+                        DELETE FROM cache WHERE namespace = ? AND key IN (
+                            SELECT key FROM cache WHERE namespace = ? ORDER BY last_access ASC LIMIT ?
+                        )
+                    """, (self.namespace, self.namespace, count - self.max_entries))
+                conn.commit()
+        except Exception as e:
+            print(f"[تحذير] تعذر الكتابة في الكاش ({self.namespace}): {e}")
+
+    def ensure_version(self, version: str) -> None:
+        """مسح الكاش إذا تغيرت نسخة البيانات التي يعتمد عليها (مثل ملف الأماكن المحفوظة)"""
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT version FROM cache_meta WHERE namespace = ?", (self.namespace,)
+                ).fetchone()
+                if row is not None and row[0] == version:
+                    return
+                if row is not None:
+                    print(f"[DEBUG] تغيرت البيانات، مسح كاش {self.namespace}")
+                conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_meta (namespace, version) VALUES (?, ?)",
+                    (self.namespace, version)
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"[تحذير] تعذر التحقق من نسخة الكاش ({self.namespace}): {e}")
+
+    def clear(self) -> None:
+        """مسح جميع القيم في هذا الـ namespace"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
@@ -0,0 +1,63 @@
+import re
+from typing import Optional
+from jeeny_agent.normalization import normalize_arabic
+
+# أنواع السيارات المتاحة
+CAR_TYPES = ["عادية", "تاكسي", "عائلية", "VIP"]
+DEFAULT_CAR_TYPE = "عادية"
+
+# أنماط أنواع السيارات - تُوحَّد وتُترجم مرة واحدة عند تحميل الوحدة
+_RAW_CAR_TYPE_PATTERNS = [
+    # أنماط للسيارة VIP
+    ("VIP", [
+        r'vip',
+        r'في آي بي',
+        r'فاخرة',
+        r'فخم',
+        r'درجة أولى',
+        r'ممتازة',
+        r'كلاس عالي'
+    ]),
+    # أنماط للسيارة العائلية
+    ("عائلية", [
+        r'عائلية',
+        r'عائلي',
+        r'كبيرة',
+        r'7 ركاب',
+        r'سبع ركاب',
+        r'سبعة ركاب',
+        r'فان',
+        r'باص صغير'
+    ]),
+    # أنماط للتاكسي
+    ("تاكسي", [
+        r'تاكسي',
+        r'تكسي',
+        r'أجرة'
+    ]),
+]
+
+_CAR_TYPE_PATTERNS = [
+    (car_type, [re.compile(normalize_arabic(pattern)) for pattern in patterns])
+    for car_type, patterns in _RAW_CAR_TYPE_PATTERNS
+]
+
+# طلب صريح للسيارة العادية (مثل "رجعها عادية")
+_EXPLICIT_DEFAULT_RE = re.compile(
+    r'(?<!\S)(?:' + "|".join(normalize_arabic(word) for word in ["عادية", "عادي", "طبيعية"]) + r')(?!\S)'
+)
+
+def detect_car_type(text: str, include_default: bool = False) -> Optional[str]:
+    """تحديد نوع السيارة من النص بالأنماط فقط - None إذا لم يُذكر نوع"""
+    # توحيد النص (الهمزات، التاء المربوطة، التشكيل) قبل المطابقة
+    text_normalized = normalize_arabic(text)
+    
+    # فحص الأنماط بالترتيب: VIP ثم العائلية ثم التاكسي
+    for car_type, patterns in _CAR_TYPE_PATTERNS:
+        for pattern in patterns:
+            if pattern.search(text_normalized):
+                return car_type
+    
+    if include_default and _EXPLICIT_DEFAULT_RE.search(text_normalized):
+        return DEFAULT_CAR_TYPE
+    return None
@@ -4,8 +4,19 @@ import requests
 from geopy.point import Point
 from geopy.distance import distance as geopy_distance
 from jeeny_agent.models import Location
+from jeeny_agent.singleflight import SingleFlight
+from jeeny_agent.routing import ROUTING_BACKEND
+
+# طلبات Roads المتزامنة لنفس النقطة تشترك في استدعاء واحد
+roads_flight = SingleFlight("snap_to_road")
 
 def snap_to_road(lat, lng, api_key):
+    if ROUTING_BACKEND == "local":
+        # بدون إنترنت: الموقع العشوائي القريب يكفي للعرض
+        return lat, lng
+    return roads_flight.do((round(lat, 6), round(lng, 6)), _snap_to_road, lat, lng, api_key)
+
+def _snap_to_road(lat, lng, api_key):
     try:
         url = f"https://roads.googleapis.com/v1/snapToRoads?path={lat},{lng}&key={api_key}"
         response = requests.get(url)
@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import time
+import random
+from typing import Any, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from rapidfuzz import fuzz, process
+from jeeny_agent.car_types import detect_car_type, DEFAULT_CAR_TYPE
+from jeeny_agent.rule_extractor import extract_locations_rules, detect_modification_rules
+from jeeny_agent.router import route_intent
+
+# نموذج محلي بديل عن OpenAI للقياس والتجربة بدون شبكة
+# يُفعَّل بـ JEENY_LLM_BACKEND=fake ويجيب على prompts المشروع المعروفة بالقواعد
+
+FAKE_LATENCY_MS = float(os.getenv("JEENY_FAKE_LLM_LATENCY_MS", "0"))
+FAKE_JITTER_MS = float(os.getenv("JEENY_FAKE_LLM_JITTER_MS", "0"))
+# ملف JSON اختياري بإجابات ثابتة: [{"contains": "...", "response": "..."}] - يُفحص قبل القواعد
+FAKE_FIXTURES_PATH = os.getenv("JEENY_FAKE_LLM_FIXTURES")
+
+_QUOTED_RE = re.compile(r'"([^"\n]*)"')
+_LIST_ITEM_RE = re.compile(r'^\s*-\s*(.+?)\s*$', re.MULTILINE)
+
+def _first_quoted(prompt: str) -> str:
+    match = _QUOTED_RE.search(prompt)
+    return match.group(1).strip() if match else ""
+
+def _answer_parse_turn(prompt: str) -> str:
+    user_text = _first_quoted(prompt)
+    rules = extract_locations_rules(user_text)
+    return json.dumps({
+        "car_type": detect_car_type(user_text) or DEFAULT_CAR_TYPE,
+        "start_location": rules["start_location"] or None,
+        "end_location": rules["end_location"] or None,
+        "modification_type": None,
+        "start_saved_name": None,
+        "end_saved_name": None
+    }, ensure_ascii=False)
+
+def _answer_extract_locations(prompt: str) -> str:
+    rules = extract_locations_rules(_first_quoted(prompt))
+    return json.dumps({
+        "start_location": rules["start_location"],
+        "end_location": rules["end_location"],
+        "country": "الأردن"
+    }, ensure_ascii=False)
+
+def _answer_match_location(prompt: str) -> str:
+    place = _first_quoted(prompt)
+    names = _LIST_ITEM_RE.findall(prompt.split("قاعدة البيانات", 1)[-1].split("اختر", 1)[0])
+    best = process.extractOne(place, names, scorer=fuzz.token_set_ratio) if names else None
+    return best[0] if best and best[1] >= 60 else "NO_MATCH"
+
+def _answer_car_type(prompt: str) -> str:
+    return detect_car_type(_first_quoted(prompt), include_default=True) or DEFAULT_CAR_TYPE
+
+def _answer_modification(prompt: str) -> str:
+    rules = detect_modification_rules(_first_quoted(prompt))
+    return json.dumps({
+        "modification_type": rules["modification_type"] or "النهاية",
+        "new_start_location": rules["new_start_location"],
+        "new_end_location": rules["new_end_location"]
+    }, ensure_ascii=False)
+
+def _answer_react(prompt: str) -> str:
+    """حلقة ReAct: استدعاء الأداة التي يختارها الـ router، ثم إعادة نتيجتها كرد نهائي"""
+    user_input, _, scratchpad = prompt.rpartition("New input:")[2].partition("\n")
+    if "Observation:" in scratchpad:
+        observation = scratchpad.rsplit("Observation:", 1)[1].rsplit("Thought:", 1)[0].strip()
+        return f"Thought: Do I need to use a tool? No\nAI: {observation}"
+    tool = route_intent(user_input.strip(), has_trip="الرحلة الحالية" in prompt)
+    if tool is None:
+        return "Thought: Do I need to use a tool? No\nAI: أهلاً! من وين لوين بدك تروح؟"
+    return f"Thought: Do I need to use a tool? Yes\nAction: {tool}\nAction Input: {user_input.strip()}"
+
+# جدول القواعد: نص مميز في الـ prompt -> دالة الإجابة (الترتيب مهم)
+FIXTURE_RULES = [
+    ("Action Input", _answer_react),
+    ("start_saved_name", _answer_parse_turn),
+    ("المستخدم يريد تعديل رحلته الحالية", _answer_modification),
+    ("هذه قائمة بأسماء أماكن محفوظة", _answer_match_location),
+    ("حدد نوع السيارة من هذه الخيارات فقط", _answer_car_type),
+    ("مهمتك استخراج", _answer_extract_locations),
+]
+
+def _load_fixture_file(path: Optional[str]) -> list:
+    if not path:
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        fixtures = json.load(f)
+    print(f"[DEBUG] تحميل {len(fixtures)} إجابة ثابتة للنموذج المحلي من: {path}")
+    return [(item["contains"], item["response"]) for item in fixtures]
+
+class FixtureChatModel(BaseChatModel):
+    """نموذج محادثة محلي يجيب من جدول قواعد مع تأخير صناعي قابل للضبط"""
+
+    purpose: str = "nlu"
+    streaming: bool = False
+    latency_ms: float = FAKE_LATENCY_MS
+    jitter_ms: float = FAKE_JITTER_MS
+    fixtures: list = []
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "jeeny-fixture"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        self.calls += 1
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        for marker, response in self.fixtures:
+            if marker in prompt:
+                return response
+        for marker, answer in FIXTURE_RULES:
+            if marker in prompt:
+                return answer(prompt)
+        print(f"[تحذير] النموذج المحلي لا يعرف هذا الـ prompt ({self.purpose})")
+        return "NO_MATCH"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # الإرسال كلمة كلمة حتى تعمل واجهة الـ Streaming كما مع OpenAI
+        for token in re.split(r'(\s+)', self._respond(messages)):
+            if not token:
+                continue
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+def create_fixture_model(purpose: str, streaming: bool = False) -> FixtureChatModel:
+    return FixtureChatModel(purpose=purpose, streaming=streaming, fixtures=_load_fixture_file(FAKE_FIXTURES_PATH))
@@ -0,0 +1,77 @@
+import os
+import json
+import threading
+from typing import Dict, Sequence
+import numpy as np
+from jeeny_agent.car_types import DEFAULT_CAR_TYPE
+
+# جدول التعرفة: لكل نوع سيارة أجرة أساسية وسعر للكيلومتر وللدقيقة ومضاعف - يمكن استبداله بـ JEENY_TARIFFS
+TARIFFS_PATH = os.getenv(
+    "JEENY_TARIFFS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'tariffs.json')
+)
+
+class FareEngine:
+    """تسعير كل أنواع السيارات لرحلة أو لعدة رحلات دفعة واحدة بعمليات المصفوفات"""
+
+    def __init__(self, car_types: Dict[str, dict], currency: str = "د.أ"):
+        self.car_types = list(car_types)
+        self.index = {car_type: column for column, car_type in enumerate(self.car_types)}
+        self.currency = currency
+        self.notes = {car_type: tariff.get("note", "") for car_type, tariff in car_types.items()}
+        # أعمدة التعرفة بترتيب self.car_types
+        self.base = np.array([car_types[t]["base"] for t in self.car_types], dtype=float)
+        self.per_km = np.array([car_types[t]["per_km"] for t in self.car_types], dtype=float)
+        self.per_min = np.array([car_types[t]["per_min"] for t in self.car_types], dtype=float)
+        self.multiplier = np.array([car_types[t].get("multiplier", 1.0) for t in self.car_types], dtype=float)
+
+    @classmethod
+    def load(cls, file_path: str = TARIFFS_PATH) -> "FareEngine":
+        with open(file_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        print(f"[DEBUG] تحميل تعرفة {len(config['car_types'])} نوع سيارة من: {file_path}")
+        return cls(config["car_types"], config.get("currency", "د.أ"))
+
+    def quote_many(self, distance_km: Sequence[float], duration_min: Sequence[float]) -> np.ndarray:
+        """مصفوفة الأسعار (عدد الرحلات × عدد أنواع السيارات)"""
+        distance = np.asarray(distance_km, dtype=float).reshape(-1, 1)
+        duration = np.asarray(duration_min, dtype=float).reshape(-1, 1)
+        fares = (self.base + distance * self.per_km + duration * self.per_min) * self.multiplier
+        return np.round(fares, 2)
+
+    def quote(self, distance_km: float, duration_min: float) -> Dict[str, float]:
+        """سعر الرحلة لكل أنواع السيارات: {"عادية": ..., "VIP": ...}"""
+        row = self.quote_many([distance_km], [duration_min])[0]
+        return {car_type: float(row[column]) for car_type, column in self.index.items()}
+
+    def fare(self, distance_km: float, duration_min: float, car_type: str = DEFAULT_CAR_TYPE) -> float:
+        if car_type not in self.index:
+            print(f"[WARNING] Unknown car type '{car_type}', using '{DEFAULT_CAR_TYPE}' tariff")
+            car_type = DEFAULT_CAR_TYPE
+        return self.quote(distance_km, duration_min)[car_type]
+
+    def note(self, car_type: str) -> str:
+        """ملاحظة السعر المعروضة مع نوع السيارة (فارغة للعادية)"""
+        return self.notes.get(car_type, "")
+
+_engine = None
+_lock = threading.Lock()
+
+def get_fare_engine() -> FareEngine:
+    """محرك التسعير المشترك بين الرد والخريطة والتسعير الجماعي"""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = FareEngine.load()
+    return _engine
+
+def quote_route(route: dict) -> Dict[str, float]:
+    """أسعار كل أنواع السيارات لمسار {"distance_m", "duration_s", ...}"""
+    return get_fare_engine().quote(route["distance_m"] / 1000, route["duration_s"] / 60)
+
+def quote_routes(routes: Sequence[dict]) -> np.ndarray:
+    """تسعير جماعي لعدة مسارات - صف لكل مسار وعمود لكل نوع سيارة"""
+    distance_km = [route["distance_m"] / 1000 for route in routes]
+    duration_min = [route["duration_s"] / 60 for route in routes]
+    return get_fare_engine().quote_many(distance_km, duration_min)
@@ -0,0 +1,91 @@
+import os
+import math
+import threading
+from typing import NamedTuple, Optional
+from jeeny_agent.normalization import normalize_arabic
+
+# ملف الأماكن المعروفة في الأردن (محافظات، جامعات، مستشفيات، مولات، أحياء)
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jordan_gazetteer.tsv')
+
+# حجم خلية الفهرس المكاني بالدرجات (≈ 5.5 كم)
+GRID_CELL_DEGREES = 0.05
+EARTH_RADIUS_KM = 6371.0
+
+class Place(NamedTuple):
+    name: str
+    kind: str
+    lat: float
+    lng: float
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """المسافة بالكيلومتر بين نقطتين على سطح الأرض"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def _cell(lat: float, lng: float) -> tuple:
+    return (math.floor(lat / GRID_CELL_DEGREES), math.floor(lng / GRID_CELL_DEGREES))
+
+class Gazetteer:
+    """أماكن معروفة بدون إنترنت مع فهرس بالاسم الموحد O(1) وشبكة مكانية للبحث العكسي"""
+
+    def __init__(self, places: list, aliases: Optional[dict] = None):
+        self.places = places
+        self.by_name = {}
+        self.grid = {}
+        for place in places:
+            self.by_name.setdefault(normalize_arabic(place.name), place)
+            self.grid.setdefault(_cell(place.lat, place.lng), []).append(place)
+        for alias, place in (aliases or {}).items():
+            self.by_name.setdefault(normalize_arabic(alias), place)
+
+    @classmethod
+    def load(cls, file_path: str = GAZETTEER_PATH) -> "Gazetteer":
+        places, aliases = [], {}
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip() or line.startswith('#'):
+                        continue
+                    name, kind, lat, lng, alias_field = line.rstrip('\n').split('\t')
+                    place = Place(name, kind, float(lat), float(lng))
+                    places.append(place)
+                    for alias in filter(None, alias_field.split('|')):
+                        aliases[alias] = place
+        except Exception as e:
+            print(f"[خطأ] تعذر تحميل ملف الأماكن المعروفة: {e}")
+        print(f"[DEBUG] تحميل {len(places)} مكان معروف من الـ gazetteer")
+        return cls(places, aliases)
+
+    def lookup(self, name: str) -> Optional[Place]:
+        """بحث بالاسم أو أحد أسمائه البديلة بعد التوحيد (إربد = اربد = Irbid)"""
+        return self.by_name.get(normalize_arabic(name))
+
+    def nearest(self, lat: float, lng: float, max_km: float = 1.0) -> Optional[Place]:
+        """أقرب مكان معروف ضمن max_km - يفحص خلايا الشبكة المحيطة فقط"""
+        # عدد الخلايا المطلوب فحصها في كل اتجاه (درجة الطول أقصر من درجة العرض)
+        lat_rings = math.ceil(max_km / (GRID_CELL_DEGREES * 111.0))
+        lng_rings = math.ceil(max_km / (GRID_CELL_DEGREES * 111.0 * max(math.cos(math.radians(lat)), 0.1)))
+        row, col = _cell(lat, lng)
+        best, best_km = None, max_km
+        for d_row in range(-lat_rings, lat_rings + 1):
+            for d_col in range(-lng_rings, lng_rings + 1):
+                for place in self.grid.get((row + d_row, col + d_col), ()):
+                    distance = haversine_km(lat, lng, place.lat, place.lng)
+                    if distance <= best_km:
+                        best, best_km = place, distance
+        return best
+
+_gazetteer = None
+_lock = threading.Lock()
+
+def get_gazetteer() -> Gazetteer:
+    """الـ gazetteer المشترك - يُحمَّل من الملف عند أول استخدام"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer.load()
+    return _gazetteer
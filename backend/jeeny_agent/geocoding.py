@@ -2,13 +2,50 @@ import os
 import json
 from functools import lru_cache
 import googlemaps
-from rapidfuzz import process
 from jeeny_agent.models import Location
+from jeeny_agent.cache import PersistentCache
+from jeeny_agent.normalization import normalize_arabic
+from jeeny_agent.gazetteer import get_gazetteer
+from jeeny_agent.singleflight import SingleFlight
+from jeeny_agent.service_area import is_in_jordan
+from jeeny_agent import geohash
+from typing import Optional
 import re
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 API_KEY = os.getenv("GOOGLE_API_KEY")
 gmaps = googlemaps.Client(key=API_KEY)
 
+# كاش دائم لنتائج الـ geocoding: الأماكن لا تتحرك فالصلاحية طويلة،
+# أما النتائج السلبية (غير موجود / خارج الأردن) فصلاحيتها قصيرة حتى لا نثبت خطأً مؤقتاً
+GEOCODE_TTL_SECONDS = 30 * 24 * 3600
+GEOCODE_NEGATIVE_TTL_SECONDS = 24 * 3600
+geocode_cache = PersistentCache("geocode", max_entries=20000, ttl_seconds=GEOCODE_TTL_SECONDS)
+geocode_miss_cache = PersistentCache("geocode_miss", max_entries=5000, ttl_seconds=GEOCODE_NEGATIVE_TTL_SECONDS)
+# طلبات متزامنة لنفس العنوان تشترك في استدعاء Google واحد
+geocode_flight = SingleFlight("geocode")
+
+# صيغ البحث في Google: العربية والإنجليزية
+GEOCODE_VARIANTS = {
+    "ar": "{}, الأردن",
+    "en": "{}, Jordan",
+}
+# للعناوين الجديدة: إرسال الصيغة الثانية إذا تأخرت الأولى أكثر من المعتاد (JEENY_GEOCODE_HEDGE=0 للإيقاف)
+GEOCODE_HEDGE = os.getenv("JEENY_GEOCODE_HEDGE", "1") != "0"
+# مهلة الانتظار قبل الطلب الثاني ≈ p95 لزمن استجابة Geocoding - الطلب المدفوع الثاني نادر
+GEOCODE_HEDGE_DELAY_S = float(os.getenv("JEENY_GEOCODE_HEDGE_DELAY_MS", "400")) / 1000
+# الصيغة التي نجحت لكل عنوان - تبقى بعد انتهاء صلاحية الإحداثيات نفسها
+geocode_variant_cache = PersistentCache("geocode_variant", max_entries=20000, ttl_seconds=180 * 24 * 3600)
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="geocode")
+
+# الـ reverse geocoding: الإحداثيات تُجمع في خلايا geohash (≈150م) فكل النقاط في الخلية تأخذ نفس الاسم
+REVERSE_GEOHASH_PRECISION = 7
+REVERSE_GAZETTEER_RADIUS_KM = 0.3
+reverse_geocode_cache = PersistentCache("reverse_geocode", max_entries=20000, ttl_seconds=GEOCODE_TTL_SECONDS)
+reverse_geocode_flight = SingleFlight("reverse_geocode")
+_PLUS_CODE_RE = re.compile(r'^[23456789CFGHJMPQRVWX]{4,8}\+[23456789CFGHJMPQRVWX]*')
+_COUNTRY_NAMES = {"الأردن", "الاردن", "Jordan"}
+
 def resolve_address_to_coordinates(address: str) -> tuple:
     try:
         print(f"[DEBUG] محاولة تحويل العنوان: {address}")
@@ -23,55 +60,156 @@ def resolve_address_to_coordinates(address: str) -> tuple:
             print(f"[DEBUG] العنوان يحتوي على إحداثيات مباشرة")
             return parse_coordinates(address)
         
-        # إضافة "الأردن" للبحث مباشرة
-        search_query = f"{address}, الأردن"
-        print(f"[DEBUG] البحث باستخدام: {search_query}")
-        
-        geocode_result = gmaps.geocode(search_query)
-        
-        # إذا لم نجد نتائج، جرب مع Jordan بالإنجليزية
-        if not geocode_result:
-            search_query = f"{address}, Jordan"
-            print(f"[DEBUG] محاولة ثانية مع: {search_query}")
-            geocode_result = gmaps.geocode(search_query)
-        
-        if not geocode_result:
-            print(f"[تحذير] لم يتم العثور على إحداثيات للعنوان: {address}")
-            return None, None
-        
-        # أخذ أول نتيجة والتحقق من الإحداثيات
-        location = geocode_result[0]['geometry']['location']
-        lat = location.get('lat', None)
-        lng = location.get('lng', None)
+        # الأماكن المعروفة (مدن، جامعات، مستشفيات...) بدون أي اتصال
+        place = get_gazetteer().lookup(address)
+        if place is not None:
+            print(f"[DEBUG] إحداثيات من الأماكن المعروفة: {address} -> {place.name} ({place.lat}, {place.lng})")
+            return place.lat, place.lng
         
-        if lat is None or lng is None:
-            print(f"[تحذير] الإحداثيات غير صالحة للعنوان: {address}")
+        # ثم الكاش - المفتاح هو العنوان بعد التوحيد (إربد = اربد)
+        key = normalize_arabic(address)
+        cached = geocode_cache.get(key)
+        if cached is not None:
+            print(f"[DEBUG] إحداثيات من الكاش: {address} -> {cached['lat']}, {cached['lng']} ({cached['query']})")
+            return cached["lat"], cached["lng"]
+        missed = geocode_miss_cache.get(key)
+        if missed is not None:
+            print(f"[DEBUG] العنوان معروف مسبقاً بدون نتيجة ({missed['reason']}): {address}")
             return None, None
         
-        # التحقق من أن الإحداثيات ضمن حدود الأردن
-        if not is_coordinates_in_jordan(lat, lng):
-            print(f"[تحذير] الإحداثيات خارج حدود الأردن: {lat}, {lng}")
-            return None, None
-        
-        print(f"[نجح] تم العثور على إحداثيات: {lat}, {lng}")
-        return lat, lng
+        return geocode_flight.do(key, _geocode_and_store, key, address)
         
     except Exception as e:
+        # أخطاء الشبكة والـ API لا تُخزن في الكاش
         print(f"[خطأ] تعذر تحويل العنوان إلى إحداثيات: {e}")
         return None, None
 
-def is_coordinates_in_jordan(lat: float, lng: float) -> bool:
-    """التحقق من أن الإحداثيات ضمن حدود الأردن"""
-    # حدود الأردن التقريبية
-    # خط العرض: من 29.11 إلى 33.37
-    # خط الطول: من 34.88 إلى 39.30
+def _geocode_and_store(key: str, address: str) -> tuple:
+    """استدعاء Google مرة واحدة للعنوان وتخزين النتيجة (أو سبب الفشل) في الكاش"""
+    lat, lng, search_query, reason = _geocode_with_google(address, key)
+    if reason is not None:
+        geocode_miss_cache.set(key, {"reason": reason})
+        return None, None
+    geocode_cache.set(key, {"lat": lat, "lng": lng, "query": search_query})
+    return lat, lng
+
+def _geocode_variant(address: str, variant: str) -> tuple:
+    """طلب Google بصيغة واحدة: (lat, lng, الصيغة، سبب الفشل أو None)"""
+    search_query = GEOCODE_VARIANTS[variant].format(address)
+    print(f"[DEBUG] البحث باستخدام: {search_query}")
+    geocode_result = gmaps.geocode(search_query)
     
-    if 29.0 <= lat <= 33.5 and 34.8 <= lng <= 39.5:
-        print(f"[DEBUG] الإحداثيات ضمن حدود الأردن: {lat}, {lng}")
-        return True
-    else:
-        print(f"[DEBUG] الإحداثيات خارج حدود الأردن: {lat}, {lng}")
-        return False
+    if not geocode_result:
+        return None, None, search_query, "not_found"
+    
+    # أخذ أول نتيجة والتحقق من الإحداثيات
+    location = geocode_result[0]['geometry']['location']
+    lat = location.get('lat', None)
+    lng = location.get('lng', None)
+    
+    if lat is None or lng is None:
+        return None, None, search_query, "invalid"
+    
+    # التحقق من أن الإحداثيات ضمن حدود الأردن
+    if not is_coordinates_in_jordan(lat, lng):
+        print(f"[تحذير] الإحداثيات خارج حدود الأردن ({search_query}): {lat}, {lng}")
+        return None, None, search_query, "outside_jordan"
+    
+    return lat, lng, search_query, None
+
+def _failure_reason(results: list) -> str:
+    reasons = [result[3] for result in results]
+    for reason in ("outside_jordan", "invalid"):
+        if reason in reasons:
+            return reason
+    return "not_found"
+
+def _geocode_with_google(address: str, key: str) -> tuple:
+    """البحث في Google: (lat, lng, الصيغة التي نجحت، سبب الفشل أو None)
+
+    - الصيغة الناجحة سابقاً لهذا العنوان أولاً، والتالية فقط إذا فشلت
+    - للعناوين الجديدة تُرسل الصيغة التالية أيضاً إذا لم ترد الأولى خلال GEOCODE_HEDGE_DELAY_S،
+      ونأخذ أول نتيجة صالحة داخل الأردن
+    """
+    preferred = geocode_variant_cache.get(key)
+    order = [preferred] if preferred in GEOCODE_VARIANTS else []
+    order += [variant for variant in GEOCODE_VARIANTS if variant not in order]
+    hedge_delay = GEOCODE_HEDGE_DELAY_S if GEOCODE_HEDGE and preferred not in GEOCODE_VARIANTS else None
+    
+    pending = {_hedge_executor.submit(_geocode_variant, address, order[0]): order[0]}
+    remaining = order[1:]
+    results, errors = [], []
+    while pending:
+        done, _ = wait(pending, timeout=hedge_delay if remaining else None, return_when=FIRST_COMPLETED)
+        if not done:
+            # الأولى أبطأ من المعتاد - الصيغة التالية بالتوازي معها
+            variant = remaining.pop(0)
+            print(f"[DEBUG] تأخر الـ geocoding أكثر من {hedge_delay * 1000:.0f}ms - إرسال الصيغة: {variant}")
+            pending[_hedge_executor.submit(_geocode_variant, address, variant)] = variant
+            continue
+        for future in done:
+            variant = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            if result[3] is None:
+                # الصيغة الأخرى قد تكون ما زالت تعمل - نتجاهل نتيجتها
+                return _found(key, variant, result)
+            results.append(result)
+        if not pending and remaining:
+            # لا نتيجة صالحة (غير موجود أو خارج الأردن) - الآن فقط نجرب الصيغة التالية
+            variant = remaining.pop(0)
+            pending[_hedge_executor.submit(_geocode_variant, address, variant)] = variant
+    if errors:
+        # فشل في الاتصال وليس "غير موجود" - لا نريد تخزين نتيجة سلبية
+        raise errors[0]
+    print(f"[تحذير] لم يتم العثور على إحداثيات للعنوان: {address}")
+    return None, None, None, _failure_reason(results)
+
+def _found(key: str, variant: str, result: tuple) -> tuple:
+    geocode_variant_cache.set(key, variant)
+    print(f"[نجح] تم العثور على إحداثيات ({variant}): {result[0]}, {result[1]}")
+    return result
+
+def reverse_geocode(lat: float, lng: float) -> Optional[str]:
+    """اسم مختصر للإحداثيات: الأماكن المعروفة، ثم الكاش حسب خلية geohash، ثم Google كحل أخير"""
+    place = get_gazetteer().nearest(lat, lng, max_km=REVERSE_GAZETTEER_RADIUS_KM)
+    if place is not None:
+        return place.name
+    
+    cell = geohash.encode(lat, lng, REVERSE_GEOHASH_PRECISION)
+    # الخلية نفسها ثم جيرانها - نقطة على حافة الخلية قريبة من نقاط الخلية المجاورة
+    for key in [cell] + geohash.neighbors(cell):
+        cached = reverse_geocode_cache.get(key)
+        if cached is not None and (key == cell or cached["name"]):
+            print(f"[DEBUG] اسم الإحداثيات من الكاش ({key}): {cached['name']}")
+            return cached["name"]
+    
+    try:
+        return reverse_geocode_flight.do(cell, _reverse_geocode_and_store, cell, lat, lng)
+    except Exception as e:
+        print(f"[خطأ] تعذر تحويل الإحداثيات إلى اسم: {e}")
+        return None
+
+def _reverse_geocode_and_store(cell: str, lat: float, lng: float) -> Optional[str]:
+    results = gmaps.reverse_geocode((lat, lng), language="ar")
+    name = _short_address(results[0].get("formatted_address", "")) if results else None
+    # نخزن النتيجة السلبية أيضاً (name = None) حتى لا نعيد الطلب لنفس الخلية
+    reverse_geocode_cache.set(cell, {"name": name})
+    print(f"[DEBUG] اسم الإحداثيات من Google ({cell}): {name}")
+    return name
+
+def _short_address(formatted_address: str) -> Optional[str]:
+    """أول جزأين من العنوان بدون اسم الدولة ورمز Plus Code"""
+    parts = [part.strip() for part in re.split(r'[،,]', formatted_address)]
+    parts = [part for part in parts if part and part not in _COUNTRY_NAMES and not _PLUS_CODE_RE.match(part)]
+    return "، ".join(parts[:2]) or None
+
+def is_coordinates_in_jordan(lat: float, lng: float) -> bool:
+    """التحقق من أن الإحداثيات ضمن حدود الأردن (مضلع الحدود مع raster - انظر service_area.py)"""
+    return is_in_jordan(lat, lng)
 
 def is_coordinate_format(address: str) -> bool:
     """التحقق إذا كان النص يحتوي على إحداثيات بصيغة lat,lng"""
@@ -0,0 +1,58 @@
+from typing import List, Tuple
+
+# ترميز geohash: النقاط القريبة تشترك في نفس البادئة فتُستخدم كمفتاح لتجميع الإحداثيات
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE_MAP = {char: index for index, char in enumerate(_BASE32)}
+
+# الدقة 7 ≈ خلية 153م × 153م، والدقة 6 ≈ 1.2كم × 0.6كم
+DEFAULT_PRECISION = 7
+
+def encode(lat: float, lng: float, precision: int = DEFAULT_PRECISION) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, value_range = (lng, lng_range) if even else (lat, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+def decode_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """حدود الخلية: (min_lat, max_lat, min_lng, max_lng)"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        index = _DECODE_MAP[char]
+        for shift in range(4, -1, -1):
+            value_range = lng_range if even else lat_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if (index >> shift) & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+def decode(geohash: str) -> Tuple[float, float]:
+    """مركز الخلية (lat, lng)"""
+    min_lat, max_lat, min_lng, max_lng = decode_bounds(geohash)
+    return (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+
+def neighbors(geohash: str) -> List[str]:
+    """الخلايا الثماني المحيطة - لنقطة قريبة من حافة خليتها"""
+    min_lat, max_lat, min_lng, max_lng = decode_bounds(geohash)
+    lat, lng = (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+    d_lat, d_lng = max_lat - min_lat, max_lng - min_lng
+    return [
+        encode(lat + i * d_lat, lng + j * d_lng, len(geohash))
+        for i in (-1, 0, 1) for j in (-1, 0, 1) if i or j
+    ]
@@ -0,0 +1,96 @@
+import os
+import threading
+import httpx
+from langchain_openai import ChatOpenAI
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_NAME = os.getenv("JEENY_LLM_MODEL", "gpt-4o-mini")
+# "openai" أو "fake" (نموذج محلي بالقواعد للقياس والتجربة بدون شبكة - انظر fake_llm.py)
+LLM_BACKEND = os.getenv("JEENY_LLM_BACKEND", "openai").strip().lower()
+
+# الحد الأقصى للاتصالات المتزامنة مع OpenAI على مستوى العملية كلها
+MAX_CONNECTIONS = int(os.getenv("JEENY_LLM_MAX_CONNECTIONS", "10"))
+# أقصى انتظار لاتصال متاح في الـ pool قبل الفشل (بدل الانتظار بلا نهاية تحت الضغط)
+POOL_TIMEOUT_SECONDS = 5.0
+CONNECT_TIMEOUT_SECONDS = 3.0
+
+# إعدادات كل غرض: مهلة الطلب الكاملة بالثواني وعدد إعادة المحاولات
+# (إعادة المحاولة في مكتبة openai بتأخير أُسّي مع jitter وتحترم Retry-After)
+LLM_PURPOSES = {
+    "agent": {"timeout": 30.0, "max_retries": 2},       # حلقة الـ Agent
+    "nlu": {"timeout": 12.0, "max_retries": 2},         # استخراج المواقع وتحليل الرسائل
+    "classifier": {"timeout": 6.0, "max_retries": 1},   # نوع السيارة ومطابقة الأسماء - قصيرة
+}
+
+_lock = threading.Lock()
+# قفل منفصل للعميل: get_llm يحمل _lock أثناء إنشاء النموذج الذي يطلب العميل بدوره
+_http_lock = threading.Lock()
+_http_client = None
+_models = {}
+
+def get_http_client() -> httpx.Client:
+    """عميل HTTP مشترك - الاتصالات تبقى مفتوحة ويُعاد استخدامها بين كل الطلبات"""
+    global _http_client
+    if _http_client is None:
+        with _http_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=MAX_CONNECTIONS,
+                        max_keepalive_connections=MAX_CONNECTIONS
+                    ),
+                    timeout=httpx.Timeout(
+                        LLM_PURPOSES["agent"]["timeout"],
+                        connect=CONNECT_TIMEOUT_SECONDS,
+                        pool=POOL_TIMEOUT_SECONDS
+                    )
+                )
+    return _http_client
+
+def _create_model(purpose: str, streaming: bool):
+    settings = LLM_PURPOSES[purpose]
+    if LLM_BACKEND == "fake":
+        from jeeny_agent.fake_llm import create_fixture_model
+        print(f"[DEBUG] إنشاء نموذج محلي '{purpose}' بدون OpenAI")
+        return create_fixture_model(purpose, streaming)
+    model = ChatOpenAI(
+        model=MODEL_NAME,
+        temperature=0,
+        streaming=streaming,
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        timeout=settings["timeout"],
+        max_retries=settings["max_retries"],
+        http_client=get_http_client()
+    )
+    print(f"[DEBUG] إنشاء نموذج '{purpose}' (timeout={settings['timeout']}s, retries={settings['max_retries']})")
+    return model
+
+def get_llm(purpose: str = "nlu", streaming: bool = False):
+    """نموذج مشترك لكل غرض - يُنشأ مرة واحدة ويستخدم عميل HTTP المشترك"""
+    if purpose not in LLM_PURPOSES:
+        raise ValueError(f"غرض غير معروف للنموذج: '{purpose}'. المتاح: {', '.join(LLM_PURPOSES)}")
+    key = (purpose, streaming)
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = _create_model(purpose, streaming)
+                _models[key] = model
+    return model
+
+if __name__ == "__main__":
+    # فحص ذاتي لمسار openai: إنشاء النموذج يطلب عميل HTTP وهو داخل القفل - يجب ألا يتوقف
+    os.environ.setdefault("OPENAI_API_KEY", "sk-self-check")
+    results = {}
+    worker = threading.Thread(
+        target=lambda: results.update({purpose: get_llm(purpose) for purpose in LLM_PURPOSES}),
+        daemon=True
+    )
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive(), "get_llm توقف (deadlock) أثناء إنشاء النموذج"
+    assert all(get_llm(purpose) is model for purpose, model in results.items())
+    print(f"[نجح] إنشاء نماذج {LLM_BACKEND} لكل الأغراض: {', '.join(results)}")
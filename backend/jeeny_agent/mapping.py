@@ -12,6 +12,8 @@ import sys
 import subprocess
 import platform
 import json
+from jeeny_agent.routing import fetch_route, fetch_etas, ROUTING_BACKEND
+from jeeny_agent.fares import get_fare_engine
 
 gmaps = Client(key=os.getenv("GOOGLE_API_KEY"))
 
@@ -41,18 +43,27 @@ def calculate_distance_km(lat1, lng1, lat2, lng2):
     
     return R * c
 
-def estimate_trip_cost(distance_km, car_type="عادية"):
-    """تقدير تكلفة الرحلة"""
-    base_rates = {
-        "عادية": {"base": 1.5, "per_km": 0.8},
-        "عائلية": {"base": 2.0, "per_km": 1.0},
-        "VIP": {"base": 3.0, "per_km": 1.5},
-        "تاكسي": {"base": 1.0, "per_km": 0.7}
-    }
-    
-    rate = base_rates.get(car_type, base_rates["عادية"])
-    cost = rate["base"] + (distance_km * rate["per_km"])
-    return round(cost, 2)
+def trip_metrics(user_location, destination_location):
+    """(المسافة كم، المدة دقيقة، المسار) من مسار الطريق المشترك مع الرد - الخط المستقيم إذا تعذر المسار"""
+    try:
+        route = fetch_route(
+            origin=(user_location['lat'], user_location['lng']),
+            destination=(destination_location['lat'], destination_location['lng']),
+            mode="driving"
+        )
+        if route:
+            return route["distance_m"] / 1000, route["duration_s"] / 60, route
+    except Exception as e:
+        print(f"[تحذير] مسار الرحلة للخريطة: {e}")
+    distance_km = calculate_distance_km(
+        user_location["lat"], user_location["lng"],
+        destination_location["lat"], destination_location["lng"]
+    )
+    return distance_km, distance_km * 3, None
+
+def estimate_trip_cost(distance_km, duration_min, car_type="عادية"):
+    """تقدير تكلفة الرحلة من جدول التعرفة المشترك مع الرد"""
+    return get_fare_engine().fare(distance_km, duration_min, car_type)
 
 def get_weather_info():
     """محاكاة معلومات الطقس - يمكن ربطها بـ API حقيقي لاحقاً"""
@@ -64,6 +75,8 @@ def get_weather_info():
 
 def find_nearby_roads(user_location, distance_meters):
     """البحث عن طرق قريبة من المستخدم لوضع السائق عليها"""
+    if ROUTING_BACKEND == "local":
+        return None
     try:
         nearby_places = gmaps.places_nearby(
             location=(user_location['lat'], user_location['lng']),
@@ -86,6 +99,9 @@ def find_nearby_roads(user_location, distance_meters):
     
     return None
 
+# اتجاهات المواقع المرشحة للسائق حول المستخدم
+DRIVER_CANDIDATE_BEARINGS = [0, 45, 90, 135, 180, 225, 270, 315]
+
 def calculate_realistic_driver_position(user_location, destination_location, distance_meters):
     """حساب موقع السائق بطريقة واقعية ودقيقة"""
     try:
@@ -116,26 +132,23 @@ def calculate_realistic_driver_position(user_location, destination_location, dis
             return calculated_position
         
         else:
-            for angle in [0, 45, 90, 135, 180, 225, 270, 315]:
-                try:
-                    temp_lat = user_location["lat"] + (distance_km / 111.0) * math.sin(math.radians(angle)) * 0.5
-                    temp_lng = user_location["lng"] + (distance_km / (111.0 * math.cos(math.radians(user_location["lat"])))) * math.cos(math.radians(angle)) * 0.5
-                    
-                    directions = gmaps.directions(
-                        origin=f"{temp_lat},{temp_lng}",
-                        destination=f"{user_location['lat']},{user_location['lng']}",
-                        mode="driving",
-                        language="ar"
-                    )
-                    
-                    if directions:
-                        route_points = polyline.decode(directions[0]['overview_polyline']['points'])
-                        if len(route_points) > 3:
-                            selected_point = route_points[1]
-                            return {"lat": selected_point[0], "lng": selected_point[1]}
-                            
-                except:
-                    continue
+            # كل المواقع المرشحة تُقيَّم بطلب Distance Matrix واحد بدل طلب مسار لكل اتجاه
+            candidates = [
+                (
+                    user_location["lat"] + (distance_km / 111.0) * math.sin(math.radians(angle)) * 0.5,
+                    user_location["lng"] + (distance_km / (111.0 * math.cos(math.radians(user_location["lat"])))) * math.cos(math.radians(angle)) * 0.5
+                )
+                for angle in DRIVER_CANDIDATE_BEARINGS
+            ]
+            try:
+                etas = fetch_etas(candidates, (user_location['lat'], user_location['lng']), mode="driving")
+                reachable = [(eta["duration_s"], candidate) for candidate, eta in zip(candidates, etas) if eta]
+                if reachable:
+                    # الأقرب زمنياً للمستخدم
+                    _, (driver_lat, driver_lng) = min(reachable)
+                    return {"lat": driver_lat, "lng": driver_lng}
+            except Exception as e:
+                print(f"[تحذير] تعذر تقييم مواقع السائق المرشحة: {e}")
             
             lat_offset = (distance_meters / 111000.0) * random.choice([-0.3, 0.3])
             lng_offset = (distance_meters / (111000.0 * math.cos(math.radians(user_location["lat"])))) * random.choice([-0.3, 0.3])
@@ -191,7 +204,13 @@ def open_file_in_browser(filepath):
         print(f"[تحذير] فشل في فتح الملف: {e}")
         return False
 
-def create_trip_map(user_location, driver_location, destination_location, user_name="الراكب", driver_name="السائق"):
+def create_trip_map(user_location, driver_location, destination_location, user_name="الراكب", driver_name="السائق",
+                    trip_route=None, driver_route=None):
+    """رسم الخريطة وحفظها - يُعاد اسم الملف
+
+    موقع السائق النهائي ومساره يُكتبان في driver_location ("lat", "lng", "route"). تمرير trip_route
+    و driver_route المحفوظين يعيد رسم نفس الرحلة (مثلاً بنوع سيارة آخر) بدون أي طلب مسار.
+    """
     try:
         # حساب المركز المثالي للخريطة
         all_lats = [user_location["lat"], driver_location["lat"], destination_location["lat"]]
@@ -243,15 +262,16 @@ def create_trip_map(user_location, driver_location, destination_location, user_n
         car_type = driver_location.get('car_type', 'عادية')
         car_icon_info = get_car_icon(car_type)
         
-        # إعادة حساب موقع السائق
-        realistic_driver_pos = calculate_realistic_driver_position(
-            user_location, 
-            destination_location, 
-            driver_location.get('distance_m', 500)
-        )
-        
-        driver_location["lat"] = realistic_driver_pos["lat"]
-        driver_location["lng"] = realistic_driver_pos["lng"]
+        # إعادة حساب موقع السائق - إلا إذا كان مساره محفوظاً من رسم سابق
+        if driver_route is None:
+            realistic_driver_pos = calculate_realistic_driver_position(
+                user_location, 
+                destination_location, 
+                driver_location.get('distance_m', 500)
+            )
+            
+            driver_location["lat"] = realistic_driver_pos["lat"]
+            driver_location["lng"] = realistic_driver_pos["lng"]
         
         # حساب المسافات والتكاليف
         driver_distance = calculate_distance_km(
@@ -259,12 +279,12 @@ def create_trip_map(user_location, driver_location, destination_location, user_n
             driver_location["lat"], driver_location["lng"]
         ) * 1000
         
-        trip_distance = calculate_distance_km(
-            user_location["lat"], user_location["lng"],
-            destination_location["lat"], destination_location["lng"]
-        )
+        if trip_route is None:
+            trip_distance, trip_duration, trip_route = trip_metrics(user_location, destination_location)
+        else:
+            trip_distance, trip_duration = trip_route["distance_m"] / 1000, trip_route["duration_s"] / 60
         
-        estimated_cost = estimate_trip_cost(trip_distance, car_type)
+        estimated_cost = estimate_trip_cost(trip_distance, trip_duration, car_type)
         weather = get_weather_info()
         
         # معلومات الوقت
@@ -359,7 +379,7 @@ def create_trip_map(user_location, driver_location, destination_location, user_n
             <div style="padding: 8px;">
                 <p style="margin: 5px 0;"><strong>📍 الموقع:</strong> نقطة الوصول</p>
                 <p style="margin: 5px 0;"><strong>🛣️ المسافة من البداية:</strong> {trip_distance:.1f} كم</p>
-                <p style="margin: 5px 0;"><strong>⏱️ وقت الرحلة المتوقع:</strong> {int(trip_distance * 3)} دقيقة</p>
+                <p style="margin: 5px 0;"><strong>⏱️ وقت الرحلة المتوقع:</strong> {int(trip_duration)} دقيقة</p>
                 
                 <hr style="margin: 10px 0; border: 1px solid #eee;">
                 
@@ -386,15 +406,14 @@ def create_trip_map(user_location, driver_location, destination_location, user_n
         # رسم المسارات مع تحسين الأداء
         try:
             # مسار السائق للمستخدم
-            driver_to_user = gmaps.directions(
-                origin=f"{driver_location['lat']},{driver_location['lng']}",
-                destination=f"{user_location['lat']},{user_location['lng']}",
-                mode="driving",
-                language="ar",
-                region="jo"
+            driver_to_user = driver_route or fetch_route(
+                origin=(driver_location['lat'], driver_location['lng']),
+                destination=(user_location['lat'], user_location['lng']),
+                mode="driving"
             )
+            driver_location["route"] = driver_to_user
             if driver_to_user:
-                points = driver_to_user[0]['overview_polyline']['points']
+                points = driver_to_user['polyline']
                 coords = polyline.decode(points)
                 
                 if len(coords) > 1:
@@ -434,26 +453,22 @@ def create_trip_map(user_location, driver_location, destination_location, user_n
         
         # مسار الرحلة الرئيسي
         try:
-            user_to_dest = gmaps.directions(
-                origin=f"{user_location['lat']},{user_location['lng']}",
-                destination=f"{destination_location['lat']},{destination_location['lng']}",
-                mode="driving",
-                language="ar",
-                region="jo"
-            )
-            if user_to_dest:
-                points = user_to_dest[0]['overview_polyline']['points']
-                coords = polyline.decode(points)
-                
-                if len(coords) > 1:
-                    folium.PolyLine(
-                        coords, 
-                        color="#9C27B0", 
-                        weight=5, 
-                        opacity=0.9,
-                        tooltip=f"🛣️ مسار رحلتك - {trip_distance:.1f} كم"
-                    ).add_to(trip_map)
-                        
+            # نفس مسار compute_trip - جُلب مع حساب التكلفة من الكاش المشترك
+            user_to_dest = trip_route
+            if user_to_dest is None:
+                raise ValueError("لا يوجد مسار بالسيارة - رسم خط مباشر")
+            points = user_to_dest['polyline']
+            coords = polyline.decode(points)
+            
+            if len(coords) > 1:
+                folium.PolyLine(
+                    coords, 
+                    color="#9C27B0", 
+                    weight=5, 
+                    opacity=0.9,
+                    tooltip=f"🛣️ مسار رحلتك - {trip_distance:.1f} كم"
+                ).add_to(trip_map)
+                    
         except Exception as e:
             print(f"[تحذير] مسار الرحلة: {e}")
             folium.PolyLine(
@@ -818,12 +833,9 @@ def create_trip_summary(user_location, driver_location, destination_location, us
             driver_location["lat"], driver_location["lng"]
         ) * 1000
         
-        trip_distance = calculate_distance_km(
-            user_location["lat"], user_location["lng"],
-            destination_location["lat"], destination_location["lng"]
-        )
+        trip_distance, trip_duration, _ = trip_metrics(user_location, destination_location)
         
-        estimated_cost = estimate_trip_cost(trip_distance, car_type)
+        estimated_cost = estimate_trip_cost(trip_distance, trip_duration, car_type)
         weather = get_weather_info()
         
         current_time = datetime.now()
@@ -840,7 +852,7 @@ def create_trip_summary(user_location, driver_location, destination_location, us
             "distances": {
                 "driver_to_user_m": int(driver_distance),
                 "trip_distance_km": round(trip_distance, 1),
-                "estimated_time_min": int(trip_distance * 3)
+                "estimated_time_min": int(trip_duration)
             },
             "costs": {
                 "estimated_cost_jod": estimated_cost,
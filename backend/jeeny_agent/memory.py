@@ -0,0 +1,101 @@
+import re
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+from pydantic import Field
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+
+# حذف الإيموجي والرموز من الردود المخزنة في الذاكرة
+_EMOJI_RE = re.compile(
+    "[\U0001F300-\U0001FAFF\U00002600-\U000027BF\U0001F000-\U0001F2FF\uFE0F\u200D]+"
+)
+_BLANK_LINES_RE = re.compile(r'\n\s*\n+')
+
+# عدد الدورات المحفوظة في سجل حجم الذاكرة
+PROMPT_HISTORY_SIZE = 100
+
+def approx_tokens(text: str) -> int:
+    """تقدير تقريبي لعدد التوكنز (النص العربي ≈ 3 أحرف للتوكن)"""
+    return max(1, len(text) // 3)
+
+def compact_text(text: str, max_chars: int = 400) -> str:
+    """ضغط رد الأداة: حذف الإيموجي والأسطر الفارغة ودمج الأسطر في سطر واحد"""
+    text = _EMOJI_RE.sub("", str(text))
+    lines = [line.strip(" •-") for line in _BLANK_LINES_RE.sub("\n", text).splitlines()]
+    compact = " | ".join(line for line in lines if line)
+    if len(compact) > max_chars:
+        compact = compact[:max_chars].rstrip() + "…"
+    return compact
+
+class TripAwareBufferMemory(BaseChatMemory):
+    """ذاكرة محادثة بميزانية توكنز ثابتة
+
+    - تحتفظ بآخر الرسائل فقط ضمن max_token_limit
+    - تضيف ملخصاً قصيراً لحالة الرحلة الحالية بدلاً من إعادة إرسال ردود الأدوات الطويلة
+    - تسجل حجم الذاكرة المرسلة في آخر الدورات (last_prompt_tokens و prompt_token_history)
+    """
+
+    memory_key: str = "chat_history"
+    human_prefix: str = "Human"
+    ai_prefix: str = "AI"
+    max_token_limit: int = 600
+    max_message_chars: int = 400
+    trip_state_provider: Optional[Callable[[], Optional[dict]]] = None
+    last_prompt_tokens: int = 0
+    # آخر الدورات فقط - الجلسات الطويلة لا تكبّر السجل بلا حد
+    prompt_token_history: Deque[int] = Field(default_factory=lambda: deque(maxlen=PROMPT_HISTORY_SIZE))
+
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """تخزين الرد بعد ضغطه حتى لا تكبر الذاكرة بردود الأدوات متعددة الأسطر"""
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        self.chat_memory.add_user_message(compact_text(input_str, self.max_message_chars))
+        self.chat_memory.add_ai_message(compact_text(output_str, self.max_message_chars))
+        
+        # لا داعي للاحتفاظ برسائل قديمة لن تدخل الـ prompt أبداً
+        messages = self.chat_memory.messages
+        while len(messages) > 2 and sum(approx_tokens(m.content) for m in messages) > 4 * self.max_token_limit:
+            messages.pop(0)
+
+    def _trip_summary(self) -> Optional[str]:
+        if self.trip_state_provider is None:
+            return None
+        trip = self.trip_state_provider()
+        if not trip:
+            return None
+        start, end = trip.get("start_location"), trip.get("end_location")
+        return (
+            f"الرحلة الحالية: من {getattr(start, 'name', start)} "
+            f"إلى {getattr(end, 'name', end)}، نوع السيارة: {trip.get('car_type')}"
+        )
+
+    def _window(self) -> List[BaseMessage]:
+        """أحدث الرسائل التي تتسع لها الميزانية بعد حساب ملخص الرحلة"""
+        summary = self._trip_summary()
+        budget = self.max_token_limit - (approx_tokens(summary) if summary else 0)
+        window = []
+        for message in reversed(self.chat_memory.messages):
+            cost = approx_tokens(message.content)
+            if cost > budget:
+                break
+            window.append(message)
+            budget -= cost
+        window.reverse()
+        if summary:
+            window.insert(0, SystemMessage(content=summary))
+        return window
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        messages = self._window()
+        self.last_prompt_tokens = sum(approx_tokens(m.content) for m in messages)
+        self.prompt_token_history.append(self.last_prompt_tokens)
+        print(f"[DEBUG] حجم الذاكرة في الـ prompt: ~{self.last_prompt_tokens} توكن "
+              f"({len(messages)} رسالة من أصل {len(self.chat_memory.messages)})")
+        if self.return_messages:
+            return {self.memory_key: messages}
+        return {self.memory_key: get_buffer_string(
+            messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix
+        )}
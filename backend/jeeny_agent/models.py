@@ -1,5 +1,8 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, Literal
+
+CarType = Literal["عادية", "تاكسي", "عائلية", "VIP"]
+ModificationType = Literal["البداية", "النهاية", "كليهما"]
 
 class Location(BaseModel):
     name: str 
@@ -12,3 +15,25 @@ class TripInfo(BaseModel):
     cost: float
     car_type: str = "عادية"
 
+class ParsedTurn(BaseModel):
+    """نتيجة تحليل رسالة المستخدم باستدعاء واحد للنموذج"""
+    car_type: CarType = "عادية"
+    start_location: Optional[str] = None
+    end_location: Optional[str] = None
+    modification_type: Optional[ModificationType] = None
+    start_saved_name: Optional[str] = None
+    end_saved_name: Optional[str] = None
+
+# وسائط الأدوات في وضع استدعاء الأدوات (tool calling) - النموذج يملؤها مباشرة بدل النص الخام
+class DirectionsArgs(BaseModel):
+    start_location: str = Field(description="نقطة البداية كما قالها المستخدم (اسم مكان أو اسم محفوظ مثل الدار)")
+    end_location: str = Field(description="الوجهة كما قالها المستخدم (اسم مكان أو اسم محفوظ مثل الدار)")
+    car_type: CarType = Field(default="عادية", description="نوع السيارة المطلوب")
+
+class ChangeCarTypeArgs(BaseModel):
+    car_type: CarType = Field(description="نوع السيارة الجديد للرحلة الحالية")
+
+class ModifyLocationArgs(BaseModel):
+    modification_type: ModificationType = Field(description="الجزء المراد تعديله من الرحلة الحالية")
+    new_start_location: Optional[str] = Field(default=None, description="البداية الجديدة عند تعديل البداية أو كليهما")
+    new_end_location: Optional[str] = Field(default=None, description="الوجهة الجديدة عند تعديل النهاية أو كليهما")
@@ -1,41 +1,87 @@
 import os
 import json
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 from typing import Dict, Optional
 import time
 import re
 from functools import lru_cache 
+from jeeny_agent.models import ParsedTurn
+from jeeny_agent.car_types import detect_car_type, DEFAULT_CAR_TYPE
+from jeeny_agent.cache import PersistentCache
+from jeeny_agent.normalization import normalize_arabic
+from jeeny_agent.rule_extractor import extract_locations_rules, RULE_CONFIDENCE_THRESHOLD
+from jeeny_agent.saved_locations import SavedLocationsStore, SavedLocationsIndex
+from jeeny_agent.user_locations_db import get_user_locations_db
+from jeeny_agent.llm_gateway import get_llm
+from jeeny_agent.geocoding import reverse_geocode
+
+# حدود المطابقة التقريبية للأماكن المحفوظة (0-100)
+FUZZY_ACCEPT_SCORE = 90     # قبول مباشر بدون النموذج
+FUZZY_MARGIN = 10           # الفرق المطلوب بين الأول والثاني للقبول المباشر
+FUZZY_REJECT_SCORE = 60     # أقل من ذلك = لا يوجد تطابق، بدون النموذج
+FUZZY_TOP_K = 5             # عدد المرشحين المرسلين للنموذج عند الغموض
 
 # إعداد مفاتيح API
 load_dotenv()
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=os.getenv("OPENAI_API_KEY"))
+llm = get_llm("nlu")
 
-# تحميل الأماكن المحفوظة - إصلاح المسار
-def load_saved_locations() -> dict:
-    try:
-        # الحصول على مجلد المشروع الحالي
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        # الرجوع للمجلد الأب (backend) والوصول لملف saved_locations.json
-        file_path = os.path.join(current_dir, '..', 'saved_locations.json')
-        
-        # طباعة المسار للتأكد (يمكن حذفها لاحقاً)
-        print(f"[DEBUG] محاولة تحميل الملف من: {os.path.abspath(file_path)}")
-        
-        if not os.path.exists(file_path):
-            print(f"[خطأ] الملف غير موجود: {file_path}")
-            return {}
-            
-        with open(file_path, 'r', encoding='utf-8') as f:
-            saved_data = json.load(f)
-            print(f"[نجح] تم تحميل {len(saved_data)} موقع محفوظ")
-            return saved_data
-    except Exception as e:
-        print(f"[خطأ] تعذر تحميل ملف الأماكن المحفوظة: {e}")
-        return {}
+# مسار ملف الأماكن المحفوظة (مجلد backend)
+SAVED_LOCATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'saved_locations.json')
+
+# مخزن الأماكن المحفوظة في الذاكرة - يعاد تحميله تلقائياً عند تعديل الملف
+saved_locations_store = SavedLocationsStore(SAVED_LOCATIONS_PATH)
+
+# كاش دائم لاستجابات النموذج حتى لا نعيد نفس الطلب لنفس الجملة
+extract_cache = PersistentCache("extract_locations")
+match_cache = PersistentCache("match_location")
+parse_turn_cache = PersistentCache("parse_turn")
+
+# توحيد النص قبل استخدامه كمفتاح للكاش
+def _cache_key(text: str) -> str:
+    return normalize_arabic(text)
+
+# نسخة ملف الأماكن المحفوظة - تتغير عند تعديل الملف فيُمسح الكاش المعتمد عليه
+def _saved_locations_version() -> str:
+    return saved_locations_store.version
+
+# إحصائيات الكاش (hit/miss) لكل نوع
+def get_cache_stats() -> list:
+    return [extract_cache.stats(), match_cache.stats(), parse_turn_cache.stats()]
+
+# تحميل الأماكن المحفوظة - من الذاكرة، ولا يُقرأ الملف إلا إذا تغير
+def load_saved_locations() -> SavedLocationsIndex:
+    return saved_locations_store.get()
+
+# أماكن المستخدم المحفوظة (الملف العام إذا لم يُحدد مستخدم)
+def get_saved_locations(user_id: Optional[str] = None) -> SavedLocationsIndex:
+    return _saved_locations_for(user_id)[0]
+
+# أماكن المستخدم المحفوظة مع نطاق الكاش الخاص بها
+def _saved_locations_for(user_id: Optional[str]) -> tuple:
+    """بدون user_id نستخدم ملف saved_locations.json، ومعه نستخدم قاعدة بيانات المستخدمين"""
+    if user_id is None:
+        return load_saved_locations(), None
+    db = get_user_locations_db()
+    return db.get_locations(user_id), f"{user_id}@{db.revision(user_id)}"
 
 # استخراج المواقع من النص
 def extract_locations(user_text: str) -> dict:
+    # المسار السريع: القواعد تكفي لمعظم الجمل مثل "من X إلى Y"
+    rules = extract_locations_rules(user_text, load_saved_locations().keys())
+    if rules["confidence"] >= RULE_CONFIDENCE_THRESHOLD:
+        print(f"[DEBUG] استخراج المواقع بالقواعد (ثقة {rules['confidence']}): {rules}")
+        return {
+            "start_location": rules["start_location"],
+            "end_location": rules["end_location"],
+            "country": "الأردن"
+        }
+    
+    key = _cache_key(user_text)
+    cached = extract_cache.get(key)
+    if cached is not None:
+        print(f"[DEBUG] استخراج المواقع من الكاش: {cached}")
+        return cached
+    
     prompt = f"""
     أنت مساعد ذكي. المستخدم يتحدث باللهجة الأردنية ويعطيك جملة فيها موقعه الحالي والمكان الذي يريد الذهاب إليه.
     مهمتك استخراج:
@@ -58,6 +104,7 @@ def extract_locations(user_text: str) -> dict:
         # تحقق إذا كانت الاستجابة تحتوي على بيانات JSON صالحة
         if response.content.strip():
             result = json.loads(response.content)
+            extract_cache.set(key, result)
             return result
         else:
             return {"error": "لم يتم استخراج المواقع بنجاح من النص."}
@@ -65,36 +112,76 @@ def extract_locations(user_text: str) -> dict:
         result = {"error": f"لم يتمكن النموذج من استخراج المواقع بدقة. [{e}]"}
         return result
 
+# مطابقة محلية (بدون نموذج) مع الأماكن المحفوظة - ترجع None إذا لم يوجد تطابق
+def match_saved_location(user_place: str, saved_locations: dict) -> Optional[str]:
+    if not normalize_arabic(user_place):
+        return None
+    if not isinstance(saved_locations, SavedLocationsIndex):
+        saved_locations = SavedLocationsIndex(saved_locations)
+    
+    # البحث المباشر أولاً (بعد توحيد الألف والهمزات والتاء المربوطة والتشكيل)
+    matched_name = saved_locations.lookup(user_place)
+    if matched_name is not None:
+        matched_value = saved_locations[matched_name]
+        print(f"[DEBUG] تم العثور على تطابق مباشر: {user_place} -> {matched_value}")
+        
+        # إذا كانت القيمة المطابقة هي إحداثيات، نعيدها كما هي
+        if is_latlng(matched_value):
+            print(f"[DEBUG] القيمة المطابقة هي إحداثيات: {matched_value}")
+        else:
+            print(f"[DEBUG] القيمة المطابقة هي اسم: {matched_value}")
+        return matched_value
+    
+    # البحث بالكلمات المفتاحية (فهرس n-gram)
+    partial = saved_locations.partial_matches(user_place)
+    if partial:
+        saved_value = saved_locations[partial[0]]
+        print(f"[DEBUG] تم العثور على تطابق جزئي: {partial[0]} -> {saved_value}")
+        return saved_value
+    
+    return None
+
 # مقارنة المواقع مع الأماكن المحفوظة - تحسين الخوارزمية
-def match_location_with_ai(user_place: str, saved_locations: dict) -> str:
+def match_location_with_ai(user_place: str, saved_locations: dict, cache_scope: Optional[str] = None) -> str:
     # إذا كان المكان فارغ، إرجاع كما هو
     if not user_place or not user_place.strip():
         return user_place
     
     # تنظيف النص
     user_place_clean = user_place.strip()
+    user_place_key = normalize_arabic(user_place_clean)
+    if not user_place_key:
+        return user_place_clean
     
-    # البحث المباشر أولاً
-    if user_place_clean in saved_locations:
-        matched_value = saved_locations[user_place_clean]
-        print(f"[DEBUG] تم العثور على تطابق مباشر: {user_place_clean} -> {matched_value}")
-        
-        # إذا كانت القيمة المطابقة هي إحداثيات، نعيدها كما هي
-        if is_latlng(matched_value):
-            print(f"[DEBUG] القيمة المطابقة هي إحداثيات: {matched_value}")
-            return matched_value
-        else:
-            print(f"[DEBUG] القيمة المطابقة هي اسم: {matched_value}")
-            return matched_value
+    matched_value = match_saved_location(user_place_clean, saved_locations)
+    if matched_value is not None:
+        return matched_value
     
-    # البحث بالكلمات المفتاحية
-    for saved_key, saved_value in saved_locations.items():
-        if saved_key.lower() in user_place_clean.lower() or user_place_clean.lower() in saved_key.lower():
-            print(f"[DEBUG] تم العثور على تطابق جزئي: {saved_key} -> {saved_value}")
-            return saved_value
+    # التحقق من الكاش قبل استدعاء النموذج
+    if cache_scope is None:
+        match_cache.ensure_version(_saved_locations_version())
+        key = user_place_key
+    else:
+        key = f"{cache_scope}|{user_place_key}"
+    cached = match_cache.get(key)
+    if cached is not None:
+        print(f"[DEBUG] نتيجة المطابقة من الكاش: {user_place_clean} -> {cached}")
+        return cached
     
-    # استخدام AI للمطابقة الذكية
-    location_names = list(saved_locations.keys())
+    # المطابقة التقريبية: قبول الفائز الواضح، ورفض الضعيف، والنموذج فقط عند الغموض
+    if not isinstance(saved_locations, SavedLocationsIndex):
+        saved_locations = SavedLocationsIndex(saved_locations)
+    candidates = saved_locations.fuzzy_matches(user_place_clean, limit=FUZZY_TOP_K)
+    print(f"[DEBUG] مرشحو المطابقة التقريبية: {candidates}")
+    if not candidates or candidates[0][1] < FUZZY_REJECT_SCORE:
+        return user_place_clean
+    runner_up = candidates[1][1] if len(candidates) > 1 else 0
+    if candidates[0][1] >= FUZZY_ACCEPT_SCORE and candidates[0][1] - runner_up >= FUZZY_MARGIN:
+        print(f"[DEBUG] تطابق تقريبي واضح: {candidates[0][0]}")
+        return saved_locations[candidates[0][0]]
+    
+    # استخدام AI للمطابقة الذكية على المرشحين الغامضين فقط
+    location_names = [name for name, score in candidates if score >= FUZZY_REJECT_SCORE]
     locations_str = "\n".join(f"- {loc}" for loc in location_names)
     
     prompt = f"""
@@ -113,15 +200,17 @@ def match_location_with_ai(user_place: str, saved_locations: dict) -> str:
         print(f"[DEBUG] AI اختار: {choice}")
         
         if choice == "NO_MATCH" or choice not in location_names:
-            return user_place_clean
-        
-        return saved_locations.get(choice, user_place_clean)
+            result = user_place_clean
+        else:
+            result = saved_locations.get(choice, user_place_clean)
+        match_cache.set(key, result)
+        return result
     except Exception as e:
         print(f"[تحذير] خطأ في AI matching: {e}")
         return user_place_clean
 
 # التحقق من المواقع المحفوظة
-def check_saved_locations(user_text: str) -> dict:
+def check_saved_locations(user_text: str, user_id: Optional[str] = None) -> dict:
     print(f"[DEBUG] معالجة النص: {user_text}")
     
     extracted = extract_locations(user_text)
@@ -130,11 +219,11 @@ def check_saved_locations(user_text: str) -> dict:
     
     print(f"[DEBUG] المواقع المستخرجة: {extracted}")
     
-    saved_locations = load_saved_locations()
+    saved_locations, cache_scope = _saved_locations_for(user_id)
     print(f"[DEBUG] عدد المواقع المحفوظة: {len(saved_locations)}")
     
-    start_location = match_location_with_ai(extracted.get("start_location", ""), saved_locations)
-    end_location = match_location_with_ai(extracted.get("end_location", ""), saved_locations)
+    start_location = match_location_with_ai(extracted.get("start_location", ""), saved_locations, cache_scope)
+    end_location = match_location_with_ai(extracted.get("end_location", ""), saved_locations, cache_scope)
     
     print(f"[DEBUG] الموقع المطابق للبداية: {start_location}")
     print(f"[DEBUG] الموقع المطابق للنهاية: {end_location}")
@@ -145,6 +234,107 @@ def check_saved_locations(user_text: str) -> dict:
         "country": extracted.get("country", "الأردن")
     }
 
+# مطابقة اسم مكان واحد مع أماكن المستخدم المحفوظة (للوسائط الجاهزة في وضع استدعاء الأدوات)
+def resolve_saved_place(place: str, user_id: Optional[str] = None) -> str:
+    """ترجع قيمة المكان المحفوظ إن وجد تطابق، وإلا الاسم كما هو للـ geocoding"""
+    saved_locations, cache_scope = _saved_locations_for(user_id)
+    return match_location_with_ai(place or "", saved_locations, cache_scope)
+
+# إزالة علامات ``` التي قد يضيفها النموذج حول JSON
+def _strip_json_fences(content: str) -> str:
+    content = content.strip()
+    if content.startswith("```"):
+        content = re.sub(r'^```(?:json)?', '', content).replace('```', '').strip()
+    json_start = content.find('{')
+    json_end = content.rfind('}') + 1
+    if json_start != -1 and json_end > json_start:
+        content = content[json_start:json_end]
+    return content
+
+# تحليل رسالة المستخدم كاملة باستدعاء واحد للنموذج
+def parse_turn(user_text: str, user_id: Optional[str] = None) -> dict:
+    """يستخرج نوع السيارة والبداية والوجهة ونوع التعديل ومطابقة الأماكن المحفوظة في استجابة واحدة"""
+    saved_locations, cache_scope = _saved_locations_for(user_id)
+    
+    # المسار السريع: إذا فهمت القواعد الجملة بثقة عالية لا نستدعي النموذج
+    rules = extract_locations_rules(user_text, saved_locations.keys())
+    if rules["confidence"] >= RULE_CONFIDENCE_THRESHOLD:
+        print(f"[DEBUG] تحليل الرسالة بالقواعد (ثقة {rules['confidence']}): {rules}")
+        start_location = match_saved_location(rules["start_location"], saved_locations)
+        end_location = match_saved_location(rules["end_location"], saved_locations)
+        return {
+            # القواعد تستخرج المواقع فقط - نوع السيارة من نفس الأنماط المستخدمة في باقي المسارات
+            "car_type": detect_car_type(user_text) or DEFAULT_CAR_TYPE,
+            "start_location": start_location or rules["start_location"],
+            "end_location": end_location or rules["end_location"],
+            "modification_type": None,
+            "country": "الأردن"
+        }
+    
+    if cache_scope is None:
+        parse_turn_cache.ensure_version(_saved_locations_version())
+        key = _cache_key(user_text)
+    else:
+        key = f"{cache_scope}|{_cache_key(user_text)}"
+    cached = parse_turn_cache.get(key)
+    if cached is not None:
+        print(f"[DEBUG] تحليل الرسالة من الكاش: {cached}")
+        return cached
+    
+    locations_str = "\n".join(f"- {name}" for name in saved_locations.keys()) or "- (لا يوجد)"
+    schema = json.dumps(ParsedTurn.model_json_schema(), ensure_ascii=False)
+
+    prompt = f"""
+    أنت مساعد ذكي لتطبيق نقل في الأردن. المستخدم يتحدث باللهجة الأردنية.
+    النص:
+    \"{user_text}\"
+
+    استخرج:
+    - car_type: نوع السيارة من (عادية، تاكسي، عائلية، VIP). الافتراضي "عادية".
+    - start_location: نقطة البداية كما ذكرها المستخدم أو null.
+    - end_location: الوجهة كما ذكرها المستخدم أو null.
+    - modification_type: إذا كان المستخدم يعدل رحلة سابقة: "البداية" أو "النهاية" أو "كليهما"، وإلا null.
+    - start_saved_name / end_saved_name: اسم المكان المطابق من قائمة الأماكن المحفوظة التالية (بالفهم وليس حرفياً)، أو null إذا لا يوجد تطابق واضح.
+
+    الأماكن المحفوظة:
+    {locations_str}
+
+    أرجع JSON فقط بدون أي نص إضافي، مطابق لهذا المخطط:
+    {schema}
+    """
+
+    try:
+        response = llm.invoke(prompt)
+        print(f"[DEBUG] parse_turn response: {response.content}")
+        parsed = ParsedTurn.model_validate_json(_strip_json_fences(response.content))
+    except Exception as e:
+        return {"error": f"لم يتمكن النموذج من تحليل الرسالة. [{e}]"}
+
+    # استبدال الأسماء المحفوظة بقيمها، مع تجاهل أي اسم غير موجود في القائمة
+    start_location = parsed.start_location or ""
+    end_location = parsed.end_location or ""
+    if parsed.start_saved_name in saved_locations:
+        start_location = saved_locations[parsed.start_saved_name]
+    else:
+        # النموذج لم يطابق ("الدار" كما هي) - المطابقة المحلية قبل الـ geocoding
+        start_location = match_saved_location(start_location, saved_locations) or start_location
+    if parsed.end_saved_name in saved_locations:
+        end_location = saved_locations[parsed.end_saved_name]
+    else:
+        end_location = match_saved_location(end_location, saved_locations) or end_location
+
+    print(f"[DEBUG] parse_turn: {parsed.car_type} | {start_location} -> {end_location} | {parsed.modification_type}")
+
+    result = {
+        "car_type": parsed.car_type,
+        "start_location": start_location,
+        "end_location": end_location,
+        "modification_type": parsed.modification_type,
+        "country": "الأردن"
+    }
+    parse_turn_cache.set(key, result)
+    return result
+
 # دمج استخراج المواقع مع التحقق من الأماكن المحفوظة
 def process_user_input(user_text: str) -> Dict:
     extracted = extract_locations(user_text)
@@ -175,12 +365,14 @@ def parse_latlng(latlng_str):
     return None, None
 
 # تحويل الإحداثيات إلى اسم الموقع
-def get_location_name_from_coordinates(latlng: str) -> str:
+def get_location_name_from_coordinates(latlng: str, user_id: Optional[str] = None) -> str:
     if not latlng:
         return latlng
-        
-    saved_locations = load_saved_locations()
-    for name, value in saved_locations.items():
-        if str(value).strip() == str(latlng).strip():
-            return name
-    return latlng
\ No newline at end of file
+    
+    # تطابق تام مع مكان محفوظ، ثم أقرب مكان محفوظ، ثم الـ reverse geocoding
+    saved_locations = get_saved_locations(user_id)
+    name = saved_locations.name_for_coordinates(latlng)
+    if name is None and is_latlng(latlng):
+        lat, lng = parse_latlng(latlng)
+        name = saved_locations.name_near(lat, lng) or reverse_geocode(lat, lng)
+    return name if name is not None else latlng
\ No newline at end of file
@@ -0,0 +1,34 @@
+import re
+from functools import lru_cache
+
+# جدول تحويل واحد محسوب مسبقاً: توحيد الألف والهمزات والتاء المربوطة وحذف التشكيل والتطويل وتحويل الأرقام
+_TRANSLATION_TABLE = str.maketrans({
+    # الألف والهمزات
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ؤ": "و", "ئ": "ي", "ى": "ي",
+    # التاء المربوطة
+    "ة": "ه",
+    # التشكيل والتطويل
+    "ً": None, "ٌ": None, "ٍ": None, "َ": None,
+    "ُ": None, "ِ": None, "ّ": None, "ْ": None,
+    "ٰ": None, "ـ": None,
+    # الأرقام العربية الهندية والفارسية
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+    "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+    "۰": "0", "۱": "1", "۲": "2", "۳": "3", "۴": "4",
+    "۵": "5", "۶": "6", "۷": "7", "۸": "8", "۹": "9",
+    # الفاصلة والفاصلة العشرية العربية
+    "،": ",", "٫": ".",
+})
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_EDGE_PUNCTUATION = " ,.;:!?؟؛_\"'"
+
+@lru_cache(maxsize=4096)
+def normalize_arabic(text: str) -> str:
+    """توحيد النص العربي ليُستخدم كمفتاح للبحث والكاش"""
+    if not text:
+        return ""
+    normalized = str(text).translate(_TRANSLATION_TABLE).lower()
+    normalized = _WHITESPACE_RE.sub(" ", normalized)
+    return normalized.strip(_EDGE_PUNCTUATION)
@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Iterable
+
+class StageError(Exception):
+    """خطأ في مرحلة من مراحل الرحلة رسالته جاهزة للعرض على المستخدم"""
+
+class TaskGraph:
+    """تنفيذ مراحل مستقلة بالتوازي حسب الاعتماديات بينها مع قياس زمن كل مرحلة
+
+    كل مرحلة دالة تستقبل نتائج المراحل التي تعتمد عليها كـ keyword arguments:
+        graph.add("trip", lambda start, end: compute_trip(start, end), deps=["start", "end"])
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._stages = {}
+        self.results = {}
+        self.timings = {}
+        self.total_time = 0.0
+
+    def add(self, name: str, fn: Callable, deps: Iterable[str] = ()) -> "TaskGraph":
+        deps = list(deps)
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"المرحلة '{name}' تعتمد على مرحلة غير معرفة: '{dep}'")
+        self._stages[name] = (fn, deps)
+        return self
+
+    def _timed(self, name: str, fn: Callable, kwargs: dict):
+        started = time.perf_counter()
+        try:
+            return fn(**kwargs)
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    def run(self) -> dict:
+        """تشغيل كل المراحل وإرجاع نتائجها - أي استثناء يوقف التنفيذ ويُعاد رفعه"""
+        started = time.perf_counter()
+        pending = dict(self._stages)
+        running = {}
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while pending or running:
+                    for name, (fn, deps) in list(pending.items()):
+                        if all(dep in self.results for dep in deps):
+                            kwargs = {dep: self.results[dep] for dep in deps}
+                            running[executor.submit(self._timed, name, fn, kwargs)] = name
+                            del pending[name]
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        try:
+                            self.results[name] = future.result()
+                        except BaseException:
+                            for other in running:
+                                other.cancel()
+                            pending.clear()
+                            raise
+        finally:
+            self.total_time = time.perf_counter() - started
+        return self.results
+
+    def format_timings(self) -> str:
+        """ملخص الأزمنة: كل مرحلة ثم الزمن الكلي"""
+        stages = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.timings.items())
+        return f"{stages} | total={self.total_time * 1000:.0f}ms"
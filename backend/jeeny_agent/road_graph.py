@@ -0,0 +1,202 @@
+import os
+import math
+import heapq
+import threading
+from typing import List, Optional, Tuple
+import numpy as np
+import polyline
+from jeeny_agent.gazetteer import haversine_km
+
+# شبكة الطرق المضمنة للتوجيه بدون إنترنت - تُبنى بـ python -m jeeny_agent.road_graph_builder
+ROAD_GRAPH_PATH = os.getenv(
+    "JEENY_ROAD_GRAPH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jordan_roads.npz')
+)
+
+# الطريق من النقطة إلى أقرب عقدة في الشبكة: خط مستقيم مع معامل انعطاف وسرعة شوارع داخلية
+ACCESS_DETOUR_FACTOR = 1.3
+ACCESS_SPEED_KMH = 25.0
+
+# فهرس العقد المكاني بالدرجات (≈ 1 كم) وعدد حلقات الخلايا قبل البحث في كل العقد
+SNAP_CELL_DEGREES = 0.01
+SNAP_MAX_RINGS = 3
+
+class _Adjacency:
+    """وصلات صاعدة بصيغة CSR محوّلة لقوائم Python (الفهرسة فيها أسرع من numpy داخل Dijkstra)"""
+
+    def __init__(self, arrays, prefix: str):
+        self.offsets = arrays[f"{prefix}_offsets"].tolist()
+        self.targets = arrays[f"{prefix}_targets"].tolist()
+        self.seconds = arrays[f"{prefix}_seconds"].tolist()
+        self.meters = arrays[f"{prefix}_meters"].tolist()
+        self.middle = arrays[f"{prefix}_middle"].tolist()
+
+    def find(self, node: int, target: int) -> int:
+        for index in range(self.offsets[node], self.offsets[node + 1]):
+            if self.targets[index] == target:
+                return index
+        raise KeyError(f"وصلة غير موجودة: {node} -> {target}")
+
+class RoadGraph:
+    """شبكة طرق مع contraction hierarchies: البحث من الطرفين يصعد فقط نحو العقد الأعلى رتبة"""
+
+    def __init__(self, arrays):
+        self.lat = arrays["lat"].astype(np.float64)
+        self.lng = arrays["lng"].astype(np.float64)
+        self.rank = arrays["rank"].tolist()
+        self.fwd = _Adjacency(arrays, "fwd")
+        self.bwd = _Adjacency(arrays, "bwd")
+        self._build_snap_index()
+
+    @classmethod
+    def load(cls, file_path: str = ROAD_GRAPH_PATH) -> "RoadGraph":
+        with np.load(file_path) as arrays:
+            graph = cls(arrays)
+        print(f"[DEBUG] تحميل شبكة الطرق: {len(graph.rank)} عقدة من: {file_path}")
+        return graph
+
+    @staticmethod
+    def _cell_keys(lat, lng):
+        rows = np.floor(np.asarray(lat) / SNAP_CELL_DEGREES).astype(np.int64)
+        cols = np.floor(np.asarray(lng) / SNAP_CELL_DEGREES).astype(np.int64)
+        return rows * 40000 + cols
+
+    def _build_snap_index(self):
+        keys = self._cell_keys(self.lat, self.lng)
+        self._snap_order = np.argsort(keys, kind="stable")
+        self._snap_keys = keys[self._snap_order]
+
+    def nearest_node(self, lat: float, lng: float) -> int:
+        """أقرب عقدة: الخلايا المحيطة أولاً ثم كل العقد إذا كانت الشبكة متباعدة حول النقطة"""
+        row, col = math.floor(lat / SNAP_CELL_DEGREES), math.floor(lng / SNAP_CELL_DEGREES)
+        for rings in range(SNAP_MAX_RINGS):
+            if len(self._ring_candidates(row, col, rings)):
+                # حلقة إضافية لأن أقرب عقدة قد تكون في خلية مجاورة لم تُفحص
+                return self._closest(lat, lng, self._ring_candidates(row, col, rings + 1))
+        return self._closest(lat, lng, np.arange(len(self.rank)))
+
+    def _ring_candidates(self, row: int, col: int, rings: int) -> np.ndarray:
+        """العقد في مربع الخلايا حول (row, col) - كل صف من الخلايا نطاق متصل في المفاتيح المرتبة"""
+        candidates = []
+        for d_row in range(-rings, rings + 1):
+            key = (row + d_row) * 40000 + col
+            start = np.searchsorted(self._snap_keys, key - rings, side="left")
+            end = np.searchsorted(self._snap_keys, key + rings, side="right")
+            candidates.append(self._snap_order[start:end])
+        return np.concatenate(candidates)
+
+    def _closest(self, lat: float, lng: float, candidates: np.ndarray) -> int:
+        # تقريب مستوٍ يكفي للمقارنة بين عقد قريبة
+        d_lat = self.lat[candidates] - lat
+        d_lng = (self.lng[candidates] - lng) * math.cos(math.radians(lat))
+        return int(candidates[np.argmin(d_lat * d_lat + d_lng * d_lng)])
+
+    def _search(self, source: int, target: int) -> Optional[Tuple[float, float, List[int]]]:
+        """(ثواني، أمتار، عقد المسار الأصلية) أو None إذا لا يوجد مسار"""
+        if source == target:
+            return 0.0, 0.0, [source]
+        adjacency = (self.fwd, self.bwd)
+        dist = ({source: 0.0}, {target: 0.0})
+        parent = ({source: None}, {target: None})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best, meeting = float("inf"), None
+        while heaps[0] or heaps[1]:
+            side = 0 if heaps[0] and (not heaps[1] or heaps[0][0][0] <= heaps[1][0][0]) else 1
+            d, node = heapq.heappop(heaps[side])
+            if d >= best:
+                # كل ما تبقى في هذا الاتجاه أبعد من أفضل مسار معروف
+                heaps[side].clear()
+                continue
+            if d > dist[side][node]:
+                continue
+            other = dist[1 - side].get(node)
+            if other is not None and d + other < best:
+                best, meeting = d + other, node
+            edges = adjacency[side]
+            for index in range(edges.offsets[node], edges.offsets[node + 1]):
+                neighbor = edges.targets[index]
+                nd = d + edges.seconds[index]
+                if nd < dist[side].get(neighbor, float("inf")):
+                    dist[side][neighbor] = nd
+                    parent[side][neighbor] = (node, index)
+                    heapq.heappush(heaps[side], (nd, neighbor))
+        if meeting is None:
+            return None
+
+        # الوصلات العليا: من البداية حتى نقطة اللقاء ثم منها حتى الوجهة
+        up_edges = []
+        node = meeting
+        while parent[0][node] is not None:
+            previous, index = parent[0][node]
+            up_edges.append((previous, node, self.fwd.meters[index], self.fwd.middle[index]))
+            node = previous
+        up_edges.reverse()
+        node = meeting
+        while parent[1][node] is not None:
+            following, index = parent[1][node]
+            up_edges.append((node, following, self.bwd.meters[index], self.bwd.middle[index]))
+            node = following
+
+        meters = sum(edge[2] for edge in up_edges)
+        nodes = [source]
+        for start, end, _, middle in up_edges:
+            nodes.extend(self._unpack(start, end, middle))
+        return best, meters, nodes
+
+    def _unpack(self, start: int, end: int, middle: int) -> List[int]:
+        """فك الاختصار إلى عقد الطريق الأصلية (بدون عقدة البداية)"""
+        nodes, stack = [], [(start, end, middle)]
+        while stack:
+            a, b, m = stack.pop()
+            if m < 0:
+                nodes.append(b)
+                continue
+            # الترتيب عكسي لأن المكدس LIFO: النصف الأول يُفك أولاً
+            stack.append((m, b, self._middle(m, b)))
+            stack.append((a, m, self._middle(a, m)))
+        return nodes
+
+    def _middle(self, a: int, b: int) -> int:
+        if self.rank[a] < self.rank[b]:
+            return self.fwd.middle[self.fwd.find(a, b)]
+        return self.bwd.middle[self.bwd.find(b, a)]
+
+    def route(self, origin: Tuple[float, float], destination: Tuple[float, float]) -> Optional[dict]:
+        """نفس شكل routing.fetch_route: {"distance_m", "duration_s", "polyline"}"""
+        source = self.nearest_node(*origin)
+        target = self.nearest_node(*destination)
+        if source == target:
+            # النقطتان حول نفس العقدة: طريق داخلي مباشر
+            meters = haversine_km(*origin, *destination) * 1000 * ACCESS_DETOUR_FACTOR
+            return self._as_route(meters, meters / (ACCESS_SPEED_KMH / 3.6), [origin, destination])
+
+        result = self._search(source, target)
+        if result is None:
+            return None
+        seconds, meters, nodes = result
+        access_meters = (
+            haversine_km(*origin, self.lat[source], self.lng[source]) +
+            haversine_km(self.lat[target], self.lng[target], *destination)
+        ) * 1000 * ACCESS_DETOUR_FACTOR
+        points = [origin] + [(float(self.lat[node]), float(self.lng[node])) for node in nodes] + [destination]
+        return self._as_route(meters + access_meters, seconds + access_meters / (ACCESS_SPEED_KMH / 3.6), points)
+
+    @staticmethod
+    def _as_route(meters: float, seconds: float, points: list) -> dict:
+        return {
+            "distance_m": int(round(meters)),
+            "duration_s": int(round(seconds)),
+            "polyline": polyline.encode(points)
+        }
+
+_graph = None
+_lock = threading.Lock()
+
+def get_road_graph() -> RoadGraph:
+    """شبكة الطرق المشتركة - تُحمَّل من الملف عند أول استخدام"""
+    global _graph
+    if _graph is None:
+        with _lock:
+            if _graph is None:
+                _graph = RoadGraph.load()
+    return _graph
@@ -0,0 +1,241 @@
+"""بناء ملف شبكة الطرق المضغوط (npz) مع contraction hierarchies للتوجيه بدون إنترنت
+
+    python -m jeeny_agent.road_graph_builder                     # الشبكة الأساسية من data/jordan_roads.tsv
+    python -m jeeny_agent.road_graph_builder --osm jordan.osm    # شبكة كاملة من ملف OpenStreetMap (XML)
+"""
+import os
+import sys
+import heapq
+import argparse
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Tuple
+import numpy as np
+from jeeny_agent.gazetteer import get_gazetteer, haversine_km
+from jeeny_agent.road_graph import ROAD_GRAPH_PATH
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+BACKBONE_PATH = os.path.join(DATA_DIR, 'jordan_roads.tsv')
+
+# السرعة المتوقعة حسب نوع الطريق (كم/ساعة) - أنواع OSM بالإضافة إلى urban للشبكة الأساسية
+ROAD_SPEEDS_KMH = {
+    "motorway": 90, "motorway_link": 50,
+    "trunk": 80, "trunk_link": 45,
+    "primary": 70, "primary_link": 40,
+    "secondary": 55, "secondary_link": 35,
+    "tertiary": 45, "tertiary_link": 30,
+    "unclassified": 35, "residential": 25, "living_street": 15, "service": 15,
+    "urban": 30,
+}
+
+# طرق الشبكة الأساسية خطوط مستقيمة بين الأماكن - المعامل يقرّبها من طول الطريق الفعلي
+BACKBONE_DETOUR_FACTOR = 1.25
+
+# حد العقد في بحث الشاهد (witness search) - أكبر = اختصارات أقل وبناء أبطأ
+WITNESS_SETTLED_LIMIT = 500
+
+Edge = Tuple[int, int, float, float]  # (من، إلى، ثواني، أمتار)
+
+def _travel_seconds(meters: float, road_class: str) -> float:
+    return meters / (ROAD_SPEEDS_KMH[road_class] / 3.6)
+
+def load_backbone(file_path: str = BACKBONE_PATH) -> Tuple[List[Tuple[float, float]], List[Edge]]:
+    """الطرق الرئيسية بين أماكن الـ gazetteer - كل طريق في الاتجاهين"""
+    gazetteer = get_gazetteer()
+    coords, node_ids, edges = [], {}, []
+
+    def node_for(name: str) -> int:
+        place = gazetteer.lookup(name)
+        if place is None:
+            raise ValueError(f"مكان غير موجود في الـ gazetteer: {name}")
+        if place.name not in node_ids:
+            node_ids[place.name] = len(coords)
+            coords.append((place.lat, place.lng))
+        return node_ids[place.name]
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            road_class, start, end = line.rstrip('\n').split('\t')
+            u, v = node_for(start), node_for(end)
+            meters = haversine_km(*coords[u], *coords[v]) * 1000 * BACKBONE_DETOUR_FACTOR
+            seconds = _travel_seconds(meters, road_class)
+            edges.append((u, v, seconds, meters))
+            edges.append((v, u, seconds, meters))
+    return coords, edges
+
+def _max_speed_kmh(tags: Dict[str, str], highway: str) -> float:
+    try:
+        speed = float(tags.get("maxspeed", "").split()[0])
+    except (ValueError, IndexError):
+        speed = 0
+    return speed if speed > 0 else ROAD_SPEEDS_KMH[highway]
+
+def load_osm(file_path: str) -> Tuple[List[Tuple[float, float]], List[Edge]]:
+    """طرق السيارات من ملف OSM XML مع احترام الاتجاه الواحد والسرعة القصوى"""
+    node_coords, ways = {}, []
+    for _, element in ET.iterparse(file_path, events=("end",)):
+        if element.tag == "node":
+            node_coords[element.get("id")] = (float(element.get("lat")), float(element.get("lon")))
+        elif element.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            if tags.get("highway") in ROAD_SPEEDS_KMH:
+                ways.append(([nd.get("ref") for nd in element.iter("nd")], tags))
+        if element.tag in ("node", "way", "relation"):
+            element.clear()
+
+    coords, node_ids, edges = [], {}, []
+
+    def node_for(osm_id: str) -> int:
+        if osm_id not in node_ids:
+            node_ids[osm_id] = len(coords)
+            coords.append(node_coords[osm_id])
+        return node_ids[osm_id]
+
+    for refs, tags in ways:
+        highway = tags["highway"]
+        oneway = tags.get("oneway", "")
+        implied_oneway = highway == "motorway" or tags.get("junction") == "roundabout"
+        if oneway == "-1":
+            forward, backward = False, True
+        elif oneway in ("yes", "1", "true") or (implied_oneway and oneway != "no"):
+            forward, backward = True, False
+        else:
+            forward, backward = True, True
+        speed_mps = _max_speed_kmh(tags, highway) / 3.6
+        refs = [ref for ref in refs if ref in node_coords]
+        for a, b in zip(refs, refs[1:]):
+            u, v = node_for(a), node_for(b)
+            meters = haversine_km(*coords[u], *coords[v]) * 1000
+            if forward:
+                edges.append((u, v, meters / speed_mps, meters))
+            if backward:
+                edges.append((v, u, meters / speed_mps, meters))
+    print(f"[DEBUG] OSM: {len(ways)} طريق، {len(coords)} عقدة، {len(edges)} وصلة")
+    return coords, edges
+
+def contract(node_count: int, edges: List[Edge]) -> Tuple[List[int], List[dict]]:
+    """ترتيب العقد وإضافة الاختصارات (contraction hierarchies)
+
+    يعيد رتبة كل عقدة، ولكل عقدة {الجار: (ثواني، أمتار، العقدة الوسطى أو -1)} شاملاً الاختصارات.
+    """
+    out_edges = [dict() for _ in range(node_count)]
+    in_edges = [dict() for _ in range(node_count)]
+
+    def add_edge(u: int, v: int, seconds: float, meters: float, middle: int):
+        current = out_edges[u].get(v)
+        if current is None or seconds < current[0]:
+            out_edges[u][v] = in_edges[v][u] = (seconds, meters, middle)
+
+    for u, v, seconds, meters in edges:
+        if u != v:
+            add_edge(u, v, seconds, meters, -1)
+
+    contracted = [False] * node_count
+    deleted_neighbors = [0] * node_count
+
+    def witness_search(source: int, excluded: int, max_seconds: float) -> dict:
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if d > max_seconds or settled >= WITNESS_SETTLED_LIMIT:
+                break
+            settled += 1
+            for v, (seconds, _, _) in out_edges[u].items():
+                if contracted[v] or v == excluded:
+                    continue
+                nd = d + seconds
+                if nd < dist.get(v, float("inf")):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return dist
+
+    def shortcuts_for(v: int) -> Tuple[list, int]:
+        incoming = [(u, edge) for u, edge in in_edges[v].items() if not contracted[u]]
+        outgoing = [(w, edge) for w, edge in out_edges[v].items() if not contracted[w]]
+        shortcuts = []
+        for u, (in_seconds, in_meters, _) in incoming:
+            targets = [(w, edge) for w, edge in outgoing if w != u]
+            if not targets:
+                continue
+            dist = witness_search(u, v, in_seconds + max(edge[0] for _, edge in targets))
+            for w, (out_seconds, out_meters, _) in targets:
+                via = in_seconds + out_seconds
+                if dist.get(w, float("inf")) > via:
+                    shortcuts.append((u, w, via, in_meters + out_meters, v))
+        return shortcuts, len(incoming) + len(outgoing)
+
+    def priority(v: int) -> Tuple[int, list]:
+        shortcuts, degree = shortcuts_for(v)
+        return len(shortcuts) - degree + deleted_neighbors[v], shortcuts
+
+    heap = [(priority(v)[0], v) for v in range(node_count)]
+    heapq.heapify(heap)
+    rank = [0] * node_count
+    order = 0
+    while heap:
+        _, v = heapq.heappop(heap)
+        # تحديث الأولوية بكسل: إذا ساءت العقدة منذ حسابها تعود للطابور
+        new_priority, shortcuts = priority(v)
+        if heap and new_priority > heap[0][0]:
+            heapq.heappush(heap, (new_priority, v))
+            continue
+        for shortcut in shortcuts:
+            add_edge(*shortcut)
+        contracted[v] = True
+        rank[v] = order
+        order += 1
+        for neighbor in set(in_edges[v]) | set(out_edges[v]):
+            if not contracted[neighbor]:
+                deleted_neighbors[neighbor] += 1
+        if order % 10000 == 0:
+            print(f"[DEBUG] contraction: {order}/{node_count}")
+    return rank, out_edges
+
+def write_graph(file_path: str, coords: List[Tuple[float, float]], rank: List[int], out_edges: List[dict]):
+    """كل وصلة تُخزَّن مرة واحدة عند العقدة الأدنى رتبة: fwd للصاعدة من u، وbwd للصاعدة نحو v"""
+    node_count = len(coords)
+    adjacency = {"fwd": [[] for _ in range(node_count)], "bwd": [[] for _ in range(node_count)]}
+    for u, neighbors in enumerate(out_edges):
+        for v, (seconds, meters, middle) in neighbors.items():
+            if rank[u] < rank[v]:
+                adjacency["fwd"][u].append((v, seconds, meters, middle))
+            else:
+                adjacency["bwd"][v].append((u, seconds, meters, middle))
+
+    arrays = {
+        "lat": np.array([lat for lat, _ in coords], dtype=np.float32),
+        "lng": np.array([lng for _, lng in coords], dtype=np.float32),
+        "rank": np.array(rank, dtype=np.int32),
+    }
+    for name, lists in adjacency.items():
+        offsets = np.zeros(node_count + 1, dtype=np.int32)
+        offsets[1:] = np.cumsum([len(items) for items in lists])
+        flat = [item for items in lists for item in items]
+        arrays[f"{name}_offsets"] = offsets
+        arrays[f"{name}_targets"] = np.array([item[0] for item in flat], dtype=np.int32)
+        arrays[f"{name}_seconds"] = np.array([item[1] for item in flat], dtype=np.float32)
+        arrays[f"{name}_meters"] = np.array([item[2] for item in flat], dtype=np.float32)
+        arrays[f"{name}_middle"] = np.array([item[3] for item in flat], dtype=np.int32)
+
+    with open(file_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    edge_count = len(arrays["fwd_targets"]) + len(arrays["bwd_targets"])
+    print(f"[نجح] كتابة {node_count} عقدة و {edge_count} وصلة إلى: {file_path}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="بناء شبكة الطرق للتوجيه بدون إنترنت")
+    parser.add_argument("--osm", help="ملف OpenStreetMap (XML) بدل الشبكة الأساسية المضمنة")
+    parser.add_argument("--out", default=ROAD_GRAPH_PATH, help="مسار ملف الشبكة الناتج (npz)")
+    args = parser.parse_args(argv)
+
+    coords, edges = load_osm(args.osm) if args.osm else load_backbone()
+    rank, out_edges = contract(len(coords), edges)
+    write_graph(args.out, coords, rank, out_edges)
+
+if __name__ == "__main__":
+    sys.exit(main())
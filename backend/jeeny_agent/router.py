@@ -0,0 +1,61 @@
+import re
+from typing import Optional
+from jeeny_agent.car_types import detect_car_type
+from jeeny_agent.normalization import normalize_arabic
+from jeeny_agent.rule_extractor import (
+    extract_locations_rules,
+    detect_modification_rules,
+    RULE_CONFIDENCE_THRESHOLD,
+)
+
+# أسماء الأدوات التي يمكن توجيه الرسالة إليها مباشرة
+GET_DIRECTIONS = "get_directions_arabic"
+CHANGE_CAR_TYPE = "change_car_type"
+MODIFY_LOCATION = "modify_location"
+
+# أفعال تغيير صريحة لنوع السيارة في رحلة موجودة - "بدي"/"بدنا" وحدها طلب عام وليست تغييراً
+_CAR_CHANGE_WORDS = ["غير", "اغير", "غيرها", "بدل", "بدلها", "حول", "حولها", "اعملها", "خليها", "رجعها"]
+_CAR_CHANGE_RE = re.compile(
+    r'(?<!\S)(?:' + "|".join(normalize_arabic(word) for word in _CAR_CHANGE_WORDS) + r')(?!\S)'
+)
+
+# الأسئلة ("كم الفرق بين العادية والVIP؟") يجيب عليها الـ Agent ولا تُنفَّذ كأوامر
+_QUESTION_WORDS = ["شو", "ايش", "كم", "قديش", "اديش", "كيف", "ليش", "لماذا", "ماذا", "وين", "متى", "هل", "اعرف", "افهم"]
+_QUESTION_RE = re.compile(
+    r'(?<!\S)(?:' + "|".join(normalize_arabic(word) for word in _QUESTION_WORDS) + r')(?!\S)'
+)
+
+def _is_question(user_text: str, text: str) -> bool:
+    return "؟" in user_text or "?" in user_text or bool(_QUESTION_RE.search(text))
+
+def route_intent(user_text: str, has_trip: bool = False) -> Optional[str]:
+    """توجيه الرسائل الواضحة إلى أداة مباشرة بدون المرور بحلقة الـ Agent
+
+    ترجع اسم الأداة، أو None إذا كانت الرسالة غير واضحة ويجب أن يتعامل معها الـ Agent.
+    """
+    if not user_text or not user_text.strip():
+        return None
+
+    text = normalize_arabic(user_text)
+    if _is_question(user_text, text):
+        return None
+
+    trip = extract_locations_rules(user_text)
+
+    if has_trip:
+        # "غير الوجهة للسلط"، "خلاص صير من الزرقاء لعمان"
+        modification = detect_modification_rules(user_text)
+        if modification["confidence"] >= RULE_CONFIDENCE_THRESHOLD:
+            return MODIFY_LOCATION
+
+        # "غير نوع السيارة لـ VIP"، "اعملها تاكسي" - بدون مواقع جديدة
+        if (detect_car_type(user_text, include_default=True)
+                and _CAR_CHANGE_RE.search(text)
+                and trip["confidence"] == 0.0):
+            return CHANGE_CAR_TYPE
+
+    # طلب رحلة جديدة بصيغة "من X إلى Y"
+    if trip["confidence"] >= RULE_CONFIDENCE_THRESHOLD:
+        return GET_DIRECTIONS
+
+    return None
@@ -1,48 +1,140 @@
 import os
+from datetime import datetime
+from typing import List, Optional
 from googlemaps import Client
 from jeeny_agent.models import TripInfo, Location
+from jeeny_agent.singleflight import SingleFlight
+from jeeny_agent.cache import PersistentCache
+from jeeny_agent.fares import get_fare_engine
+from jeeny_agent.road_graph import get_road_graph
+from jeeny_agent import geohash
 
 gmaps = Client(key=os.getenv("GOOGLE_API_KEY"))
 
-BASE_FARE = 0.5
-RATE_PER_KM = 0.25
-RATE_PER_MIN = 0.05
+# مصدر المسارات: google (Directions و Distance Matrix) أو local (شبكة الطرق المضمنة بدون إنترنت)
+ROUTING_BACKEND = os.getenv("JEENY_ROUTING_BACKEND", "google")
+
+# كاش المسارات المشترك بين الحساب والخريطة: النقاط تُقرّب لخلية geohash (≈ 38م × 19م)
+# والوقت يُقسم لفترات لأن مدة الرحلة تتغير بين الذروة والليل
+ROUTE_GEOHASH_PRECISION = 8
+ROUTE_TIME_BUCKET_HOURS = 3
+route_cache = PersistentCache("directions", max_entries=20000, ttl_seconds=7 * 24 * 3600)
+# مدد القيادة من Distance Matrix (بدون polyline) بنفس مفاتيح كاش المسارات
+eta_cache = PersistentCache("distance_matrix", max_entries=50000, ttl_seconds=7 * 24 * 3600)
+# طلبات المسار المتزامنة لنفس المفتاح تشترك في استدعاء واحد
+directions_flight = SingleFlight("directions")
+
+def _as_latlng(point) -> tuple:
+    if isinstance(point, (tuple, list)):
+        return float(point[0]), float(point[1])
+    lat, lng = str(point).split(",")
+    return float(lat), float(lng)
+
+def _route_key(origin: tuple, destination: tuple, mode: str) -> str:
+    bucket = datetime.now().hour // ROUTE_TIME_BUCKET_HOURS
+    return "|".join([
+        geohash.encode(*origin, ROUTE_GEOHASH_PRECISION),
+        geohash.encode(*destination, ROUTE_GEOHASH_PRECISION),
+        mode,
+        str(bucket)
+    ])
+
+def fetch_route(origin, destination, mode: str = "driving") -> Optional[dict]:
+    """مسار واحد: {"distance_m", "duration_s", "polyline"} من الكاش أو من Google، أو None إذا لا يوجد مسار
+
+    النقاط تُقبل كـ (lat, lng) أو نص "lat,lng".
+    """
+    origin, destination = _as_latlng(origin), _as_latlng(destination)
+    if ROUTING_BACKEND == "local":
+        # الشبكة المحلية أسرع من الكاش - لا حاجة لتخزين نتائجها
+        return get_road_graph().route(origin, destination)
+    key = _route_key(origin, destination, mode)
+    cached = route_cache.get(key)
+    if cached is not None:
+        print(f"[DEBUG] المسار من الكاش: {key}")
+        return cached
+    return directions_flight.do(key, _fetch_and_store_route, key, origin, destination, mode)
+
+def _fetch_and_store_route(key: str, origin: tuple, destination: tuple, mode: str) -> Optional[dict]:
+    directions = gmaps.directions(origin, destination, mode=mode, language="ar", region="jo")
+    if not directions:
+        return None
+    leg = directions[0]['legs'][0]
+    route = {
+        "distance_m": leg['distance']['value'],
+        "duration_s": leg['duration']['value'],
+        "polyline": directions[0]['overview_polyline']['points']
+    }
+    route_cache.set(key, route)
+    return route
+
+def fetch_etas(origins: list, destination, mode: str = "driving") -> List[Optional[dict]]:
+    """{"distance_m", "duration_s"} من كل نقطة بداية إلى وجهة واحدة (None إذا لا يوجد مسار)
+
+    النقاط الموجودة في الكاش (أو في كاش المسارات) لا تُطلب، والباقي في طلب Distance Matrix واحد.
+    """
+    destination = _as_latlng(destination)
+    origins = [_as_latlng(origin) for origin in origins]
+    if ROUTING_BACKEND == "local":
+        routes = [get_road_graph().route(origin, destination) for origin in origins]
+        return [route and {"distance_m": route["distance_m"], "duration_s": route["duration_s"]} for route in routes]
+    keys = [_route_key(origin, destination, mode) for origin in origins]
+    results, missing = [], []
+    for index, key in enumerate(keys):
+        cached = eta_cache.get(key) or route_cache.get(key)
+        if cached is None:
+            missing.append(index)
+            results.append(None)
+        else:
+            results.append({"distance_m": cached["distance_m"], "duration_s": cached["duration_s"]})
+    if not missing:
+        print(f"[DEBUG] مدد القيادة لـ {len(origins)} نقطة من الكاش")
+        return results
+
+    print(f"[DEBUG] طلب Distance Matrix واحد لـ {len(missing)} من {len(origins)} نقطة")
+    response = gmaps.distance_matrix([origins[index] for index in missing], [destination],
+                                     mode=mode, language="ar", region="jo")
+    for index, row in zip(missing, response.get("rows", [])):
+        element = row["elements"][0]
+        if element.get("status") == "OK":
+            eta = {"distance_m": element["distance"]["value"], "duration_s": element["duration"]["value"]}
+            eta_cache.set(keys[index], eta)
+            results[index] = eta
+    return results
+
+def format_distance(meters: float) -> str:
+    if meters < 1000:
+        return f"{int(round(meters))} م"
+    return f"{meters / 1000:.1f} كم"
+
+def format_duration(seconds: float) -> str:
+    minutes = max(1, int(round(seconds / 60)))
+    if minutes < 60:
+        return f"{minutes} دقيقة"
+    return f"{minutes // 60} ساعة {minutes % 60} دقيقة"
 
 def compute_trip(start: Location, end: Location, car_type: str = "عادية") -> TripInfo:
     # إضافة debug لمعرفة نوع السيارة الواصل
     print(f"[DEBUG] compute_trip received car_type: '{car_type}'")
+    return price_trip(trip_route(start, end), car_type)
+
+def trip_route(start: Location, end: Location) -> dict:
+    """مسار الرحلة الخام (distance_m, duration_s, polyline) - يُحفظ في جلسة الرحلة لإعادة التسعير"""
+    route = fetch_route((start.lat, start.lng), (end.lat, end.lng), mode="driving")
+    if route is None:
+        raise ValueError(f"لا يوجد مسار بالسيارة من {start.name} إلى {end.name}")
+    return route
+
+def price_trip(route: dict, car_type: str = "عادية") -> TripInfo:
+    """تسعير مسار محسوب مسبقاً بدون أي طلب خارجي"""
+    distance = format_distance(route["distance_m"])
+    duration = format_duration(route["duration_s"])
+    dist_km = route["distance_m"] / 1000
+    dur_min = route["duration_s"] / 60
     
-    directions = gmaps.directions((start.lat, start.lng), (end.lat, end.lng), mode="driving")
-    leg = directions[0]['legs'][0]
-    distance = leg['distance']['text']
-    duration = leg['duration']['text']
-    dist_km = leg['distance']['value'] / 1000
-    dur_min = leg['duration']['value'] / 60
-    
-    # حساب السعر الأساسي
-    base_cost = BASE_FARE + dist_km * RATE_PER_KM + dur_min * RATE_PER_MIN
-    print(f"[DEBUG] Base cost: {base_cost}")
-    
-    # تحديد مضاعف السعر بناءً على نوع السيارة
-    car_multipliers = {
-        "عادية": 1.0,
-        "تاكسي": 1.15,
-        "عائلية": 1.3,
-        "VIP": 1.5
-    }
-    
-    # التأكد من نوع السيارة وطباعة تفاصيل التصحيح
-    mult = car_multipliers.get(car_type, 1.0)
-    print(f"[DEBUG] Car type: '{car_type}', Multiplier: {mult}")
-    
-    # إذا لم نجد النوع، استخدم القيمة الافتراضية مع تحذير
-    if car_type not in car_multipliers:
-        print(f"[WARNING] Unknown car type '{car_type}', using default multiplier 1.0")
-        mult = 1.0
-    
-    # حساب التكلفة النهائية
-    final_cost = round(base_cost * mult, 2)
-    print(f"[DEBUG] Final cost: {base_cost} * {mult} = {final_cost}")
+    # التسعير من جدول التعرفة المشترك مع الخريطة
+    final_cost = get_fare_engine().fare(dist_km, dur_min, car_type)
+    print(f"[DEBUG] Car type: '{car_type}', Final cost: {final_cost}")
     
     return TripInfo(
         distance=distance, 
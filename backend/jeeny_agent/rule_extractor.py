@@ -0,0 +1,219 @@
+import re
+from typing import Iterable, Optional
+from jeeny_agent.normalization import normalize_arabic
+from jeeny_agent.gazetteer import get_gazetteer
+
+# الحد الأدنى للثقة حتى نعتمد على النتيجة بدون استدعاء النموذج
+RULE_CONFIDENCE_THRESHOLD = 0.85
+
+# كلمات الربط بين البداية والوجهة (بعد التوحيد)
+_CONNECTOR_WORDS = {"الي", "لـ", "ل", "علي", "ع", "عـ", "لعند", "لحد"}
+
+# كلمات تنهي اسم المكان (مجاملات، نوع السيارة، الوقت...)
+_STOP_WORDS = {
+    "يا", "لو", "لوسمحت", "بسرعه", "سياره", "بسياره", "تاكسي", "بتاكسي", "تكسي", "بتكسي",
+    "vip", "بvip", "عاديه", "عايليه", "فان", "هلا", "هلق", "هسا", "هسه", "الحين", "اليوم",
+    "بكرا", "بكره", "الصبح", "المسا", "الساعه", "please", "plz", "اذا", "ولو", "مع", "بدي", "وبدي",
+    "الله", "حبيبي", "حلو", "بليز", "عشان", "لانه", "ضروري"
+}
+
+# أدوات الاستفهام: الرسالة سؤال ("من وين بتطلع لعمان؟") وليست طلب رحلة - رفض كامل بدون تخمين
+_INTERROGATIVES = {"وين", "لوين", "منين", "شو", "ايش", "كيف", "ليش", "قديش", "اديش", "كم", "متي", "هل"}
+
+# كلمات تسبق اسم المكان ولا تنتمي له ("من عند الدوار السابع لعند مكة مول")
+_PLACE_PREFIXES = {"عند", "لعند"}
+
+# كلمات تدل أن النص اسم مكان - بدونها وبدون تطابق في الـ gazetteer تنخفض الثقة
+_PLACE_NOUNS = {
+    "دوار", "شارع", "طريق", "اشاره", "جسر", "نفق", "مول", "سوق", "مجمع", "جامعه", "كليه", "مدرسه",
+    "مستشفي", "مركز", "مطار", "محطه", "جامع", "مسجد", "كنيسه", "فندق", "مطعم", "كافيه", "بنك", "وزاره",
+    "حي", "جبل", "ضاحيه", "مدينه", "منطقه", "اسكان", "دار", "بيت", "بيتي", "شغل", "شغلي", "مكتب", "عمل"
+}
+_UNKNOWN_SPAN_PENALTY = 0.2
+
+# أفعال التعديل
+_CHANGE_VERBS = r'(?<!\S)(?:غير|اغير|بغير|اير|عدل|اعدل|بعدل|صير|تصير|ليصير|لتصير|خلي|خليها|خليه|بدل)(?!\S)'
+_END_WORDS = r'(?:الوجهه|وجهتي|الوجهه الجديده|النهايه|المكان|الوصول|الهدف)'
+_START_WORDS = r'(?:البدايه|نقطه البدايه|مكاني|موقعي|نقطه الانطلاق|الانطلاق)'
+
+_PUNCTUATION_RE = re.compile(r'[\.,،!?؟؛:]+')
+
+def _tokens(text: str) -> list:
+    """تقسيم النص إلى أزواج (الكلمة الأصلية، الكلمة بعد التوحيد) - نطابق على الموحدة ونعيد الأصلية"""
+    pairs = []
+    for token in _PUNCTUATION_RE.sub(" ", str(text or "")).split():
+        normalized = normalize_arabic(token)
+        if normalized:
+            pairs.append((token, normalized))
+    return pairs
+
+def _strip_connector_prefix(token: str) -> Optional[str]:
+    """إذا كانت الكلمة تبدأ بحرف ربط ملتصق (لعمان، للمطار، عالجامعة) نعيد الاسم بدونه"""
+    if token.startswith("لـ") and len(token) > 2:
+        return token[2:]
+    if token.startswith("عـ") and len(token) > 2:
+        return token[2:]
+    if token.startswith("لل") and len(token) > 3:
+        return "ال" + token[2:]
+    if token.startswith("عال") and len(token) > 4:
+        return token[1:]
+    if token.startswith("ل") and not token.startswith(("ال", "لو")) and len(token) > 2:
+        return token[1:]
+    return None
+
+def _place_length(pairs: list) -> int:
+    """عدد الكلمات المتتالية التي تشكل اسم المكان حتى أول كلمة توقف"""
+    length = 0
+    for _, normalized in pairs:
+        if normalized in _STOP_WORDS or normalized == "من":
+            break
+        length += 1
+    return length
+
+def _is_interrogative(normalized: str) -> bool:
+    return normalized in _INTERROGATIVES or _strip_connector_prefix(normalized) in _INTERROGATIVES
+
+def _drop_place_prefix(pairs: list) -> list:
+    while pairs and pairs[0][1] in _PLACE_PREFIXES:
+        pairs = pairs[1:]
+    return pairs
+
+def _has_place_noun(pairs: list) -> bool:
+    for _, normalized in pairs:
+        bare = normalized[2:] if normalized.startswith("ال") else normalized
+        if normalized in _PLACE_NOUNS or bare in _PLACE_NOUNS:
+            return True
+    return False
+
+def _span_confidence(pairs: list, saved_keys: set) -> float:
+    """ثقة اسم مكان واحد: الأسماء القصيرة أو المحفوظة أو المعروفة أوضح"""
+    if not pairs:
+        return 0.0
+    name = " ".join(normalized for _, normalized in pairs)
+    if name in saved_keys:
+        return 1.0
+    if len(pairs) <= 3:
+        confidence = 0.95
+    elif len(pairs) <= 5:
+        confidence = 0.8
+    else:
+        confidence = 0.6
+    if not _has_place_noun(pairs) and get_gazetteer().lookup(name) is None:
+        confidence -= _UNKNOWN_SPAN_PENALTY
+    return confidence
+
+def _text(pairs: list) -> str:
+    return " ".join(original for original, _ in pairs)
+
+def _strip_pair(pair: tuple) -> Optional[tuple]:
+    original, normalized = pair
+    stripped = _strip_connector_prefix(normalized)
+    if stripped is None:
+        return None
+    return (_strip_connector_prefix(original) or original, stripped)
+
+def _split_from_to(pairs: list, saved_keys: set) -> Optional[dict]:
+    """تحليل نمط "من X إلى Y" مع دعم الأسماء متعددة الكلمات وحروف الربط الملتصقة"""
+    normalized_tokens = [normalized for _, normalized in pairs]
+    if "من" not in normalized_tokens or any(_is_interrogative(token) for token in normalized_tokens):
+        return None
+    from_index = normalized_tokens.index("من")
+    rest = _drop_place_prefix(pairs[from_index + 1:])
+
+    for i in range(1, len(rest)):
+        start_span = rest[:i]
+        if _place_length(start_span) != i:
+            break
+        if rest[i][1] in _CONNECTOR_WORDS:
+            after = rest[i + 1:]
+            attached = False
+        else:
+            stripped = _strip_pair(rest[i])
+            if stripped is None:
+                continue
+            after = [stripped] + rest[i + 1:]
+            attached = True
+        after = _drop_place_prefix(after)
+        end_span = after[:_place_length(after)]
+        if not end_span:
+            continue
+
+        confidence = min(_span_confidence(start_span, saved_keys), _span_confidence(end_span, saved_keys))
+        if attached:
+            confidence -= 0.05
+        if normalized_tokens.count("من") > 1:
+            confidence -= 0.2
+        return {
+            "start_location": _text(start_span),
+            "end_location": _text(end_span),
+            "confidence": round(max(confidence, 0.0), 2)
+        }
+    return None
+
+def _saved_keys(saved_names: Iterable[str]) -> set:
+    return {normalize_arabic(name) for name in saved_names or []}
+
+def extract_locations_rules(user_text: str, saved_names: Iterable[str] = ()) -> dict:
+    """استخراج البداية والوجهة بالقواعد فقط مع درجة ثقة بين 0 و 1"""
+    result = _split_from_to(_tokens(user_text), _saved_keys(saved_names))
+    if result:
+        return result
+    return {"start_location": "", "end_location": "", "confidence": 0.0}
+
+_END_CHANGE_RE = re.compile(_CHANGE_VERBS + r'\s+' + _END_WORDS + r'\s+(.+)$')
+_START_CHANGE_RE = re.compile(_CHANGE_VERBS + r'\s+' + _START_WORDS + r'\s+(.+)$')
+_MY_PLACE_RE = re.compile(r'(?:مكاني|موقعي)\s+(?:ليصير|لتصير|يصير|تصير)\s+من\s+(.+)$')
+_REPLACE_RE = re.compile(r'اغير\s+\S+\s+و\s*تصير\s+(.+)$')
+_LEADING_WORDS = _CONNECTOR_WORDS | _PLACE_PREFIXES | {"ليصير", "لتصير", "يصير", "تصير", "من", "تكون", "لتكون"}
+
+def _place_after(pairs: list, saved_keys: set) -> tuple:
+    """اسم المكان بعد فعل التعديل مع حذف حروف الربط مثل "ل" و"إلى" و"ليصير من" """
+    while pairs and pairs[0][1] in _LEADING_WORDS:
+        pairs = pairs[1:]
+    if pairs:
+        stripped = _strip_pair(pairs[0])
+        if stripped is not None:
+            pairs = [stripped] + pairs[1:]
+    span = pairs[:_place_length(pairs)]
+    return _text(span), _span_confidence(span, saved_keys)
+
+def detect_modification_rules(user_text: str, saved_names: Iterable[str] = ()) -> dict:
+    """تحديد نوع التعديل (البداية/النهاية/كليهما) والموقع الجديد بالقواعد مع درجة ثقة"""
+    saved_keys = _saved_keys(saved_names)
+    pairs = _tokens(user_text)
+    text = " ".join(normalized for _, normalized in pairs)
+    has_change_verb = re.search(_CHANGE_VERBS, text) is not None
+
+    # "خلاص صير من الزرقاء لعمان" / "بدي اعدل الرحلة لتصير من السلط الى الدار"
+    both = _split_from_to(pairs, saved_keys)
+    if both and has_change_verb:
+        return {
+            "modification_type": "كليهما",
+            "new_start_location": both["start_location"],
+            "new_end_location": both["end_location"],
+            "confidence": both["confidence"]
+        }
+
+    for pattern, mod_type in ((_MY_PLACE_RE, "البداية"), (_REPLACE_RE, "البداية"),
+                              (_START_CHANGE_RE, "البداية"), (_END_CHANGE_RE, "النهاية")):
+        match = pattern.search(text)
+        if not match:
+            continue
+        # تحويل موضع الحرف إلى رقم الكلمة لاسترجاع النص الأصلي
+        token_index = text[:match.start(1)].count(" ")
+        place, confidence = _place_after(pairs[token_index:], saved_keys)
+        if not place:
+            continue
+        return {
+            "modification_type": mod_type,
+            "new_start_location": place if mod_type == "البداية" else None,
+            "new_end_location": place if mod_type == "النهاية" else None,
+            "confidence": round(confidence * 0.95, 2)
+        }
+
+    return {
+        "modification_type": None,
+        "new_start_location": None,
+        "new_end_location": None,
+        "confidence": 0.0
+    }
@@ -0,0 +1,148 @@
+import os
+import re
+import json
+import threading
+from typing import Optional
+from rapidfuzz import fuzz, process
+from jeeny_agent.normalization import normalize_arabic
+from jeeny_agent import geohash
+from jeeny_agent.gazetteer import haversine_km
+
+_LATLNG_RE = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+# دقة مفتاح الإحداثيات في الفهرس العكسي (6 منازل عشرية ≈ 10 سم)
+COORDINATE_PRECISION = 6
+# أقصى بعد لاعتبار إحداثيات قريبة هي نفس المكان المحفوظ
+SAVED_MATCH_RADIUS_M = 50
+
+def coordinate_key(value) -> Optional[tuple]:
+    """تحويل نص الإحداثيات إلى مفتاح ثابت (lat, lng) مقرب، أو None إذا لم يكن إحداثيات"""
+    match = _LATLNG_RE.match(str(value or ""))
+    if not match:
+        return None
+    return (round(float(match.group(1)), COORDINATE_PRECISION),
+            round(float(match.group(2)), COORDINATE_PRECISION))
+
+def _ngrams(text: str, n: int = 3) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+class SavedLocationsIndex(dict):
+    """قاموس الأماكن المحفوظة (الاسم -> القيمة) مع فهارس للبحث السريع
+
+    - فهرس بالاسم بعد التوحيد: O(1)
+    - فهرس n-gram للمطابقة الجزئية: O(k) حسب عدد المرشحين
+    - فهرس عكسي من الإحداثيات إلى الاسم: O(1)
+    - فهرس geohash للإحداثيات القريبة (ليس شرطاً أن يكون النص مطابقاً تماماً)
+    """
+
+    def __init__(self, data: Optional[dict] = None):
+        super().__init__(data or {})
+        self.by_normalized = {}
+        self.by_coordinates = {}
+        self.by_geohash = {}
+        self._grams = {}
+        self._short_keys = []
+        for name, value in self.items():
+            key = normalize_arabic(name)
+            if not key:
+                continue
+            self.by_normalized.setdefault(key, name)
+            coords = coordinate_key(value)
+            if coords is not None:
+                self.by_coordinates.setdefault(coords, name)
+                self.by_geohash.setdefault(geohash.encode(*coords), []).append((coords, name))
+            if len(key) < 3:
+                self._short_keys.append(key)
+            for gram in _ngrams(key):
+                self._grams.setdefault(gram, set()).add(key)
+
+    def lookup(self, place: str) -> Optional[str]:
+        """إرجاع الاسم المحفوظ المطابق تماماً بعد التوحيد"""
+        return self.by_normalized.get(normalize_arabic(place))
+
+    def partial_matches(self, place: str) -> list:
+        """الأسماء المحفوظة التي تحتوي النص أو يحتويها النص (بعد التوحيد)"""
+        key = normalize_arabic(place)
+        if not key:
+            return []
+        grams = _ngrams(key)
+        candidates = set(self._short_keys)
+        for gram in grams:
+            candidates |= self._grams.get(gram, set())
+        if not grams:
+            # نص أقصر من 3 أحرف - نبحث عنه داخل الأسماء
+            candidates = set(self.by_normalized)
+        matches = [c for c in candidates if c in key or key in c]
+        # الأطول أولاً لأنه أكثر تحديداً
+        matches.sort(key=len, reverse=True)
+        return [self.by_normalized[c] for c in matches]
+
+    def fuzzy_matches(self, place: str, limit: int = 5) -> list:
+        """أقرب الأسماء المحفوظة حسب token-set ratio على الأسماء الموحدة: [(الاسم، الدرجة)]"""
+        key = normalize_arabic(place)
+        if not key or not self.by_normalized:
+            return []
+        results = process.extract(key, list(self.by_normalized), scorer=fuzz.token_set_ratio, limit=limit)
+        return [(self.by_normalized[choice], score) for choice, score, _ in results]
+
+    def name_for_coordinates(self, latlng) -> Optional[str]:
+        coords = coordinate_key(latlng)
+        if coords is None:
+            return None
+        return self.by_coordinates.get(coords)
+
+    def name_near(self, lat: float, lng: float, max_m: float = SAVED_MATCH_RADIUS_M) -> Optional[str]:
+        """أقرب مكان محفوظ ضمن max_m متر - يفحص خلية الـ geohash وجيرانها فقط"""
+        cell = geohash.encode(lat, lng)
+        best, best_m = None, max_m
+        for key in [cell] + geohash.neighbors(cell):
+            for (place_lat, place_lng), name in self.by_geohash.get(key, ()):
+                distance_m = haversine_km(lat, lng, place_lat, place_lng) * 1000
+                if distance_m <= best_m:
+                    best, best_m = name, distance_m
+        return best
+
+class SavedLocationsStore:
+    """مخزن الأماكن المحفوظة في الذاكرة - يُحمَّل مرة واحدة ويُعاد تحميله فقط عند تغيّر الملف"""
+
+    def __init__(self, file_path: str):
+        self.file_path = os.path.abspath(file_path)
+        self._index = SavedLocationsIndex()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _file_version(self) -> str:
+        try:
+            stat = os.stat(self.file_path)
+            return f"{stat.st_mtime_ns}:{stat.st_size}"
+        except OSError:
+            return "missing"
+
+    @property
+    def version(self) -> str:
+        return self._file_version()
+
+    def get(self) -> SavedLocationsIndex:
+        """إرجاع الفهرس الحالي مع إعادة التحميل إذا تغير الملف"""
+        version = self._file_version()
+        if version == self._version:
+            return self._index
+        with self._lock:
+            if version != self._version:
+                self._index = self._load()
+                self._version = version
+        return self._index
+
+    def _load(self) -> SavedLocationsIndex:
+        print(f"[DEBUG] تحميل الأماكن المحفوظة من: {self.file_path}")
+        if not os.path.exists(self.file_path):
+            print(f"[خطأ] الملف غير موجود: {self.file_path}")
+            return SavedLocationsIndex()
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                saved_data = json.load(f)
+            print(f"[نجح] تم تحميل {len(saved_data)} موقع محفوظ")
+            return SavedLocationsIndex(saved_data)
+        except Exception as e:
+            print(f"[خطأ] تعذر تحميل ملف الأماكن المحفوظة: {e}")
+            return SavedLocationsIndex()
@@ -0,0 +1,181 @@
+import os
+import json
+import math
+import threading
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# حدود الأردن (lat, lng) بدقة ~100م - تشمل شمال الغور والباقورة، وتستثني الضفة الغربية وإيلات
+JORDAN_BORDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jordan_border.tsv')
+
+# حجم خلية الـ raster بالدرجات (≈ 2 كم) - الخلايا على الحدود فقط تحتاج الفحص الدقيق
+RASTER_CELL_DEGREES = 0.02
+
+# ملف JSON اختياري بمناطق خدمة إضافية: {"اسم المنطقة": [[lat, lng], ...]}
+SERVICE_AREAS_PATH = os.getenv("JEENY_SERVICE_AREAS")
+
+_OUTSIDE, _INSIDE, _BOUNDARY = 0, 1, 2
+
+def point_in_polygon(lat: float, lng: float, polygon: Sequence[Tuple[float, float]]) -> bool:
+    """فحص دقيق بطريقة ray casting"""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lng_i = polygon[i]
+        lat_j, lng_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat):
+            cross_lng = lng_i + (lat - lat_i) * (lng_j - lng_i) / (lat_j - lat_i)
+            if lng < cross_lng:
+                inside = not inside
+        j = i
+    return inside
+
+class ServiceArea:
+    """منطقة (مضلع) مع raster محسوب مسبقاً: الفحص O(1) والفحص الدقيق فقط لخلايا الحدود"""
+
+    def __init__(self, name: str, polygon: Sequence[Tuple[float, float]], cell_degrees: float = RASTER_CELL_DEGREES):
+        self.name = name
+        self.polygon = [(float(lat), float(lng)) for lat, lng in polygon]
+        self.cell = cell_degrees
+        lats = [lat for lat, _ in self.polygon]
+        lngs = [lng for _, lng in self.polygon]
+        self.min_lat, self.max_lat = min(lats), max(lats)
+        self.min_lng, self.max_lng = min(lngs), max(lngs)
+        self.rows = int(math.ceil((self.max_lat - self.min_lat) / self.cell)) + 1
+        self.cols = int(math.ceil((self.max_lng - self.min_lng) / self.cell)) + 1
+        self.raster = self._build_raster()
+
+    def _build_raster(self) -> bytearray:
+        raster = bytearray(self.rows * self.cols)
+        # الداخل: لكل صف نحسب نقاط تقاطع الأضلاع مع خط منتصف الصف ونملأ ما بينها
+        for row in range(self.rows):
+            lat = self.min_lat + (row + 0.5) * self.cell
+            crossings = []
+            for (lat_i, lng_i), (lat_j, lng_j) in self._edges():
+                if (lat_i > lat) != (lat_j > lat):
+                    crossings.append(lng_i + (lat - lat_i) * (lng_j - lng_i) / (lat_j - lat_i))
+            crossings.sort()
+            for start, end in zip(crossings[0::2], crossings[1::2]):
+                first = max(0, int(math.ceil((start - self.min_lng) / self.cell - 0.5)))
+                last = min(self.cols - 1, int(math.floor((end - self.min_lng) / self.cell - 0.5)))
+                for col in range(first, last + 1):
+                    raster[row * self.cols + col] = _INSIDE
+        # الحدود: كل خلية يمر بها ضلع (مع جيرانها احتياطاً) تُفحص بدقة عند الاستعلام
+        for (lat_i, lng_i), (lat_j, lng_j) in self._edges():
+            steps = max(1, int(math.ceil(max(abs(lat_j - lat_i), abs(lng_j - lng_i)) / (self.cell / 2))))
+            for step in range(steps + 1):
+                t = step / steps
+                row, col = self._cell_of(lat_i + t * (lat_j - lat_i), lng_i + t * (lng_j - lng_i))
+                for d_row in (-1, 0, 1):
+                    for d_col in (-1, 0, 1):
+                        r, c = row + d_row, col + d_col
+                        if 0 <= r < self.rows and 0 <= c < self.cols:
+                            raster[r * self.cols + c] = _BOUNDARY
+        return raster
+
+    def _edges(self):
+        return zip(self.polygon, self.polygon[1:] + self.polygon[:1])
+
+    def _cell_of(self, lat: float, lng: float) -> tuple:
+        return int((lat - self.min_lat) / self.cell), int((lng - self.min_lng) / self.cell)
+
+    def contains(self, lat: float, lng: float) -> bool:
+        if not (self.min_lat <= lat <= self.max_lat and self.min_lng <= lng <= self.max_lng):
+            return False
+        row, col = self._cell_of(lat, lng)
+        value = self.raster[row * self.cols + col]
+        if value == _BOUNDARY:
+            return point_in_polygon(lat, lng, self.polygon)
+        return value == _INSIDE
+
+    def contains_many(self, points: Iterable[Tuple[float, float]]) -> List[bool]:
+        """فحص دفعة من النقاط [(lat, lng), ...]"""
+        contains = self.contains
+        return [contains(lat, lng) for lat, lng in points]
+
+def load_polygon(file_path: str) -> List[Tuple[float, float]]:
+    """مضلع من ملف نقاط lat<TAB>lng - السطور التي تبدأ بـ # تعليقات"""
+    polygon = []
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            lat, lng = line.split('\t')
+            polygon.append((float(lat), float(lng)))
+    return polygon
+
+_jordan = None
+_service_areas = None
+_lock = threading.Lock()
+
+def get_jordan_area() -> ServiceArea:
+    global _jordan
+    if _jordan is None:
+        with _lock:
+            if _jordan is None:
+                _jordan = ServiceArea("الأردن", load_polygon(JORDAN_BORDER_PATH))
+    return _jordan
+
+def is_in_jordan(lat: float, lng: float) -> bool:
+    return get_jordan_area().contains(lat, lng)
+
+def get_service_areas() -> dict:
+    """مناطق الخدمة المعرفة في JEENY_SERVICE_AREAS - فارغة إذا لم يُحدد ملف"""
+    global _service_areas
+    if _service_areas is None:
+        areas = {}
+        if SERVICE_AREAS_PATH:
+            try:
+                with open(SERVICE_AREAS_PATH, 'r', encoding='utf-8') as f:
+                    for name, polygon in json.load(f).items():
+                        areas[name] = ServiceArea(name, polygon)
+                print(f"[DEBUG] تحميل {len(areas)} منطقة خدمة من: {SERVICE_AREAS_PATH}")
+            except Exception as e:
+                print(f"[خطأ] تعذر تحميل مناطق الخدمة: {e}")
+        _service_areas = areas
+    return _service_areas
+
+def service_area_for(lat: float, lng: float) -> Optional[str]:
+    """اسم منطقة الخدمة التي تقع فيها النقطة، أو None"""
+    for name, area in get_service_areas().items():
+        if area.contains(lat, lng):
+            return name
+    return None
+
+def is_in_service_area(lat: float, lng: float) -> bool:
+    """داخل الأردن، وداخل إحدى مناطق الخدمة إذا كانت معرفة"""
+    if not is_in_jordan(lat, lng):
+        return False
+    return not get_service_areas() or service_area_for(lat, lng) is not None
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    area = get_jordan_area()
+    print(f"[DEBUG] {len(area.polygon)} نقطة حدود، raster {area.rows}×{area.cols}")
+
+    # الـ raster يجب أن يطابق الفحص الدقيق على نقاط عشوائية داخل المربع المحيط
+    random.seed(0)
+    points = [
+        (random.uniform(area.min_lat, area.max_lat), random.uniform(area.min_lng, area.max_lng))
+        for _ in range(20000)
+    ]
+    started = time.perf_counter()
+    fast = area.contains_many(points)
+    elapsed = time.perf_counter() - started
+    exact = [point_in_polygon(lat, lng, area.polygon) for lat, lng in points]
+    assert fast == exact, "الـ raster لا يطابق الفحص الدقيق"
+    print(f"[نجح] raster يطابق الفحص الدقيق ({elapsed / len(points) * 1e6:.1f} µs لكل نقطة)")
+
+    # بلدات أردنية قرب الحدود سقطت من المضلع المبسط القديم
+    inside = {
+        "الشونة الشمالية": (32.60, 35.6167), "أم قيس": (32.6525, 35.6836),
+        "وقاص": (32.54, 35.60), "العدسية": (32.67, 35.62),
+        "البحر الميت": (31.72, 35.59), "العقبة": (29.5321, 35.0063), "الرمثا": (32.5592, 36.0069),
+    }
+    outside = {"أريحا": (31.857, 35.444), "إيلات": (29.557, 34.95), "درعا": (32.625, 36.106)}
+    for name, (lat, lng) in inside.items():
+        assert is_in_jordan(lat, lng), f"{name} يجب أن تكون داخل الأردن"
+    for name, (lat, lng) in outside.items():
+        assert not is_in_jordan(lat, lng), f"{name} يجب أن تكون خارج الأردن"
+    print("[نجح] البلدات الحدودية مصنفة بشكل صحيح")
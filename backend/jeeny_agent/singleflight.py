@@ -0,0 +1,46 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+class SingleFlight:
+    """دمج الطلبات المتزامنة المتطابقة: أول طلب ينفذ الاستدعاء والبقية ينتظرون نفس النتيجة
+
+    لا يخزن النتائج بعد انتهاء الاستدعاء (هذا دور الكاش) - فقط يمنع تكرار الطلب أثناء تنفيذه.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.shared = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            self.calls += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.shared += 1
+
+        if not leader:
+            print(f"[DEBUG] انتظار طلب {self.name} جارٍ لنفس المفتاح: {key}")
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self) -> dict:
+        return {"name": self.name, "calls": self.calls, "shared": self.shared}
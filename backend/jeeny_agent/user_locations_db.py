@@ -0,0 +1,235 @@
+"""أماكن محفوظة لكل مستخدم (SQLite)
+
+    python -m jeeny_agent.user_locations_db import USER_ID                 # نقل saved_locations.json إلى المستخدم
+    python -m jeeny_agent.user_locations_db import USER_ID --file my.json  # ملف آخر بنفس الصيغة
+    python -m jeeny_agent.user_locations_db export USER_ID                 # طباعة أماكن المستخدم كـ JSON
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional
+from jeeny_agent.normalization import normalize_arabic
+from jeeny_agent.saved_locations import SavedLocationsIndex, coordinate_key
+
+# مسار قاعدة بيانات الأماكن المحفوظة لكل مستخدم
+DEFAULT_LOCATIONS_DB_PATH = os.getenv(
+    "JEENY_LOCATIONS_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'user_locations.sqlite3')
+)
+# ملف الأماكن العام القديم (مجلد backend) - يُستورد لمستخدم بأمر import
+LEGACY_LOCATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'saved_locations.json')
+
+class UserLocationsDB:
+    """أماكن محفوظة لكل مستخدم على حدة (SQLite) مع كاش LRU لأماكن المستخدمين النشطين فقط"""
+
+    def __init__(self, db_path: str = DEFAULT_LOCATIONS_DB_PATH, cache_size: int = 1024):
+        self.db_path = os.path.abspath(db_path)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # user_id -> (revision, SavedLocationsIndex)
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id TEXT PRIMARY KEY,
+                    revision INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS saved_locations (
+                    user_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    normalized_name TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    lat REAL,
+                    lng REAL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, normalized_name)
+                );
+                CREATE INDEX IF NOT EXISTS idx_saved_locations_coords
+                    ON saved_locations(user_id, lat, lng);
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row(user_id: str, name: str, value: str) -> tuple:
+        coords = coordinate_key(value)
+        lat, lng = coords if coords else (None, None)
+        return (str(user_id), name, normalize_arabic(name), str(value), lat, lng, time.time())
+
+    def _bump_revision(self, conn: sqlite3.Connection, user_ids: Iterable[str]) -> None:
+        """يُستدعى داخل معاملة الكتابة مع self._lock"""
+        conn.executemany(
+            "INSERT INTO users (user_id, revision) VALUES (?, 1) "
+            "ON CONFLICT(user_id) DO UPDATE SET revision = revision + 1",
+            [(str(user_id),) for user_id in user_ids]
+        )
+        for user_id in user_ids:
+            self._cache.pop(str(user_id), None)
+
+    def revision(self, user_id: str) -> int:
+        """رقم نسخة أماكن المستخدم - يزيد مع كل تعديل ويُستخدم في مفاتيح الكاش"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT revision FROM users WHERE user_id = ?", (str(user_id),)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def save_location(self, user_id: str, name: str, value: str) -> None:
+        """إضافة أو تحديث مكان محفوظ لمستخدم"""
+        # الاتصال مشترك بين الخيوط (check_same_thread=False): كل معاملة كتابة تحت القفل حتى لا تتداخل
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO saved_locations "
+                    "(user_id, name, normalized_name, value, lat, lng, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    self._row(user_id, name, value)
+                )
+                self._bump_revision(conn, [user_id])
+
+    def delete_location(self, user_id: str, name: str) -> bool:
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                deleted = conn.execute(
+                    "DELETE FROM saved_locations WHERE user_id = ? AND normalized_name = ?",
+                    (str(user_id), normalize_arabic(name))
+                ).rowcount
+                if deleted:
+                    self._bump_revision(conn, [user_id])
+        return bool(deleted)
+
+    def get_locations(self, user_id: str) -> SavedLocationsIndex:
+        """أماكن المستخدم كفهرس - من الكاش إذا لم تتغير النسخة"""
+        user_id = str(user_id)
+        revision = self.revision(user_id)
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is not None and cached[0] == revision:
+                self._cache.move_to_end(user_id)
+                return cached[1]
+            rows = self._connection().execute(
+                "SELECT name, value FROM saved_locations WHERE user_id = ?", (user_id,)
+            ).fetchall()
+            index = SavedLocationsIndex({name: value for name, value in rows})
+            self._cache[user_id] = (revision, index)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return index
+
+    def lookup(self, user_id: str, name: str) -> Optional[str]:
+        """بحث مباشر بالاسم الموحد عبر الفهرس الأساسي بدون تحميل كل الأماكن"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value FROM saved_locations WHERE user_id = ? AND normalized_name = ?",
+                (str(user_id), normalize_arabic(name))
+            ).fetchone()
+        return row[0] if row else None
+
+    def name_for_coordinates(self, user_id: str, latlng: str) -> Optional[str]:
+        coords = coordinate_key(latlng)
+        if coords is None:
+            return None
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT name FROM saved_locations WHERE user_id = ? AND lat = ? AND lng = ?",
+                (str(user_id), coords[0], coords[1])
+            ).fetchone()
+        return row[0] if row else None
+
+    def import_locations(self, locations_by_user: dict) -> int:
+        """استيراد جماعي: {user_id: {name: value}} في معاملة واحدة"""
+        rows = [
+            self._row(user_id, name, value)
+            for user_id, locations in locations_by_user.items()
+            for name, value in locations.items()
+        ]
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO saved_locations "
+                    "(user_id, name, normalized_name, value, lat, lng, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._bump_revision(conn, list(locations_by_user))
+        print(f"[نجح] تم استيراد {len(rows)} مكان لـ {len(locations_by_user)} مستخدم")
+        return len(rows)
+
+    def import_json_file(self, user_id: str, file_path: str) -> int:
+        """استيراد ملف بصيغة saved_locations.json لمستخدم واحد"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return self.import_locations({user_id: json.load(f)})
+
+    def export_locations(self, user_id: str) -> dict:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT name, value FROM saved_locations WHERE user_id = ? ORDER BY name", (str(user_id),)
+            ).fetchall()
+        return {name: value for name, value in rows}
+
+    def export_all(self, batch_size: int = 10000):
+        """تصدير كل المستخدمين كدفعات (user_id, {name: value}) بدون تحميل القاعدة كاملة
+
+        يستخدم اتصالاً خاصاً به (لقطة ثابتة في WAL) لأن القراءة تمتد بين الدفعات ولا يمكن إبقاء القفل طوالها.
+        """
+        self._connection()
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        current_user, current = None, {}
+        try:
+            cursor = conn.execute("SELECT user_id, name, value FROM saved_locations ORDER BY user_id")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for user_id, name, value in rows:
+                    if user_id != current_user and current_user is not None:
+                        yield current_user, current
+                        current = {}
+                    current_user = user_id
+                    current[name] = value
+            if current_user is not None:
+                yield current_user, current
+        finally:
+            conn.close()
+
+_default_db = None
+
+def get_user_locations_db() -> UserLocationsDB:
+    """قاعدة البيانات المشتركة للعملية - تُنشأ عند أول استخدام"""
+    global _default_db
+    if _default_db is None:
+        _default_db = UserLocationsDB()
+    return _default_db
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="إدارة الأماكن المحفوظة لكل مستخدم")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="استيراد ملف أماكن بصيغة saved_locations.json لمستخدم")
+    import_parser.add_argument("user_id")
+    import_parser.add_argument("--file", default=LEGACY_LOCATIONS_PATH, help="ملف JSON بصيغة {الاسم: القيمة}")
+    export_parser = commands.add_parser("export", help="طباعة أماكن المستخدم كـ JSON")
+    export_parser.add_argument("user_id")
+    parser.add_argument("--db", default=DEFAULT_LOCATIONS_DB_PATH, help="مسار قاعدة البيانات")
+    args = parser.parse_args(argv)
+
+    db = UserLocationsDB(args.db)
+    if args.command == "import":
+        db.import_json_file(args.user_id, args.file)
+    else:
+        print(json.dumps(db.export_locations(args.user_id), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,92 +1,28 @@
 import os
 import argparse
-from langchain.agents import initialize_agent, AgentType
-from langchain_openai import ChatOpenAI 
-from langchain.memory import ConversationBufferMemory
-from tools.get_directions_tool import GetDirectionsTool
-from tools.car_type_selector_tool import CarTypeSelectorTool
-from tools.change_car_type_tool import ChangeCarTypeTool
-from tools.modify_location_tool import ModifyLocationTool
 from voice import recognize_speech, speak_arabic_response, test_voice_system
 from dotenv import load_dotenv
-from tools.get_directions_tool import get_shared_trip_data
-from tools.get_directions_tool import set_shared_trip_data
+from session import ChatSession, DEFAULT_USER_ID
 
 # تحميل متغيرات البيئة
 load_dotenv()
 
-# إنشاء instances للأدوات للمشاركة بينها
-get_directions_tool = GetDirectionsTool()
-change_car_type_tool = ChangeCarTypeTool()
-modify_location_tool = ModifyLocationTool()
-
-# إعداد الذكاء الاصطناعي والأدوات
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-agent = initialize_agent(
-    tools=[
-        get_directions_tool,
-        change_car_type_tool,
-        modify_location_tool
-    ],
-    llm=llm,
-    agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-    memory=memory,
-    verbose=True
-)
-
-def sync_trip_data():
-    """مزامنة بيانات الرحلة بين الأدوات - محدثة"""
-    # محاولة الحصول على البيانات من أي أداة تحتوي على آخر رحلة
-    shared_data = None
-    
-    # البحث عن البيانات في الأدوات
-    shared_data = get_shared_trip_data()
-    
-    # إذا لم نجد بيانات في get_directions_tool، نحاول الحصول عليها من change_car_type_tool
-    if not shared_data and hasattr(change_car_type_tool, 'last_trip_data') and change_car_type_tool.last_trip_data:
-        shared_data = change_car_type_tool.last_trip_data
-        print("[DEBUG] تم الحصول على البيانات من change_car_type_tool")
-    
-    # إذا لم نجد بيانات، نحاول الحصول عليها من modify_location_tool
-    if not shared_data and hasattr(modify_location_tool, 'last_trip_data') and modify_location_tool.last_trip_data:
-        shared_data = modify_location_tool.last_trip_data
-        print("[DEBUG] تم الحصول على البيانات من modify_location_tool")
-    
-    if shared_data:
-        # تحديث جميع الأدوات بنفس البيانات
-        change_car_type_tool.set_last_trip(
-            shared_data["start_location"],
-            shared_data["end_location"], 
-            shared_data["car_type"]
-        )
-        
-        modify_location_tool.set_last_trip(
-            shared_data["start_location"],
-            shared_data["end_location"],
-            shared_data["car_type"]
-        )
-        
-        # تحديث البيانات المشتركة العامة
-        set_shared_trip_data(
-            shared_data["start_location"],
-            shared_data["end_location"],
-            shared_data["car_type"]
-        )
-        
-        print(f"[DEBUG] تم مزامنة بيانات الرحلة: {shared_data['car_type']} من {shared_data['start_location'].name} إلى {shared_data['end_location'].name}")
-
 def main():
     """الوظيفة الرئيسية للتطبيق"""
     parser = argparse.ArgumentParser(description="JeenyAgent - Smart Transportation Assistant")
     parser.add_argument('--use-voice', action='store_true', help='تشغيل خيار الصوت')
     parser.add_argument('--test-voice', action='store_true', help='اختبار نظام الصوت')
+    parser.add_argument('--user-id', default=DEFAULT_USER_ID,
+                        help='معرف المستخدم لاستخدام أماكنه المحفوظة (الافتراضي JEENY_USER_ID أو ملف saved_locations.json)')
     args = parser.parse_args()
 
     if args.test_voice:
         test_voice_system()
         return
 
+    # جلسة واحدة لمستخدم الطرفية: أدواته وذاكرته ورحلته
+    session = ChatSession(args.user_id)
+
     print("👋 أهلاً بك في JeenyAgent - Smart Transportation Assistant")
     print("يمكنك:")
     print("• طلب رحلة: 'بدي سيارة من إربد لعمان'")
@@ -121,12 +57,11 @@ def main():
                 break
             
             # معالجة الطلب
-            response = agent.invoke({"input": user_text})
-            response_text = response["output"]
+            response_text = session.run_turn(user_text)
             print(f"🤖 {response_text}")
             
             # مزامنة بيانات الرحلة بعد كل استجابة
-            sync_trip_data()
+            session.sync_trip_data()
             
             # النطق الصوتي إذا كان مفعلاً
             if args.use_voice:
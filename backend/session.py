@@ -0,0 +1,92 @@
+import os
+from typing import Optional
+from tools.get_directions_tool import GetDirectionsTool, get_shared_trip_data, set_shared_trip_data
+from tools.change_car_type_tool import ChangeCarTypeTool
+from tools.modify_location_tool import ModifyLocationTool
+from jeeny_agent.memory import TripAwareBufferMemory
+from jeeny_agent.router import route_intent
+from jeeny_agent.agent_factory import create_agent
+from jeeny_agent.llm_gateway import get_llm
+
+# المستخدم الافتراضي للواجهة والطرفية إذا لم يُحدد (بدون قيمة = ملف saved_locations.json العام)
+DEFAULT_USER_ID = os.getenv("JEENY_USER_ID") or None
+
+def normalize_user_id(user_id: Optional[str]) -> Optional[str]:
+    """معرف فارغ يعني المستخدم الافتراضي"""
+    user_id = str(user_id).strip() if user_id is not None else ""
+    return user_id or None
+
+class ChatSession:
+    """جلسة محادثة لمستخدم واحد: أدوات تحمل user_id وذاكرة و Agent خاصة بها
+
+    الأدوات تُنشأ لكل جلسة (وليست مشتركة بين المستخدمين) فتصل لأماكن المستخدم المحفوظة ورحلته فقط.
+    """
+
+    def __init__(self, user_id: Optional[str] = DEFAULT_USER_ID, streaming: bool = False):
+        self.user_id = normalize_user_id(user_id)
+        self.get_directions_tool = GetDirectionsTool(user_id=self.user_id)
+        self.change_car_type_tool = ChangeCarTypeTool(user_id=self.user_id)
+        self.modify_location_tool = ModifyLocationTool(user_id=self.user_id)
+        self.tools = [self.get_directions_tool, self.change_car_type_tool, self.modify_location_tool]
+        # الأدوات حسب الاسم للتوجيه المباشر
+        self.tools_by_name = {tool.name: tool for tool in self.tools}
+        # ذاكرة بميزانية ثابتة + ملخص حالة الرحلة بدلاً من إعادة إرسال كل المحادثة
+        self.memory = TripAwareBufferMemory(
+            memory_key="chat_history",
+            return_messages=True,
+            trip_state_provider=self.trip
+        )
+        # الوضع يُحدد بمتغير البيئة JEENY_AGENT_MODE (react أو tools)
+        self.agent = create_agent(
+            llm=get_llm("agent", streaming=streaming),
+            tools=self.tools,
+            memory=self.memory
+        )
+        print(f"[DEBUG] جلسة جديدة للمستخدم: {self.user_id or 'الافتراضي'}")
+
+    def trip(self) -> Optional[dict]:
+        """رحلة المستخدم الحالية"""
+        return get_shared_trip_data(self.user_id)
+
+    def sync_trip_data(self):
+        """مزامنة بيانات رحلة المستخدم بين أدوات الجلسة"""
+        shared_data = self.trip()
+
+        # إذا لم نجد بيانات مشتركة، نحاول الحصول عليها من أدوات التعديل
+        if not shared_data and self.change_car_type_tool.last_trip_data:
+            shared_data = self.change_car_type_tool.last_trip_data
+            print("[DEBUG] تم الحصول على البيانات من change_car_type_tool")
+        if not shared_data and self.modify_location_tool.last_trip_data:
+            shared_data = self.modify_location_tool.last_trip_data
+            print("[DEBUG] تم الحصول على البيانات من modify_location_tool")
+
+        if not shared_data:
+            return
+
+        # المسار الخام والسائق والخريطة تنتقل مع الرحلة حتى يُعاد التسعير بدون طلبات خارجية
+        trip = {key: shared_data.get(key) for key in ("route", "driver", "map_file")}
+        locations = (shared_data["start_location"], shared_data["end_location"], shared_data["car_type"])
+        self.change_car_type_tool.set_last_trip(*locations, **trip)
+        self.modify_location_tool.set_last_trip(*locations, **trip)
+        set_shared_trip_data(*locations, **trip, user_id=self.user_id)
+
+        print(f"[DEBUG] تم مزامنة بيانات الرحلة: {shared_data['car_type']} من {shared_data['start_location'].name} إلى {shared_data['end_location'].name}")
+
+    def route(self, user_text: str) -> Optional[str]:
+        """اسم الأداة للتوجيه المباشر أو None إذا يجب أن يتعامل معها الـ Agent"""
+        return route_intent(user_text, has_trip=self.trip() is not None)
+
+    def run_routed_tool(self, intent: str, user_text: str) -> str:
+        """تشغيل الأداة مباشرة وإرجاع ردها كما هو بدون المرور بالـ Agent"""
+        print(f"[DEBUG] توجيه مباشر إلى الأداة: {intent}")
+        output = self.tools_by_name[intent]._run(user_text)
+        # حفظ الدورة في الذاكرة حتى يبقى الـ Agent على اطلاع في الرسائل القادمة
+        self.memory.save_context({"input": user_text}, {"output": output})
+        return output
+
+    def run_turn(self, user_text: str, config: Optional[dict] = None) -> str:
+        """الرسائل الواضحة تذهب للأداة مباشرة، وغير الواضحة تمر بالـ Agent"""
+        intent = self.route(user_text)
+        if intent is None:
+            return self.agent.invoke({"input": user_text}, config=config)["output"]
+        return self.run_routed_tool(intent, user_text)
@@ -1,10 +1,7 @@
 from langchain.tools import BaseTool
-from langchain_openai import ChatOpenAI
-from typing import Optional
-import json
-import os
-import re
 from dotenv import load_dotenv
+from jeeny_agent.car_types import CAR_TYPES, DEFAULT_CAR_TYPE, detect_car_type
+from jeeny_agent.llm_gateway import get_llm
 
 class CarTypeSelectorTool(BaseTool):
     name: str = "car_type_selector"
@@ -17,71 +14,20 @@ class CarTypeSelectorTool(BaseTool):
     def __init__(self):
         super().__init__()
         load_dotenv()  # تحميل متغيرات البيئة
-        self._llm = None
 
     @property
     def llm(self):
-        """Lazy loading للـ LLM"""
-        if self._llm is None:
-            self._llm = ChatOpenAI(
-                model="gpt-4o-mini",
-                temperature=0, 
-                openai_api_key=os.getenv("OPENAI_API_KEY")
-            )
-        return self._llm
+        """النموذج المشترك من الـ gateway (اتصالات ومهلة وإعادة محاولة موحدة)"""
+        return get_llm("classifier")
 
     def _detect_car_type_patterns(self, query: str) -> str:
         """استخدام regex patterns لتحديد نوع السيارة بدقة أكبر"""
-        query_lower = query.lower()
-        
-        # أنماط للسيارة VIP
-        vip_patterns = [
-            r'vip',
-            r'في آي بي',
-            r'فاخرة',
-            r'درجة أولى',
-            r'ممتازة',
-            r'كلاس عالي'
-        ]
-        
-        # أنماط للسيارة العائلية
-        family_patterns = [
-            r'عائلية',
-            r'عائلي',
-            r'كبيرة',
-            r'7 ركاب',
-            r'سبع ركاب',
-            r'سبعة ركاب',
-            r'فان',
-            r'باص صغير'
-        ]
-        
-        # أنماط للتاكسي
-        taxi_patterns = [
-            r'تاكسي',
-            r'تكسي',
-            r'أجرة'
-        ]
-        
-        # فحص الأنماط
-        for pattern in vip_patterns:
-            if re.search(pattern, query_lower):
-                return "VIP"
-                
-        for pattern in family_patterns:
-            if re.search(pattern, query_lower):
-                return "عائلية"
-                
-        for pattern in taxi_patterns:
-            if re.search(pattern, query_lower):
-                return "تاكسي"
-        
-        return "عادية"  # القيمة الافتراضية
+        return detect_car_type(query) or DEFAULT_CAR_TYPE
 
     def _run(self, query: str) -> str:
         # أولاً، جرب الكشف بالأنماط
         pattern_result = self._detect_car_type_patterns(query)
-        if pattern_result != "عادية":
+        if pattern_result != DEFAULT_CAR_TYPE:
             print(f"[DEBUG] تم تحديد نوع السيارة بالأنماط: {pattern_result}")
             return pattern_result
         
@@ -106,27 +52,25 @@ class CarTypeSelectorTool(BaseTool):
             print(f"[DEBUG] Car type LLM response: {response}")
             
             # التحقق من صحة الإجابة وتنظيفها
-            valid_types = ["عادية", "تاكسي", "عائلية", "VIP"]
-            
             # تنظيف الإجابة من علامات الترقيم والمسافات الزائدة
             clean_response = response.strip().replace('"', '').replace("'", "").replace('.', '')
             
-            if clean_response in valid_types:
+            if clean_response in CAR_TYPES:
                 return clean_response
             
             # محاولة البحث عن الكلمة داخل النص
-            for car_type in valid_types:
+            for car_type in CAR_TYPES:
                 if car_type in response:
                     print(f"[DEBUG] وجدت نوع السيارة داخل النص: {car_type}")
                     return car_type
             
             # إذا لم نجد تطابق، استخدم الافتراضي
             print(f"[تحذير] نوع سيارة غير صحيح: {response}, استخدام الافتراضي")
-            return "عادية"
+            return DEFAULT_CAR_TYPE
             
         except Exception as e:
             print(f"[خطأ] في تحديد نوع السيارة: {e}")
-            return "عادية"  # في حالة حدوث خطأ، استخدم القيمة الافتراضية
+            return DEFAULT_CAR_TYPE  # في حالة حدوث خطأ، استخدم القيمة الافتراضية
 
     async def _arun(self, query: str) -> str:
         return self._run(query)
\ No newline at end of file
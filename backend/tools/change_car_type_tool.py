@@ -2,12 +2,22 @@ from langchain.tools import BaseTool
 from typing import Optional, Any
 import json
 import os
-from jeeny_agent.routing import compute_trip
+import time
+from concurrent.futures import ThreadPoolExecutor
+from jeeny_agent.routing import trip_route, price_trip
+from jeeny_agent.fares import get_fare_engine
 from jeeny_agent.driver import generate_driver_location
 from jeeny_agent.mapping import create_trip_map
 from jeeny_agent.models import Location, TripInfo
+from jeeny_agent.car_types import CAR_TYPES, detect_car_type
 from tools.car_type_selector_tool import CarTypeSelectorTool
 
+# أداة تحديد نوع السيارة مشتركة بدل إنشاء واحدة مع كل طلب
+_car_type_selector = CarTypeSelectorTool()
+
+# إعادة رسم الخريطة بعد إعادة التسعير تتم خارج مسار الرد - عامل واحد فتُرسم التغييرات المتتالية بالترتيب
+_map_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reprice-map")
+
 class ChangeCarTypeTool(BaseTool):
     name: str = "change_car_type"
     description: str = (
@@ -18,6 +28,8 @@ class ChangeCarTypeTool(BaseTool):
     
     # إضافة model_config للسماح بـ arbitrary attributes في Pydantic v2
     model_config = {"arbitrary_types_allowed": True, "extra": "allow"}
+    # معرف المستخدم صاحب الرحلة (None = المستخدم الافتراضي)
+    user_id: Optional[str] = None
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -26,33 +38,50 @@ class ChangeCarTypeTool(BaseTool):
         
     def _extract_new_car_type(self, query: str) -> str:
         """استخراج نوع السيارة الجديد من طلب المستخدم"""
-        car_type_tool = CarTypeSelectorTool()
-        new_car_type = car_type_tool._run(query)
+        # الأنماط أولاً (تشمل "رجعها عادية") ثم النموذج إذا لم يُذكر نوع صريح
+        new_car_type = detect_car_type(query, include_default=True)
+        if new_car_type is None:
+            new_car_type = _car_type_selector._run(query)
         print(f"[DEBUG] نوع السيارة الجديد المطلوب: {new_car_type}")
         return new_car_type
     
-    def set_last_trip(self, start_loc: Location, end_loc: Location, original_car_type: str):
-        """حفظ بيانات الرحلة الأخيرة"""
+    def set_last_trip(self, start_loc: Location, end_loc: Location, original_car_type: str,
+                      route: Optional[dict] = None, driver: Optional[dict] = None, map_file: Optional[str] = None):
+        """حفظ بيانات الرحلة الأخيرة مع المسار الخام والسائق والخريطة إن وُجدت"""
         object.__setattr__(self, 'last_trip_data', {
             "start_location": start_loc,
             "end_location": end_loc,
-            "car_type": original_car_type  # تغيير من original_car_type إلى car_type
+            "car_type": original_car_type,  # تغيير من original_car_type إلى car_type
+            "route": route,
+            "driver": driver,
+            "map_file": map_file
         })
         print(f"[DEBUG] تم حفظ بيانات الرحلة الأخيرة: {original_car_type}")
         
     def _run(self, query: str) -> str:
+        # التحقق من وجود رحلة سابقة قبل تحليل الطلب
+        if not hasattr(self, 'last_trip_data') or not self.last_trip_data:
+            return "❌ لا توجد رحلة سابقة لتغيير نوع السيارة. يرجى طلب رحلة جديدة أولاً."
+        
+        try:
+            # استخراج نوع السيارة الجديد
+            new_car_type = self._extract_new_car_type(query)
+        except Exception as e:
+            print(f"[خطأ في تغيير نوع السيارة] {str(e)}")
+            return f"❌ عذراً، حدث خطأ أثناء تغيير نوع السيارة: {str(e)}"
+        return self.change_car_type(new_car_type)
+    
+    def change_car_type(self, car_type: str) -> str:
+        """تغيير نوع السيارة للرحلة المحفوظة - نقطة الدخول في وضع استدعاء الأدوات"""
+        new_car_type = car_type
         try:
             # التحقق من وجود رحلة سابقة
             if not hasattr(self, 'last_trip_data') or not self.last_trip_data:
                 return "❌ لا توجد رحلة سابقة لتغيير نوع السيارة. يرجى طلب رحلة جديدة أولاً."
             
-            # استخراج نوع السيارة الجديد
-            new_car_type = self._extract_new_car_type(query)
-            
             # التحقق من صحة نوع السيارة
-            valid_car_types = ["عادية", "تاكسي", "عائلية", "VIP"]
-            if new_car_type not in valid_car_types:
-                return f"❌ نوع السيارة '{new_car_type}' غير صحيح. الأنواع المتاحة: {', '.join(valid_car_types)}"
+            if new_car_type not in CAR_TYPES:
+                return f"❌ نوع السيارة '{new_car_type}' غير صحيح. الأنواع المتاحة: {', '.join(CAR_TYPES)}"
             
             # التحقق إذا كان نفس النوع الحالي
             if new_car_type == self.last_trip_data["car_type"]:
@@ -65,8 +94,14 @@ class ChangeCarTypeTool(BaseTool):
             
             print(f"[DEBUG] تغيير نوع السيارة من '{old_car_type}' إلى '{new_car_type}'")
             
-            # إعادة حساب تفاصيل الرحلة بنوع السيارة الجديد
-            trip = compute_trip(start_loc, end_loc, new_car_type)
+            route = self.last_trip_data.get("route")
+            previous_driver = self.last_trip_data.get("driver")
+            if route and previous_driver:
+                return self._reprice(start_loc, end_loc, old_car_type, new_car_type, route, previous_driver)
+            
+            # رحلة بدون مسار محفوظ: حساب المسار مرة واحدة ثم حفظه لتغييرات النوع القادمة
+            route = trip_route(start_loc, end_loc)
+            trip = price_trip(route, new_car_type)
             
             # إنشاء معلومات الرحلة الجديدة
             trip_info = TripInfo(
@@ -83,12 +118,15 @@ class ChangeCarTypeTool(BaseTool):
             object.__setattr__(self, 'last_trip_data', {
                 "start_location": start_loc,
                 "end_location": end_loc,
-                "car_type": new_car_type  # هنا المشكلة: كان بيحفظ original_car_type
+                "car_type": new_car_type,  # هنا المشكلة: كان بيحفظ original_car_type
+                "route": route,
+                "driver": driver,
+                "map_file": None
             })
             
             # تحديث البيانات المشتركة أيضاً
             from tools.get_directions_tool import set_shared_trip_data
-            set_shared_trip_data(start_loc, end_loc, new_car_type)
+            set_shared_trip_data(start_loc, end_loc, new_car_type, route=route, driver=driver, user_id=self.user_id)
             print(f"[DEBUG] تم تحديث البيانات المشتركة بنوع السيارة الجديد: {new_car_type}")
             
             # رسم الخريطة الجديدة
@@ -96,18 +134,17 @@ class ChangeCarTypeTool(BaseTool):
             try:
                 map_filename = create_trip_map(
                     user_location={"lat": start_loc.lat, "lng": start_loc.lng},
-                    driver_location={
-                        "lat": driver['lat'], 
-                        "lng": driver['lng'],
-                        "distance_m": driver['distance_m'],
-                        "arrival_time_min": driver['arrival_time_min'],
-                        "car_type": new_car_type
-                    },
+                    driver_location=driver,
                     destination_location={"lat": end_loc.lat, "lng": end_loc.lng},  
                     user_name="انس",
-                    driver_name="ابو ثائر"
+                    driver_name="ابو ثائر",
+                    trip_route=route
                 )
                 map_info = f"🗺️ تم إنشاء خريطة جديدة: {map_filename}"
+                # حفظ الخريطة التي رُسمت للتو مع الرحلة
+                self.last_trip_data["map_file"] = map_filename
+                set_shared_trip_data(start_loc, end_loc, new_car_type, route=route, driver=driver, map_file=map_filename,
+                                     user_id=self.user_id)
             except Exception as e:
                 print(f"DEBUG: خطأ في إنشاء الخريطة: {e}")
             
@@ -125,16 +162,10 @@ class ChangeCarTypeTool(BaseTool):
                 f"🚘 نوع السيارة: {trip_info.car_type}"
             ]
             
-            # إضافة ملاحظة السعر حسب نوع السيارة
-            price_notes = {
-                "عادية": "",
-                "تاكسي": "📝 ملاحظة: (زيادة 15% للتاكسي)",
-                "عائلية": "📝 ملاحظة: (زيادة 30% للسيارة العائلية)",
-                "VIP": "📝 ملاحظة: (زيادة 50% للسيارة المميزة)"
-            }
-            
-            if new_car_type in price_notes and price_notes[new_car_type]:
-                response_lines.append(price_notes[new_car_type])
+            # إضافة ملاحظة السعر حسب نوع السيارة (من جدول التعرفة)
+            price_note = get_fare_engine().note(new_car_type)
+            if price_note:
+                response_lines.append(price_note)
             
             # إضافة معلومات الخريطة
             if map_info:
@@ -147,5 +178,79 @@ class ChangeCarTypeTool(BaseTool):
             print(f"[خطأ في تغيير نوع السيارة] {str(e)}")
             return f"❌ عذراً، حدث خطأ أثناء تغيير نوع السيارة: {str(e)}"
     
+    def _reprice(self, start_loc: Location, end_loc: Location, old_car_type: str, new_car_type: str,
+                 route: dict, previous_driver: dict) -> str:
+        """المسار لم يتغير: إعادة التسعير من المسار المحفوظ وتبديل نوع سيارة السائق - بدون Directions أو Roads
+
+        الخريطة السابقة تعرض النوع والسعر القديمين فيُحذف رابطها، وتُرسم الجديدة في الخلفية بعد الرد.
+        """
+        started = time.perf_counter()
+        trip_info = price_trip(route, new_car_type)
+        driver = dict(previous_driver, car_type=new_car_type)
+        
+        object.__setattr__(self, 'last_trip_data', {
+            "start_location": start_loc,
+            "end_location": end_loc,
+            "car_type": new_car_type,
+            "route": route,
+            "driver": driver,
+            "map_file": None
+        })
+        from tools.get_directions_tool import set_shared_trip_data
+        set_shared_trip_data(start_loc, end_loc, new_car_type, route=route, driver=driver, user_id=self.user_id)
+        
+        redraw_map = bool(driver.get("route"))
+        if redraw_map:
+            _map_executor.submit(self._redraw_map, start_loc, end_loc, route, driver)
+        print(f"[DEBUG] إعادة تسعير بدون طلبات خارجية خلال {(time.perf_counter() - started) * 1000:.1f}ms")
+        
+        response_lines = [
+            f"✅ تم تغيير نوع السيارة من '{old_car_type}' إلى '{new_car_type}'",
+            "",
+            "🚗 التفاصيل المحدثة:",
+            f"📍 من: {start_loc.name}",
+            f"🎯 إلى: {end_loc.name}",
+            f"🚖 السائق على بعد {driver['distance_m']} متر، سيصل خلال {driver['arrival_time_min']} دقيقة",
+            f"⏱ الوقت المتوقع: {trip_info.duration}",
+            f"📏 المسافة: {trip_info.distance}",
+            f"💰 التكلفة الجديدة: {trip_info.cost} د.أ",
+            f"🚘 نوع السيارة: {trip_info.car_type}"
+        ]
+        
+        price_note = get_fare_engine().note(new_car_type)
+        if price_note:
+            response_lines.append(price_note)
+        
+        if redraw_map:
+            response_lines.append("")
+            response_lines.append("🗺️ جاري تحديث خريطة الرحلة بنوع السيارة الجديد...")
+        
+        return "\n".join(response_lines)
+    
+    def _redraw_map(self, start_loc: Location, end_loc: Location, route: dict, driver: dict):
+        """رسم الخريطة من المسارات المحفوظة (بدون طلبات) وربطها بالرحلة إذا لم تتغير منذ إعادة التسعير"""
+        try:
+            map_file = create_trip_map(
+                user_location={"lat": start_loc.lat, "lng": start_loc.lng},
+                driver_location=driver,
+                destination_location={"lat": end_loc.lat, "lng": end_loc.lng},
+                user_name="انس",
+                driver_name="ابو ثائر",
+                trip_route=route,
+                driver_route=driver["route"]
+            )
+        except Exception as e:
+            print(f"[تحذير] فشل إعادة رسم الخريطة: {e}")
+            return
+        if not map_file:
+            return
+        
+        # السائق نفس الكائن في بيانات الأداة والبيانات المشتركة - إذا تغير فالرحلة تغيرت والخريطة قديمة
+        from tools.get_directions_tool import get_shared_trip_data
+        for trip in (self.last_trip_data, get_shared_trip_data(self.user_id)):
+            if trip and trip.get("driver") is driver:
+                trip["map_file"] = map_file
+        print(f"[DEBUG] تم تحديث خريطة الرحلة: {map_file}")
+    
     async def _arun(self, query: str) -> str:
         return self._run(query)
\ No newline at end of file
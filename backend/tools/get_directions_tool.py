@@ -5,121 +5,201 @@ import os
 import json
 from jeeny_agent.nlu import extract_locations
 from jeeny_agent.nlu import check_saved_locations
+from jeeny_agent.nlu import parse_turn
+from jeeny_agent.nlu import resolve_saved_place
 from jeeny_agent.nlu import get_location_name_from_coordinates
 from jeeny_agent.nlu import is_latlng
 from jeeny_agent.nlu import parse_latlng
 from jeeny_agent.geocoding import resolve_address_to_coordinates
-from jeeny_agent.routing import compute_trip
+from jeeny_agent.routing import trip_route, price_trip
+from jeeny_agent.fares import get_fare_engine
 from jeeny_agent.driver import generate_driver_location
 from jeeny_agent.mapping import create_trip_map
 from jeeny_agent.models import Location
 from jeeny_agent.models import TripInfo
+from jeeny_agent.car_types import CAR_TYPES, DEFAULT_CAR_TYPE
+from jeeny_agent.pipeline import TaskGraph, StageError
+from jeeny_agent.service_area import is_in_service_area
 from tools.car_type_selector_tool import CarTypeSelectorTool
 
-# متغير global لمشاركة بيانات الرحلة بين الأدوات
-_shared_trip_data = None
+# أداة تحديد نوع السيارة مشتركة بدل إنشاء واحدة مع كل طلب
+_car_type_selector = CarTypeSelectorTool()
 
-def get_shared_trip_data():
-    """الحصول على بيانات الرحلة المشتركة"""
-    return _shared_trip_data
+# بيانات الرحلة المشتركة بين الأدوات لكل مستخدم (None = المستخدم الافتراضي بدون معرف)
+_shared_trip_data = {}
 
-def set_shared_trip_data(start_loc, end_loc, car_type):
-    """حفظ بيانات الرحلة المشتركة"""
-    global _shared_trip_data
-    _shared_trip_data = {
+def get_shared_trip_data(user_id: Optional[str] = None):
+    """الحصول على بيانات رحلة المستخدم المشتركة"""
+    return _shared_trip_data.get(user_id)
+
+def set_shared_trip_data(start_loc, end_loc, car_type, route=None, driver=None, map_file=None,
+                         user_id: Optional[str] = None):
+    """حفظ بيانات رحلة المستخدم المشتركة
+
+    route (المسافة والمدة والـ polyline الخام) و driver و map_file تسمح بإعادة تسعير الرحلة
+    عند تغيير نوع السيارة بدون طلبات خارجية.
+    """
+    _shared_trip_data[user_id] = {
         "start_location": start_loc,
         "end_location": end_loc,
-        "car_type": car_type
+        "car_type": car_type,
+        "route": route,
+        "driver": driver,
+        "map_file": map_file
     }
 
 class GetDirectionsTool(BaseTool):
     name: str = "get_directions_arabic"
+    # معرف المستخدم لاستخدام أماكنه المحفوظة (None = ملف saved_locations.json العام)
+    user_id: Optional[str] = None
     description: str = (
         "غالبا يجب ان يتم استخدام هذه الاداة في اول مراحل تشغيل البرنامج ،تقوم هذه الأداة بحساب اتجاهات القيادة بين نقطتين في الأردن بناءً على وصف المستخدم باللغة العامية. مثل تطبيق Uber"
         "تأخذ النص، تستخرج الموقع الحالي والوجهة، وتحسب المسافة والوقت والتكلفة التقديرية، وتعرض النتيجة بالعربية."
     )
 
+    def _parse_query(self, query: str) -> dict:
+        """تحديد نوع السيارة ونقطتي البداية والوجهة من نص المستخدم"""
+        car_type_tool = _car_type_selector
+        
+        # تحليل الرسالة كاملة (نوع السيارة + المواقع + الأماكن المحفوظة) باستدعاء واحد
+        locations = parse_turn(query, self.user_id)
+        if "error" in locations:
+            # الرجوع للمسار القديم إذا فشل التحليل الموحد - الخطوتان مستقلتان فتعملان بالتوازي
+            print(f"[WARNING] فشل التحليل الموحد، استخدام المسار المنفصل: {locations['error']}")
+            fallback = TaskGraph(max_workers=2)
+            fallback.add("car_type", lambda: car_type_tool._run(query))
+            fallback.add("locations", lambda: check_saved_locations(query, self.user_id))
+            fallback.run()
+            car_type = fallback.results["car_type"]
+            locations = fallback.results["locations"]
+            if "error" in locations:
+                raise StageError(f"❌ خطأ في معالجة المواقع: {locations['error']}")
+        else:
+            # الأنماط الصريحة (VIP، تاكسي...) لها الأولوية على إجابة النموذج
+            pattern_car_type = car_type_tool._detect_car_type_patterns(query)
+            car_type = pattern_car_type if pattern_car_type != DEFAULT_CAR_TYPE else locations["car_type"]
+        print(f"[DEBUG] Selected car_type: '{car_type}'")
+        
+        # التحقق من صحة نوع السيارة
+        if car_type not in CAR_TYPES:
+            print(f"[WARNING] Invalid car type '{car_type}', defaulting to '{DEFAULT_CAR_TYPE}'")
+            car_type = DEFAULT_CAR_TYPE
+
+        if not locations["start_location"] or not locations["end_location"]:
+            raise StageError("❌ لم يتم تحديد نقطة البداية أو الوجهة بشكل صحيح. يرجى إعادة المحاولة بوضوح أكثر.")
+
+        return {
+            "car_type": car_type,
+            "start_location": locations["start_location"],
+            "end_location": locations["end_location"]
+        }
+
+    def _parse_args(self, start_location: str, end_location: str, car_type: str) -> dict:
+        """وسائط جاهزة من النموذج (وضع استدعاء الأدوات): فقط مطابقة الأماكن المحفوظة بدون تحليل النص"""
+        if car_type not in CAR_TYPES:
+            print(f"[WARNING] Invalid car type '{car_type}', defaulting to '{DEFAULT_CAR_TYPE}'")
+            car_type = DEFAULT_CAR_TYPE
+        if not start_location or not end_location:
+            raise StageError("❌ لم يتم تحديد نقطة البداية أو الوجهة بشكل صحيح. يرجى إعادة المحاولة بوضوح أكثر.")
+        return {
+            "car_type": car_type,
+            "start_location": resolve_saved_place(start_location, self.user_id),
+            "end_location": resolve_saved_place(end_location, self.user_id)
+        }
+
+    def _resolve_point(self, name: str, label: str, default_display_name: str) -> Location:
+        """تحويل اسم المكان أو الإحداثيات إلى Location"""
+        print(f"[DEBUG] معالجة {label}: {name}")
+        if is_latlng(name):
+            print(f"[DEBUG] {label} عبارة عن إحداثيات: {name}")
+            lat, lng = parse_latlng(name)
+            # استخدام اسم عام للعرض
+            display_name = get_location_name_from_coordinates(name, self.user_id)
+            if display_name == name:  # إذا لم نجد اسم مطابق
+                display_name = default_display_name
+        else:
+            print(f"[DEBUG] {label} عبارة عن عنوان: {name}")
+            lat, lng = resolve_address_to_coordinates(name)
+            display_name = name
+        
+        # التحقق من صحة الإحداثيات
+        if lat is None or lng is None:
+            raise StageError(f"❌ عذراً، لم أتمكن من العثور على موقع {label}: '{name}'. يرجى التأكد من صحة اسم المكان.")
+        if not is_in_service_area(lat, lng):
+            raise StageError(f"❌ عذراً، موقع {label} '{display_name}' خارج منطقة الخدمة.")
+        return Location(name=display_name, lat=lat, lng=lng)
+
+    def _create_map(self, start: Location, end: Location, driver: dict, route: dict) -> Optional[str]:
+        """رسم الخريطة وإرجاع اسم ملفها - الفشل هنا لا يوقف الرد
+
+        الخريطة تكتب موقع السائق النهائي ومساره في driver حتى يُعاد رسمها عند تغيير نوع السيارة بدون طلبات.
+        """
+        try:
+            map_filename = create_trip_map(
+                user_location={"lat": start.lat, "lng": start.lng},
+                driver_location=driver,
+                destination_location={"lat": end.lat, "lng": end.lng},  
+                user_name="انس",
+                driver_name="ابو ثائر",
+                trip_route=route
+            )
+            print(f"DEBUG: تم إنشاء خريطة: {map_filename}")
+            return map_filename
+        except Exception as e:
+            print(f"DEBUG: خطأ في إنشاء الخريطة: {e}")
+            return None
+
     def _run(self, query: str) -> str:
+        return self._execute(lambda: self._parse_query(query))
+
+    def plan_trip(self, start_location: str, end_location: str, car_type: str = DEFAULT_CAR_TYPE) -> str:
+        """نقطة الدخول في وضع استدعاء الأدوات: البداية والوجهة ونوع السيارة كوسائط منفصلة"""
+        return self._execute(lambda: self._parse_args(start_location, end_location, car_type))
+
+    def _execute(self, parse_stage) -> str:
         try:
-            # استدعاء أداة اختيار نوع السيارة أولاً
-            car_type_tool = CarTypeSelectorTool()
-            car_type = car_type_tool._run(query)
-            print(f"[DEBUG] Selected car_type: '{car_type}'")
-            
-            # التحقق من صحة نوع السيارة
-            valid_car_types = ["عادية", "تاكسي", "عائلية", "VIP"]
-            if car_type not in valid_car_types:
-                print(f"[WARNING] Invalid car type '{car_type}', defaulting to 'عادية'")
-                car_type = "عادية"
+            # المراحل كمخطط اعتماديات: البداية والوجهة تُحوَّلان بالتوازي،
+            # والسائق يبدأ بمجرد معرفة البداية دون انتظار حساب المسار
+            graph = TaskGraph()
+            graph.add("parsed", parse_stage)
+            graph.add("start", lambda parsed: self._resolve_point(parsed["start_location"], "البداية", "الموقع المحدد"),
+                      deps=["parsed"])
+            graph.add("end", lambda parsed: self._resolve_point(parsed["end_location"], "الوجهة", "الوجهة المحددة"),
+                      deps=["parsed"])
+            graph.add("route", lambda start, end: trip_route(start, end), deps=["start", "end"])
+            graph.add("trip", lambda parsed, route: price_trip(route, parsed["car_type"]),
+                      deps=["parsed", "route"])
+            graph.add("driver", lambda parsed, start: generate_driver_location(start, parsed["car_type"]),
+                      deps=["parsed", "start"])
+            graph.add("map", lambda start, end, driver, route: self._create_map(start, end, driver, route),
+                      deps=["start", "end", "driver", "route"])
             
-            locations = check_saved_locations(query)
-            if "error" in locations:
-                return f"❌ خطأ في معالجة المواقع: {locations['error']}"
-
-            # تخزين القيم المؤقتة
-            start_name_temp = locations["start_location"]
-            end_name_temp = locations["end_location"]
-            country = locations["country"]
-
-            if not start_name_temp or not end_name_temp:
-                return "❌ لم يتم تحديد نقطة البداية أو الوجهة بشكل صحيح. يرجى إعادة المحاولة بوضوح أكثر."
-
-            print(f"[DEBUG] معالجة البداية: {start_name_temp}")
-            print(f"[DEBUG] معالجة النهاية: {end_name_temp}")
-
-            # معالجة نقطة البداية
-            if is_latlng(start_name_temp):
-                print(f"[DEBUG] البداية عبارة عن إحداثيات: {start_name_temp}")
-                start_lat_temp, start_lng_temp = parse_latlng(start_name_temp)
-                # استخدام اسم عام للعرض
-                start_display_name = get_location_name_from_coordinates(start_name_temp)
-                if start_display_name == start_name_temp:  # إذا لم نجد اسم مطابق
-                    start_display_name = "الموقع المحدد"
-            else:
-                print(f"[DEBUG] البداية عبارة عن عنوان: {start_name_temp}")
-                start_lat_temp, start_lng_temp = resolve_address_to_coordinates(start_name_temp)
-                start_display_name = start_name_temp
-                
-            # التحقق من صحة إحداثيات البداية
-            if start_lat_temp is None or start_lng_temp is None:
-                return f"❌ عذراً، لم أتمكن من العثور على موقع البداية: '{start_name_temp}'. يرجى التأكد من صحة اسم المكان."
-
-            # معالجة نقطة النهاية
-            if is_latlng(end_name_temp):
-                print(f"[DEBUG] النهاية عبارة عن إحداثيات: {end_name_temp}")
-                end_lat_temp, end_lng_temp = parse_latlng(end_name_temp)
-                # استخدام اسم عام للعرض
-                end_display_name = get_location_name_from_coordinates(end_name_temp)
-                if end_display_name == end_name_temp:  # إذا لم نجد اسم مطابق
-                    end_display_name = "الوجهة المحددة"
-            else:
-                print(f"[DEBUG] النهاية عبارة عن عنوان: {end_name_temp}")
-                end_lat_temp, end_lng_temp = resolve_address_to_coordinates(end_name_temp)
-                end_display_name = end_name_temp
-                
-            # التحقق من صحة إحداثيات النهاية
-            if end_lat_temp is None or end_lng_temp is None:
-                return f"❌ عذراً، لم أتمكن من العثور على موقع الوجهة: '{end_name_temp}'. يرجى التأكد من صحة اسم المكان."
-        
-            # إنشاء كائنات Location بعد التأكد من القيم
-            start_loc = Location(name=start_display_name, lat=start_lat_temp, lng=start_lng_temp)
-            end_loc = Location(name=end_display_name, lat=end_lat_temp, lng=end_lng_temp)
+            try:
+                results = graph.run()
+            except StageError as e:
+                return str(e)
+            finally:
+                print(f"[DEBUG] أزمنة المراحل: {graph.format_timings()}")
+
+            car_type = results["parsed"]["car_type"]
+            start_loc = results["start"]
+            end_loc = results["end"]
+            route = results["route"]
+            trip = results["trip"]
+            driver = results["driver"]
+            map_file = results["map"]
+            map_info = f"🗺️ تم إنشاء خريطة الرحلة: {map_file}" if map_file else ""
 
             print(f"[DEBUG] start_loc = {start_loc}")
             print(f"[DEBUG] end_loc = {end_loc}")
-            print(f"[DEBUG] Passing car_type to compute_trip: '{car_type}'")
+            print(f"[DEBUG] trip object = {trip}")
+            print(f"[DEBUG] driver = {driver}")
 
             # حفظ بيانات الرحلة للمشاركة مع أدوات أخرى
-            set_shared_trip_data(start_loc, end_loc, car_type)
+            set_shared_trip_data(start_loc, end_loc, car_type, route=route, driver=driver, map_file=map_file,
+                                 user_id=self.user_id)
             print(f"[DEBUG] تم حفظ بيانات الرحلة المشتركة")
 
-            # حساب تفاصيل الرحلة مع نوع السيارة المحدد
-            trip = compute_trip(start_loc, end_loc, car_type)
-
-            print(f"[DEBUG] trip object = {trip}")
-            print(f"[DEBUG] trip.cost = {trip.cost}")
-            print(f"[DEBUG] trip.car_type = {trip.car_type}")
-
             # إنشاء كائن TripInfo وتعيين القيم من trip
             trip_info = TripInfo(
                 distance=trip.distance,
@@ -128,31 +208,6 @@ class GetDirectionsTool(BaseTool):
                 car_type=car_type
             )
             print(f"[DEBUG] trip_info = {trip_info}")
-            
-            # توليد بيانات السائق مع نوع السيارة
-            driver = generate_driver_location(start_loc, car_type)
-            print(f"[DEBUG] driver = {driver}")
-            
-            # رسم الخريطة
-            map_info = ""
-            try:
-                map_filename = create_trip_map(
-                    user_location={"lat": start_loc.lat, "lng": start_loc.lng},
-                    driver_location={
-                        "lat": driver['lat'], 
-                        "lng": driver['lng'],
-                        "distance_m": driver['distance_m'],
-                        "arrival_time_min": driver['arrival_time_min'],
-                        "car_type": car_type
-                    },
-                    destination_location={"lat": end_loc.lat, "lng": end_loc.lng},  
-                    user_name="انس",
-                    driver_name="ابو ثائر"
-                )
-                print(f"DEBUG: تم إنشاء خريطة: {map_filename}")
-                map_info = f"🗺️ تم إنشاء خريطة الرحلة: {map_filename}"
-            except Exception as e:
-                print(f"DEBUG: خطأ في إنشاء الخريطة: {e}")
 
             # بناء الاستجابة المنسقة مع الإيقونات والتنسيق الصحيح
             response_lines = [
@@ -166,16 +221,10 @@ class GetDirectionsTool(BaseTool):
                 f"🚘 نوع السيارة: {trip_info.car_type}"
             ]
             
-            # إضافة ملاحظة السعر حسب نوع السيارة
-            price_notes = {
-                "عادية": "",
-                "تاكسي": "📝 ملاحظة: (زيادة 15% للتاكسي)",
-                "عائلية": "📝 ملاحظة: (زيادة 30% للسيارة العائلية)",
-                "VIP": "📝 ملاحظة: (زيادة 50% للسيارة المميزة)"
-            }
-            
-            if car_type in price_notes and price_notes[car_type]:
-                response_lines.append(price_notes[car_type])
+            # إضافة ملاحظة السعر حسب نوع السيارة (من جدول التعرفة)
+            price_note = get_fare_engine().note(car_type)
+            if price_note:
+                response_lines.append(price_note)
             
             # إضافة معلومات الخريطة إذا توفرت
             if map_info:
@@ -1,14 +1,16 @@
 from langchain.tools import BaseTool
-from langchain_openai import ChatOpenAI
 from typing import Optional
 import json
-import os
-from jeeny_agent.routing import compute_trip
+from jeeny_agent.routing import trip_route, price_trip
+from jeeny_agent.fares import get_fare_engine
 from jeeny_agent.driver import generate_driver_location
 from jeeny_agent.mapping import create_trip_map
 from jeeny_agent.models import Location, TripInfo
-from jeeny_agent.nlu import check_saved_locations
+from jeeny_agent.nlu import resolve_saved_place, get_saved_locations
+from jeeny_agent.rule_extractor import detect_modification_rules, RULE_CONFIDENCE_THRESHOLD
 from jeeny_agent.geocoding import resolve_address_to_coordinates
+from jeeny_agent.llm_gateway import get_llm
+from jeeny_agent.service_area import is_in_service_area
 from jeeny_agent.nlu import is_latlng, parse_latlng, get_location_name_from_coordinates
 from dotenv import load_dotenv
 import re
@@ -23,37 +25,46 @@ class ModifyLocationTool(BaseTool):
     
     # إضافة model_config للسماح بـ arbitrary attributes في Pydantic v2
     model_config = {"arbitrary_types_allowed": True, "extra": "allow"}
+    # معرف المستخدم لاستخدام أماكنه المحفوظة (None = ملف saved_locations.json العام)
+    user_id: Optional[str] = None
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         load_dotenv()
         # استخدام object.__setattr__ لتجنب مشكلة Pydantic
-        object.__setattr__(self, '_llm', None)
         object.__setattr__(self, 'last_trip_data', None)
         
     @property
     def llm(self):
-        """Lazy loading للـ LLM"""
-        if self._llm is None:
-            object.__setattr__(self, '_llm', ChatOpenAI(
-                model="gpt-4o-mini",
-                temperature=0, 
-                openai_api_key=os.getenv("OPENAI_API_KEY")
-            ))
-        return self._llm
+        """النموذج المشترك من الـ gateway (اتصالات ومهلة وإعادة محاولة موحدة)"""
+        return get_llm("nlu")
 
-    def set_last_trip(self, start_loc: Location, end_loc: Location, car_type: str):
+    def set_last_trip(self, start_loc: Location, end_loc: Location, car_type: str,
+                      route: Optional[dict] = None, driver: Optional[dict] = None, map_file: Optional[str] = None):
         """حفظ بيانات الرحلة الأخيرة"""
         object.__setattr__(self, 'last_trip_data', {
             "start_location": start_loc,
             "end_location": end_loc,
-            "car_type": car_type
+            "car_type": car_type,
+            "route": route,
+            "driver": driver,
+            "map_file": map_file
         })
         print(f"[DEBUG] تم حفظ بيانات الرحلة الأخيرة للتعديل: {car_type}")
         
     def _detect_modification_type_and_location(self, query: str) -> dict:
         """تحديد نوع التعديل (بداية/نهاية) والموقع الجديد"""
         
+        # المسار السريع: القوالب المعروفة لا تحتاج النموذج
+        rules = detect_modification_rules(query, get_saved_locations(self.user_id).keys())
+        if rules["confidence"] >= RULE_CONFIDENCE_THRESHOLD:
+            print(f"[DEBUG] تحليل التعديل بالقواعد (ثقة {rules['confidence']}): {rules}")
+            return {
+                "modification_type": rules["modification_type"],
+                "new_start_location": rules["new_start_location"],
+                "new_end_location": rules["new_end_location"]
+            }
+        
         prompt = f"""
         المستخدم يريد تعديل رحلته الحالية: "{query}"
         
@@ -191,29 +202,32 @@ class ModifyLocationTool(BaseTool):
         
         print(f"[DEBUG] محاولة تحويل الموقع: {location_name}")
         
-        # استخدام نفس آلية معالجة المواقع المستخدمة في get_directions_tool
-        # التحقق من المواقع المحفوظة أولاً
-        saved_check = check_saved_locations(f"من هنا الى {location_name}")
-        resolved_location = saved_check.get("end_location")
+        # التحقق من المواقع المحفوظة أولاً (الاسم جاهز فلا حاجة لاستخراجه من جملة)
+        resolved_location = resolve_saved_place(location_name, self.user_id)
         
         if is_latlng(resolved_location):
             lat, lng = parse_latlng(resolved_location)
-            display_name = get_location_name_from_coordinates(resolved_location)
-            if display_name == resolved_location:
-                display_name = location_name
-            return Location(name=display_name, lat=lat, lng=lng)
+            display_name = None
         else:
             # استخدام geocoding للعناوين العادية
-            resolved_name = resolved_location or location_name
-            print(f"[DEBUG] البحث عن إحداثيات: {resolved_name}")
-            lat, lng = resolve_address_to_coordinates(resolved_name)
-            if lat is not None and lng is not None:
-                print(f"[DEBUG] تم العثور على إحداثيات: {lat}, {lng}")
-                return Location(name=resolved_name, lat=lat, lng=lng)
-            else:
-                print(f"[DEBUG] فشل في العثور على إحداثيات لـ: {resolved_name}")
+            display_name = resolved_location or location_name
+            print(f"[DEBUG] البحث عن إحداثيات: {display_name}")
+            lat, lng = resolve_address_to_coordinates(display_name)
+            if lat is None or lng is None:
+                print(f"[DEBUG] فشل في العثور على إحداثيات لـ: {display_name}")
+                return None
+            print(f"[DEBUG] تم العثور على إحداثيات: {lat}, {lng}")
         
-        return None
+        # كل موقع محلول - محفوظ أو من الـ geocoding - يجب أن يكون داخل منطقة الخدمة
+        if not is_in_service_area(lat, lng):
+            print(f"[DEBUG] الموقع خارج منطقة الخدمة: {lat}, {lng}")
+            return None
+        
+        if display_name is None:
+            display_name = get_location_name_from_coordinates(resolved_location, self.user_id)
+            if display_name == resolved_location:
+                display_name = location_name
+        return Location(name=display_name, lat=lat, lng=lng)
 
     def _run(self, query: str) -> str:
         try:
@@ -225,9 +239,25 @@ class ModifyLocationTool(BaseTool):
             
             # تحليل طلب التعديل
             modification_info = self._detect_modification_type_and_location(query)
-            mod_type = modification_info.get("modification_type")
-            new_start_name = modification_info.get("new_start_location")
-            new_end_name = modification_info.get("new_end_location")
+        except Exception as e:
+            print(f"[خطأ في تعديل الموقع] {str(e)}")
+            return f"❌ عذراً، حدث خطأ أثناء تعديل الرحلة: {str(e)}"
+        return self.apply_modification(
+            modification_info.get("modification_type"),
+            modification_info.get("new_start_location"),
+            modification_info.get("new_end_location")
+        )
+
+    def apply_modification(self, modification_type: str, new_start_location: Optional[str] = None,
+                           new_end_location: Optional[str] = None) -> str:
+        """تطبيق التعديل على الرحلة المحفوظة - نقطة الدخول في وضع استدعاء الأدوات"""
+        mod_type = modification_type
+        new_start_name = new_start_location
+        new_end_name = new_end_location
+        try:
+            # التحقق من وجود رحلة سابقة
+            if not hasattr(self, 'last_trip_data') or not self.last_trip_data:
+                return "❌ لا توجد رحلة محفوظة للتعديل. يرجى طلب رحلة جديدة أولاً."
             
             print(f"[DEBUG] نوع التعديل: {mod_type}")
             print(f"[DEBUG] البداية الجديدة: {new_start_name}")
@@ -279,7 +309,8 @@ class ModifyLocationTool(BaseTool):
             print(f"[DEBUG] الرحلة النهائية: من {final_start_loc.name} إلى {final_end_loc.name}")
             
             # إعادة حساب تفاصيل الرحلة مع الاحتفاظ بنوع السيارة الأصلي
-            trip = compute_trip(final_start_loc, final_end_loc, car_type)
+            route = trip_route(final_start_loc, final_end_loc)
+            trip = price_trip(route, car_type)
             
             # إنشاء معلومات الرحلة المحدثة
             trip_info = TripInfo(
@@ -296,7 +327,10 @@ class ModifyLocationTool(BaseTool):
             object.__setattr__(self, 'last_trip_data', {
                 "start_location": final_start_loc,
                 "end_location": final_end_loc,
-                "car_type": car_type
+                "car_type": car_type,
+                "route": route,
+                "driver": driver,
+                "map_file": None
             })
             
             # رسم الخريطة المحدثة
@@ -304,21 +338,22 @@ class ModifyLocationTool(BaseTool):
             try:
                 map_filename = create_trip_map(
                     user_location={"lat": final_start_loc.lat, "lng": final_start_loc.lng},
-                    driver_location={
-                        "lat": driver['lat'], 
-                        "lng": driver['lng'],
-                        "distance_m": driver['distance_m'],
-                        "arrival_time_min": driver['arrival_time_min'],
-                        "car_type": car_type
-                    },
+                    driver_location=driver,
                     destination_location={"lat": final_end_loc.lat, "lng": final_end_loc.lng},  
                     user_name="انس",
-                    driver_name="ابو ثائر"
+                    driver_name="ابو ثائر",
+                    trip_route=route
                 )
                 map_info = f"🗺️ تم إنشاء خريطة محدثة: {map_filename}"
+                self.last_trip_data["map_file"] = map_filename
             except Exception as e:
                 print(f"DEBUG: خطأ في إنشاء الخريطة: {e}")
             
+            # الجلسة المشتركة تحمل الآن مسار الرحلة المعدلة حتى يُعاد تسعيرها عند تغيير نوع السيارة
+            from tools.get_directions_tool import set_shared_trip_data
+            set_shared_trip_data(final_start_loc, final_end_loc, car_type, route=route, driver=driver,
+                                 map_file=self.last_trip_data["map_file"], user_id=self.user_id)
+            
             # بناء الاستجابة
             response_lines = [
                 "✅ تم تعديل الرحلة بنجاح!",
@@ -341,16 +376,10 @@ class ModifyLocationTool(BaseTool):
                 f"🚘 نوع السيارة: {trip_info.car_type}"
             ])
             
-            # إضافة ملاحظة السعر حسب نوع السيارة
-            price_notes = {
-                "عادية": "",
-                "تاكسي": "📝 ملاحظة: (زيادة 15% للتاكسي)",
-                "عائلية": "📝 ملاحظة: (زيادة 30% للسيارة العائلية)",
-                "VIP": "📝ملاحظة: (زيادة 50% للسيارة المميزة)"
-            }
-            
-            if car_type in price_notes and price_notes[car_type]:
-                response_lines.append(price_notes[car_type])
+            # إضافة ملاحظة السعر حسب نوع السيارة (من جدول التعرفة)
+            price_note = get_fare_engine().note(car_type)
+            if price_note:
+                response_lines.append(price_note)
             
             # إضافة معلومات الخريطة
             if map_info:
@@ -364,4 +393,4 @@ class ModifyLocationTool(BaseTool):
             return f"❌ عذراً، حدث خطأ أثناء تعديل الرحلة: {str(e)}"
     
     async def _arun(self, query: str) -> str:
-        return self._run(query)
\ No newline at end of file
+        return self._run(query)
\ No newline at end of file
@@ -3,89 +3,165 @@ import os
 import sys
 from typing import List, Tuple, Optional
 import time
+import queue
+import threading
 
 # إضافة مسار المشروع للاستيرادات
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # استيراد الأدوات المطلوبة مباشرة
-from langchain.agents import initialize_agent, AgentType
-from langchain_openai import ChatOpenAI 
-from langchain.memory import ConversationBufferMemory
-from tools.get_directions_tool import GetDirectionsTool, get_shared_trip_data, set_shared_trip_data
-from tools.car_type_selector_tool import CarTypeSelectorTool
-from tools.change_car_type_tool import ChangeCarTypeTool
-from tools.modify_location_tool import ModifyLocationTool
+from langchain_core.callbacks import BaseCallbackHandler
 from voice import recognize_speech, speak_arabic_response, test_voice_system
+from jeeny_agent.agent_factory import AGENT_MODE
+from session import ChatSession, DEFAULT_USER_ID, normalize_user_id
 from dotenv import load_dotenv
 
 # تحميل متغيرات البيئة
 load_dotenv()
 
-# إنشاء instances للأدوات للمشاركة بينها
-get_directions_tool = GetDirectionsTool()
-change_car_type_tool = ChangeCarTypeTool()
-modify_location_tool = ModifyLocationTool()
-
-# إعداد الذكاء الاصطناعي والأدوات
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
-agent = initialize_agent(
-    tools=[
-        get_directions_tool,
-        change_car_type_tool,
-        modify_location_tool
-    ],
-    llm=llm,
-    agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-    memory=memory,
-    verbose=True
-)
-
-def sync_trip_data():
-    """مزامنة بيانات الرحلة بين الأدوات - محدثة"""
-    # محاولة الحصول على البيانات من أي أداة تحتوي على آخر رحلة
-    shared_data = None
+def get_session(session: Optional[ChatSession], user_id: Optional[str]) -> ChatSession:
+    """جلسة المتصفح الحالية - تُنشأ عند أول رسالة أو عند تغيير معرف المستخدم
+
+    كل متصفح له أدواته وذاكرته ورحلته (gr.State)، والأماكن المحفوظة حسب معرف المستخدم.
+    """
+    user_id = normalize_user_id(user_id)
+    if session is None or session.user_id != user_id:
+        session = ChatSession(user_id, streaming=True)
+    return session
+
+# رسائل التقدم التي تظهر للمستخدم أثناء عمل كل أداة
+TOOL_PROGRESS_MESSAGES = {
+    "get_directions_arabic": "⏳ جاري حساب المسار...",
+    "change_car_type": "⏳ جاري تغيير نوع السيارة...",
+    "modify_location": "⏳ جاري تعديل الرحلة...",
+}
+
+class StreamingChatHandler(BaseCallbackHandler):
+    """ينقل نص الرد النهائي وتقدم الأدوات إلى طابور أثناء عمل الـ Agent
+
+    وكيل ReAct يكتب "Thought/Action" قبل الرد، لذلك لا نرسل إلا النص الذي يأتي بعد "AI:"
+    أما في وضع استدعاء الأدوات فكل النص المولد هو الرد النهائي
+    """
+
+    FINAL_ANSWER_PREFIX = "AI:" if AGENT_MODE == "react" else ""
+
+    def __init__(self, events: "queue.Queue"):
+        self.events = events
+        self._buffer = ""
+        self._sent = 0
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._buffer = ""
+        self._sent = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._buffer = ""
+        self._sent = 0
+
+    def on_llm_new_token(self, token: str, **kwargs):
+        self._buffer += token
+        marker = self._buffer.find(self.FINAL_ANSWER_PREFIX)
+        if marker == -1:
+            return
+        answer = self._buffer[marker + len(self.FINAL_ANSWER_PREFIX):].lstrip()
+        if len(answer) > self._sent:
+            self.events.put(("token", answer[self._sent:]))
+            self._sent = len(answer)
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        tool_name = (serialized or {}).get("name", "")
+        self.events.put(("progress", TOOL_PROGRESS_MESSAGES.get(tool_name, "⏳ جاري المعالجة...")))
+
+    def on_tool_end(self, output, **kwargs):
+        self.events.put(("progress", ""))
+
+def _latest_map_link(maps_before: set) -> str:
+    """رابط الخريطة الجديدة إن تم إنشاء واحدة أثناء معالجة الطلب"""
+    import glob
+    new_maps = set(glob.glob("maps/trip_map_*.html")) - maps_before
+    if not new_maps:
+        return ""
+    latest_map = max(new_maps, key=os.path.getctime)
+    return f"\n\n🗺️ **[اضغط هنا لعرض الخريطة](file/{latest_map})**"
+
+def process_message_stream(message: str, history: List[Tuple[str, str]], session: Optional[ChatSession] = None,
+                           user_id: Optional[str] = DEFAULT_USER_ID, use_voice: bool = False):
+    """معالجة الرسالة مع عرض الرد جزءاً جزءاً وتقدم الأدوات في المحادثة"""
+    history = history or []
+    if not message.strip():
+        yield "", history, "", session
+        return
+    
+    # أوامر الإنهاء لا تحتاج Streaming
+    if message.strip().lower() in ['انهي', 'انهاء', 'خروج', 'exit', 'quit', 'شكرا لك']:
+        yield process_message(message, history, session, user_id, use_voice)
+        return
     
-    # البحث عن البيانات في الأدوات
-    shared_data = get_shared_trip_data()
+    session = get_session(session, user_id)
     
-    # إذا لم نجد بيانات في get_directions_tool، نحاول الحصول عليها من change_car_type_tool
-    if not shared_data and hasattr(change_car_type_tool, 'last_trip_data') and change_car_type_tool.last_trip_data:
-        shared_data = change_car_type_tool.last_trip_data
-        print("[DEBUG] تم الحصول على البيانات من change_car_type_tool")
+    import glob
+    maps_before = set(glob.glob("maps/trip_map_*.html"))
+    events = queue.Queue()
+    outcome = {}
     
-    # إذا لم نجد بيانات، نحاول الحصول عليها من modify_location_tool
-    if not shared_data and hasattr(modify_location_tool, 'last_trip_data') and modify_location_tool.last_trip_data:
-        shared_data = modify_location_tool.last_trip_data
-        print("[DEBUG] تم الحصول على البيانات من modify_location_tool")
+    def worker():
+        try:
+            intent = session.route(message)
+            if intent is not None:
+                events.put(("progress", TOOL_PROGRESS_MESSAGES.get(intent, "⏳ جاري المعالجة...")))
+                outcome["output"] = session.run_routed_tool(intent, message)
+            else:
+                outcome["output"] = session.agent.invoke(
+                    {"input": message},
+                    config={"callbacks": [StreamingChatHandler(events)]}
+                )["output"]
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            events.put(("done", None))
     
-    if shared_data:
-        # تحديث جميع الأدوات بنفس البيانات
-        change_car_type_tool.set_last_trip(
-            shared_data["start_location"],
-            shared_data["end_location"], 
-            shared_data["car_type"]
-        )
-        
-        modify_location_tool.set_last_trip(
-            shared_data["start_location"],
-            shared_data["end_location"],
-            shared_data["car_type"]
-        )
-        
-        # تحديث البيانات المشتركة العامة
-        set_shared_trip_data(
-            shared_data["start_location"],
-            shared_data["end_location"],
-            shared_data["car_type"]
-        )
-        
-        print(f"[DEBUG] تم مزامنة بيانات الرحلة: {shared_data['car_type']} من {shared_data['start_location'].name} إلى {shared_data['end_location'].name}")
+    threading.Thread(target=worker, daemon=True).start()
+    
+    history.append((message, "⏳"))
+    partial_text = ""
+    progress = ""
+    yield "", history, "⏳ جاري المعالجة...", session
+    
+    while True:
+        kind, value = events.get()
+        if kind == "done":
+            break
+        if kind == "token":
+            partial_text += value
+        elif kind == "progress":
+            progress = value
+        history[-1] = (message, partial_text or progress or "⏳")
+        yield "", history, progress or "⏳ جاري كتابة الرد...", session
+    
+    if "error" in outcome:
+        error = outcome["error"]
+        history[-1] = (message, f"⚠️ عذراً، حدث خطأ: {str(error)}")
+        if use_voice:
+            speak_arabic_response("عذراً، حدث خطأ في النظام")
+        yield "", history, f"حدث خطأ: {str(error)}", session
+        return
+    
+    response_text = outcome["output"]
+    
+    # مزامنة بيانات الرحلة بعد كل استجابة
+    session.sync_trip_data()
+    
+    history[-1] = (message, response_text + _latest_map_link(maps_before))
+    if use_voice:
+        speak_arabic_response(response_text)
+    yield "", history, f"تم معالجة الطلب بنجاح ✅ (حجم الذاكرة: ~{session.memory.last_prompt_tokens} توكن)", session
 
-def process_message(message: str, history: List[Tuple[str, str]], use_voice: bool = False) -> Tuple[str, List[Tuple[str, str]], str]:
+def process_message(message: str, history: List[Tuple[str, str]], session: Optional[ChatSession] = None,
+                    user_id: Optional[str] = DEFAULT_USER_ID,
+                    use_voice: bool = False) -> Tuple[str, List[Tuple[str, str]], str, ChatSession]:
     """معالجة الرسائل مع دعم الصوت الاختياري"""
     if not message.strip():
-        return "", history or [], ""
+        return "", history or [], "", session
     
     # التحقق من أمر الإنهاء
     if message.strip().lower() in ['انهي', 'انهاء', 'خروج', 'exit', 'quit', 'شكرا لك']:
@@ -94,19 +170,19 @@ def process_message(message: str, history: List[Tuple[str, str]], use_voice: boo
         history.append((message, goodbye_msg))
         if use_voice:
             speak_arabic_response(goodbye_msg)
-        return "", history, "تم إنهاء المحادثة"
+        return "", history, "تم إنهاء المحادثة", session
     
+    session = get_session(session, user_id)
     try:
         # تتبع الخرائط الموجودة قبل المعالجة
         import glob
         maps_before = set(glob.glob("maps/trip_map_*.html"))
         
         # معالجة الطلب مع Agent
-        response = agent.invoke({"input": message})
-        response_text = response["output"]
+        response_text = session.run_turn(message)
         
         # مزامنة بيانات الرحلة بعد كل استجابة
-        sync_trip_data()
+        session.sync_trip_data()
         
         # التحقق من إنشاء خريطة جديدة فقط
         maps_after = set(glob.glob("maps/trip_map_*.html"))
@@ -137,9 +213,10 @@ def process_message(message: str, history: List[Tuple[str, str]], use_voice: boo
     history = history or []
     history.append((message, final_response))
     
-    return "", history, status
+    return "", history, status, session
 
-def voice_input_handler(history: List[Tuple[str, str]]) -> Tuple[str, List[Tuple[str, str]], str]:
+def voice_input_handler(history: List[Tuple[str, str]], session: Optional[ChatSession] = None,
+                        user_id: Optional[str] = DEFAULT_USER_ID) -> Tuple[str, List[Tuple[str, str]], str, ChatSession]:
     """معالج الإدخال الصوتي"""
     try:
         print("🎙️ بدء التسجيل الصوتي...")
@@ -147,22 +224,22 @@ def voice_input_handler(history: List[Tuple[str, str]]) -> Tuple[str, List[Tuple
         
         if not user_text:
             error_msg = "🎙️ لم أتمكن من فهم الصوت، يرجى المحاولة مرة أخرى"
-            return "", history, error_msg
+            return "", history, error_msg, session
         
         print(f"🎙️ تم التعرف على النص: {user_text}")
         
         # معالجة النص المسجل
-        return process_message(user_text, history, use_voice=True)
+        return process_message(user_text, history, session, user_id, use_voice=True)
         
     except Exception as e:
         error_msg = f"⚠️ خطأ في التسجيل الصوتي: {str(e)}"
-        return "", history, error_msg
+        return "", history, error_msg, session
 
-def clear_chat() -> Tuple[List, str, str]:
-    """مسح المحادثة وإعادة تعيين الذاكرة"""
-    global memory
-    memory.clear()
-    return [], "", "تم مسح المحادثة وإعادة تعيين الذاكرة ✨"
+def clear_chat(session: Optional[ChatSession] = None) -> Tuple[List, str, str, Optional[ChatSession]]:
+    """مسح المحادثة وإعادة تعيين ذاكرة الجلسة"""
+    if session is not None:
+        session.memory.clear()
+    return [], "", "تم مسح المحادثة وإعادة تعيين الذاكرة ✨", session
 
 def get_example_queries() -> List[str]:    
     """أمثلة على الاستعلامات المحدثة"""
@@ -374,6 +451,16 @@ def create_interface():
                     variant="secondary"
                 )
         
+        # معرف المستخدم لأماكنه المحفوظة، وجلسة هذا المتصفح (أدوات وذاكرة ورحلة)
+        with gr.Row():
+            user_id_box = gr.Textbox(
+                label="👤 معرف المستخدم",
+                value=DEFAULT_USER_ID or "",
+                placeholder="اتركه فارغاً لاستخدام الأماكن المحفوظة العامة",
+                rtl=True
+            )
+        session_state = gr.State(None)
+        
         # رسالة الحالة
         status_msg = gr.Textbox(
             show_label=False,
@@ -454,28 +541,28 @@ def create_interface():
                 """)
         
         # ربط الأحداث
-        # الإرسال النصي
+        # الإرسال النصي - مع عرض الرد أثناء كتابته
         msg.submit(
-            lambda m, h: process_message(m, h, use_voice=False), 
-            inputs=[msg, chatbot], 
-            outputs=[msg, chatbot, status_msg]
+            process_message_stream, 
+            inputs=[msg, chatbot, session_state, user_id_box], 
+            outputs=[msg, chatbot, status_msg, session_state]
         )
         
         send_btn.click(
-            lambda m, h: process_message(m, h, use_voice=False), 
-            inputs=[msg, chatbot], 
-            outputs=[msg, chatbot, status_msg]
+            process_message_stream, 
+            inputs=[msg, chatbot, session_state, user_id_box], 
+            outputs=[msg, chatbot, status_msg, session_state]
         )
         
         # الإدخال الصوتي
         voice_btn.click(
             voice_input_handler, 
-            inputs=[chatbot], 
-            outputs=[msg, chatbot, status_msg]
+            inputs=[chatbot, session_state, user_id_box], 
+            outputs=[msg, chatbot, status_msg, session_state]
         )
         
         # مسح المحادثة
-        clear_btn.click(clear_chat, outputs=[chatbot, msg, status_msg])
+        clear_btn.click(clear_chat, inputs=[session_state], outputs=[chatbot, msg, status_msg, session_state])
         
         return demo
 